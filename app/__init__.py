@@ -1,3 +1,4 @@
+import logging
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -38,6 +39,19 @@ def create_app():
     app.config["MAIL_PASSWORD"] = os.getenv("MAIL_PASSWORD")
     app.config["MAIL_DEFAULT_SENDER"] = os.getenv("MAIL_DEFAULT_SENDER")
 
+    # ✅ structured logs حق المراحل (app.metrics): JSON خام سطر لكل مرحلة
+    if app.config.get("METRICS_LOG"):
+        metrics_log = logging.getLogger("tayaqan.metrics")
+        if not metrics_log.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            metrics_log.addHandler(handler)
+            metrics_log.setLevel(logging.INFO)
+            metrics_log.propagate = False
+
+    from app.metrics import set_shared_dir
+    set_shared_dir(app.config.get("METRICS_DIR"))
+
     # تفعيل الإضافات
     db.init_app(app)
     mail.init_app(app)
@@ -52,5 +66,11 @@ def create_app():
     # ✅ إنشاء الجداول
     with app.app_context():
         db.create_all()
+        # أعمدة/indexes جديدة على جداول موجودة: python -m app.migrations (مرة وحدة مع كل deploy)
+
+        # ✅ Quran index مرة وحدة عند التشغيل (بدل queries لكل طلب)
+        if app.config.get("QURAN_INDEX_PRELOAD"):
+            from app.quran_index import get_quran_index
+            get_quran_index()
 
     return app
\ No newline at end of file
@@ -0,0 +1,322 @@
+from app.arabic import normalize_tokens
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+DEFAULT_BAND = 64          # عرض البداية للـ band حول القطر (يتضاعف لو ما كفى)
+BASE_CELLS = 1 << 14       # أي sub-problem أصغر من كذا نحله full DP مباشرة
+
+_INF = 1 << 60
+
+
+# ----------------------------
+# Full DP (الطريقة القديمة - exact)
+# ----------------------------
+def levenshtein_ops_full(ref_words, hyp_words):
+    n, m = len(ref_words), len(hyp_words)
+    dp = [[0]*(m+1) for _ in range(n+1)]
+    bt = [[None]*(m+1) for _ in range(n+1)]
+
+    for i in range(1, n+1):
+        dp[i][0] = i
+        bt[i][0] = ("delete", i-1, None)
+    for j in range(1, m+1):
+        dp[0][j] = j
+        bt[0][j] = ("insert", None, j-1)
+
+    for i in range(1, n+1):
+        for j in range(1, m+1):
+            if ref_words[i-1] == hyp_words[j-1]:
+                dp[i][j] = dp[i-1][j-1]
+                bt[i][j] = ("equal", i-1, j-1)
+            else:
+                choices = [
+                    (dp[i-1][j] + 1, ("delete", i-1, None)),
+                    (dp[i][j-1] + 1, ("insert", None, j-1)),
+                    (dp[i-1][j-1] + 1, ("replace", i-1, j-1)),
+                ]
+                dp[i][j], bt[i][j] = min(choices, key=lambda x: x[0])
+
+    ops = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        kind, ri, hj = bt[i][j]
+        ops.append((kind, ri, hj))
+        if kind in ("equal", "replace"):
+            i -= 1
+            j -= 1
+        elif kind == "delete":
+            i -= 1
+        else:  # insert
+            j -= 1
+    ops.reverse()
+    return ops
+
+
+# ----------------------------
+# Banded + Hirschberg (ذاكرة O(n+m))
+# ----------------------------
+def _last_row(a, b, lo, hi):
+    """
+    آخر صف من DP لـ a (صفوف) مقابل b (أعمدة) بصفّين فقط.
+    الخلايا المسموحة: lo <= j - i <= hi (والباقي _INF).
+    كل صف يحفظ بس خلايا الـ band: k = j - (i + lo) -> الوقت O(n * band) مو O(n * m).
+    يرجع الصف الأخير كامل (m + 1).
+    """
+    m = len(b)
+    width = hi - lo + 1
+    inf = _INF
+    # خانة زيادة في الآخر = _INF: prev[k+1] و cur[k-1] (k = 0 -> cur[-1]) بدون شروط حدود
+    prev = [j if 0 <= j <= m else inf for j in range(lo, hi + 1)] + [inf]
+
+    for i in range(1, len(a) + 1):
+        x = a[i-1]
+        base = i + lo                    # j حق k = 0
+        cur = [inf] * (width + 1)
+        klo = max(0, -base)
+        khi = min(width - 1, m - base)
+        if klo <= khi and base + klo == 0:
+            cur[klo] = i
+            klo += 1
+        # prev[k] = (i-1, j-1)، prev[k+1] = (i-1, j)، cur[k-1] = (i, j-1)
+        for k, y in enumerate(b[base + klo - 1:base + khi], klo):
+            if x == y:
+                cur[k] = prev[k]
+            else:
+                v = prev[k]
+                u = prev[k+1]
+                if u < v:
+                    v = u
+                u = cur[k-1]
+                if u < v:
+                    v = u
+                cur[k] = v + 1
+        prev = cur
+
+    row = [inf] * (m + 1)
+    base = len(a) + lo
+    for k in range(max(0, -base), min(width, m - base + 1)):
+        row[base + k] = prev[k]
+    return row
+
+
+def _shift_ops(ops, i0, j0):
+    out = []
+    for kind, ri, hj in ops:
+        out.append((
+            kind,
+            None if ri is None else ri + i0,
+            None if hj is None else hj + j0,
+        ))
+    return out
+
+
+def _hirschberg(ref, hyp, i0, i1, j0, j1, lo, hi, ops, cost=_INF):
+    n, m = i1 - i0, j1 - j0
+
+    if n == 0:
+        ops.extend(("insert", None, j) for j in range(j0, j1))
+        return
+    if m == 0:
+        ops.extend(("delete", i, None) for i in range(i0, i1))
+        return
+    if n == 1 or n * m <= BASE_CELLS:
+        ops.extend(_shift_ops(levenshtein_ops_full(ref[i0:i1], hyp[j0:j1]), i0, j0))
+        return
+
+    mid = (i0 + i1) // 2
+    b = hyp[j0:j1]
+
+    # المسار الأمثل (cost) ما يبعد عن قطر البداية ولا قطر النهاية أكثر من cost
+    # -> الـ band يضيق كل ما نزلنا (الـ cost يتقسم بين النصين)
+    d0, d1 = j0 - i0, j1 - i1
+    lo = max(lo, max(d0, d1) - cost)
+    hi = min(hi, min(d0, d1) + cost)
+
+    # forward: من (i0, j0) لين صف mid
+    fwd = _last_row(ref[i0:mid], b, lo - d0, hi - d0)
+
+    # backward: من (i1, j1) رجوعًا لين صف mid (على النص المقلوب)
+    bwd = _last_row(ref[mid:i1][::-1], b[::-1], d1 - hi, d1 - lo)
+
+    best_k, best = 0, _INF
+    for k in range(m + 1):
+        total = fwd[k] + bwd[m - k]
+        if total < best:
+            best, best_k = total, k
+
+    _hirschberg(ref, hyp, i0, mid, j0, j0 + best_k, lo, hi, ops, fwd[best_k])
+    _hirschberg(ref, hyp, mid, i1, j0 + best_k, j1, lo, hi, ops, bwd[m - best_k])
+
+
+def levenshtein_ops(ref_words, hyp_words, exact=False, band=DEFAULT_BAND):
+    """
+    نفس op stream حق levenshtein_ops القديمة: [(kind, ref_index, hyp_index), ...]
+    kind: equal / replace / delete / insert
+
+    - exact=True: full DP القديم (نفس النتيجة حرفيًا، ذاكرة O(n*m))
+    - غير كذا: band قطري حول j-i يتوسع (x2) لين cost <= 2*band + |n-m|
+      (وقتها المسار الأمثل مضمون داخله) + Hirschberg للـ backtracking.
+      الذاكرة O(n+m) والوقت O(n*band)، والـ cost نفس full DP
+      (لو فيه أكثر من مسار أمثل ممكن يختار واحد ثاني).
+    """
+    if exact:
+        return levenshtein_ops_full(ref_words, hyp_words)
+
+    ref, hyp = list(ref_words), list(hyp_words)
+    n, m = len(ref), len(hyp)
+
+    # prefix / suffix متطابقة: equal مباشرة بدون DP
+    p = 0
+    while p < n and p < m and ref[p] == hyp[p]:
+        p += 1
+    s = 0
+    while s < n - p and s < m - p and ref[n-1-s] == hyp[m-1-s]:
+        s += 1
+
+    ops = [("equal", k, k) for k in range(p)]
+
+    i1, j1 = n - s, m - s
+    d = (j1 - p) - (i1 - p)
+    w = max(1, int(band))
+    while True:
+        lo, hi = min(0, d) - w, max(0, d) + w
+        cost = _last_row(ref[p:i1], hyp[p:j1], lo, hi)[-1]
+        if cost <= 2 * w + abs(d) or w >= max(i1 - p, j1 - p):
+            break
+        w *= 2
+
+    _hirschberg(ref, hyp, p, i1, p, j1, lo, hi, ops, cost)
+
+    ops.extend(("equal", i1 + k, j1 + k) for k in range(s))
+    return ops
+
+
+def edit_distance(a: str, b: str) -> int:
+    a, b = a or "", b or ""
+    n, m = len(a), len(b)
+    dp = list(range(m+1))
+    for i in range(1, n+1):
+        prev = dp[0]
+        dp[0] = i
+        for j in range(1, m+1):
+            cur = dp[j]
+            cost = 0 if a[i-1] == b[j-1] else 1
+            dp[j] = min(dp[j] + 1, dp[j-1] + 1, prev + cost)
+            prev = cur
+    return dp[m]
+
+
+# ----------------------------
+# Build report (with ayah_number + indexes)
+# ----------------------------
+def words_to_tokens(whisper_words_with_time):
+    """whisper words [{"word", "start"}] -> (hyp_tokens, hyp_times) متوافقة مع normalize/tokenize."""
+    hyp_tokens = []
+    hyp_times = []
+
+    words = [w["word"] for w in whisper_words_with_time]
+    for w, toks in zip(whisper_words_with_time, normalize_tokens(words)):
+        for t in toks:
+            hyp_tokens.append(t)
+            hyp_times.append(w["start"])
+    return hyp_tokens, hyp_times
+
+
+def ops_to_rows(ops, ref_tokens, ref_to_ayah, hyp_tokens, hyp_times):
+    """ops (بفهارس على ref/hyp كاملين) -> report rows + counts."""
+    def hyp_time(idx):
+        if idx is None:
+            return None
+        if idx < 0 or idx >= len(hyp_times):
+            return None
+        return hyp_times[idx]
+
+    def ayah_of_ref(ri):
+        if ri is None:
+            return None
+        if ri < 0 or ri >= len(ref_to_ayah):
+            return None
+        return ref_to_ayah[ri]
+
+    rows = []
+    correct = add = delete = sub = 0
+
+    for kind, ri, hj in ops:
+        if kind == "equal":
+            correct += 1
+            rows.append({
+                "status": "correct",
+                "type": None,
+                "expected": ref_tokens[ri],
+                "actual": hyp_tokens[hj],
+                "time": hyp_time(hj),
+                "ayah_number": ayah_of_ref(ri),
+                "ref_index": ri,
+                "hyp_index": hj
+            })
+
+        elif kind == "insert":
+            add += 1
+            # insertion ما لها آية مؤكدة، نخليها None
+            rows.append({
+                "status": "error",
+                "type": "addition",
+                "expected": None,
+                "actual": hyp_tokens[hj],
+                "time": hyp_time(hj),
+                "ayah_number": None,
+                "ref_index": ri,
+                "hyp_index": hj
+            })
+
+        elif kind == "delete":
+            delete += 1
+            # وقت الحذف: أقرب كلمة قبلها في hyp (إن وجدت)
+            anchor_time = hyp_time(hj-1) if hj is not None else None
+            rows.append({
+                "status": "error",
+                "type": "deletion",
+                "expected": ref_tokens[ri],
+                "actual": None,
+                "time": anchor_time,
+                "ayah_number": ayah_of_ref(ri),
+                "ref_index": ri,
+                "hyp_index": hj
+            })
+
+        elif kind == "replace":
+            sub += 1
+            rows.append({
+                "status": "error",
+                "type": "substitution",
+                "expected": ref_tokens[ri],
+                "actual": hyp_tokens[hj],
+                "time": hyp_time(hj),
+                "ayah_number": ayah_of_ref(ri),
+                "ref_index": ri,
+                "hyp_index": hj
+            })
+
+    counts = {"correct": correct, "addition": add, "deletion": delete, "substitution": sub}
+    return rows, counts
+
+
+def build_report(ref_tokens, ref_to_ayah, whisper_words_with_time, exact=False):
+    hyp_tokens, hyp_times = words_to_tokens(whisper_words_with_time)
+    ops = levenshtein_ops(ref_tokens, hyp_tokens, exact=exact)
+    rows, c = ops_to_rows(ops, ref_tokens, ref_to_ayah, hyp_tokens, hyp_times)
+    errors = c["addition"] + c["deletion"] + c["substitution"]
+
+    return {
+        "summary": {
+            "total_words": len(ref_tokens),
+            "correct": c["correct"],
+            "addition": c["addition"],
+            "deletion": c["deletion"],
+            "substitution": c["substitution"],
+            "is_valid": errors == 0
+        },
+        "rows": rows
+    }
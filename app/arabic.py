@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+
+# ----------------------------
+# Normalization (خفيف - لا نخفي أخطاء مثل طغى/طغ)
+# جدول str.translate واحد لكل profile (مرة وحدة عند الـ import) بدل سلسلة replace/re.sub
+#   strict : إزالة التشكيل + التطويل، توحيد الهمزات (أ إ آ -> ا) فقط
+#            لا نحول ى→ي ولا ة→ه حتى لا نضيع أخطاء حقيقية (المقارنة + تحديد السورة)
+#   lenient: strict + ى→ي، ة→ه، ؤ→و، ئ→ي (للتشابه التقريبي مثل asr_align.py)
+# ----------------------------
+STRICT = "strict"
+LENIENT = "lenient"
+
+WORD_CACHE_SIZE = 1 << 17        # أكبر من عدد الكلمات المختلفة في المصحف بالتشكيل
+NORMALIZER_VERSION = 1           # زيديه مع أي تعديل يغير الـ tokens (quran_word ينحفظ فيه بالنسخة)
+
+DIACRITICS = "".join(map(chr, (*range(0x0617, 0x061B), *range(0x064B, 0x0653), 0x0670)))
+TATWEEL = "\u0640"
+
+_HAMZA = {"أ": "ا", "إ": "ا", "آ": "ا"}
+_LENIENT = {**_HAMZA, "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"}
+
+
+class _TokenTable(dict):
+    """جدول translate يحوّل أي حرف غير عربي (وغير مسافة) لمسافة -> normalize + tokenize في pass واحد.
+    الحروف تنضاف للجدول أول ما تظهر (__missing__)."""
+
+    def __missing__(self, code):
+        ch = chr(code)
+        value = code if ("\u0600" <= ch <= "\u06FF" or ch.isspace()) else 32
+        self[code] = value
+        return value
+
+
+def _table(mapping):
+    return str.maketrans({**dict.fromkeys(DIACRITICS + TATWEEL), **mapping})
+
+
+PROFILES = {
+    STRICT: _table(_HAMZA),
+    LENIENT: _table(_LENIENT),
+}
+TOKEN_TABLES = {name: _TokenTable(table) for name, table in PROFILES.items()}
+_ARABIC_ONLY = _TokenTable()
+
+
+def normalize_ar(text: str, profile: str = STRICT) -> str:
+    # translate + توحيد المسافات
+    return " ".join((text or "").translate(PROFILES[profile]).split())
+
+
+def tokenize(text: str):
+    # إبقاء العربية + مسافات فقط
+    return text.translate(_ARABIC_ONLY).split()
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def word_tokens(word: str, profile: str = STRICT) -> tuple:
+    """كلمة وحدة (بدون مسافات) -> tokens. memoized: كل كلمة تنحسب مرة وحدة."""
+    return tuple(word.translate(TOKEN_TABLES[profile]).split())
+
+
+def text_tokens(text: str, profile: str = STRICT) -> list:
+    """نفس tokenize(normalize_ar(text, profile)) بس كلمة كلمة من الـ cache."""
+    out = []
+    for w in (text or "").split():
+        out.extend(word_tokens(w, profile))
+    return out
+
+
+def normalize_tokens(words, profile: str = STRICT) -> list:
+    """batch: قائمة كلمات (مثل whisper words) -> tuple tokens لكل كلمة (ممكن تكون فاضية)."""
+    out = []
+    for w in words:
+        parts = (w or "").split()
+        if len(parts) == 1:
+            out.append(word_tokens(parts[0], profile))
+        else:
+            out.append(tuple(t for p in parts for t in word_tokens(p, profile)))
+    return out
@@ -0,0 +1,118 @@
+"""
+Cache للـ transcription على الديسك (content-addressed).
+
+نفس التسجيل يتحقق منه أكثر من مرة (نفس رابط اليوتيوب من أكثر من مستخدم، إعادة رفع بعد فشل...)
+فبدل ما ندفع Whisper كامل كل مرة:
+    key = sha256(PCM float32 المفكوك) + model + compute_type + kwargs (+ batched)
+والقيمة = segments + words + info (JSON). الحجم محدود و LRU (آخر استخدام = mtime).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+CACHE_FORMAT = 1
+
+
+def cache_key(pcm: np.ndarray, model_name: str, compute_type: str, kwargs: dict, batched=False) -> str:
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(pcm, dtype=np.float32).data)
+    params = {
+        "format": CACHE_FORMAT,
+        "model": model_name,
+        "compute_type": compute_type,
+        "kwargs": kwargs,
+        "batched": bool(batched),
+    }
+    h.update(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        # path -> size (نعرف الحجم الكلي بدون ما نمشي على الديسك كل مرة)
+        self._sizes = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".json"):
+                    p = os.path.join(root, name)
+                    self._sizes[p] = os.path.getsize(p)
+        self._total = sum(self._sizes.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str):
+        """يرجع {"segments": [...], "info": {...}} أو None."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # LRU: آخر استخدام
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, segments: list, info: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"segments": segments, "info": info}, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        # كتابة atomic: قارئ ثاني ما يشوف ملف ناقص
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._total += len(data) - self._sizes.get(path, 0)
+            self._sizes[path] = len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # الأقدم استخدامًا أول
+        def mtime(p):
+            try:
+                return os.path.getmtime(p)
+            except OSError:
+                return 0.0
+
+        for p in sorted(self._sizes, key=mtime):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+            self._total -= self._sizes.pop(p)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._sizes),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,206 @@
+import json
+import os
+import socket
+import struct
+from types import SimpleNamespace
+
+import numpy as np
+
+
+# ----------------------------
+# Protocol (Unix socket)
+# كل frame: 4 bytes طول الـ JSON header + header + payload اختياري (payload_bytes)
+#
+# request : {"op": "transcribe", "audio": path | null, "kwargs": {...}, "payload_bytes": n,
+#            "batched": bool}
+#           payload = PCM float32 16kHz mono (لو audio = null)
+#           batched = BatchedInferencePipeline (clip_timestamps/batch_size) بدل transcribe العادي
+# response: frame لكل segment {"segment": {...}} ثم {"done": true, "info": {...}}
+#           أو {"error": "..."}
+#
+# request : {"op": "align", "audio": path | null, "words": [كلمات المرجع]}  (forced alignment)
+# response: {"done": true, "words": [{"word", "start", "end", "score", "index"}]} أو {"error": "..."}
+# ----------------------------
+DEFAULT_SOCKET = "/tmp/tayaqan-asr.sock"
+
+
+def send_frame(sock, header: dict, payload: bytes = b""):
+    header = dict(header, payload_bytes=len(payload))
+    data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(n - len(buf), 1 << 20))
+        if not chunk:
+            raise ConnectionError("ASR worker closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    (size,) = struct.unpack(">I", _recv_exact(sock, 4))
+    header = json.loads(_recv_exact(sock, size).decode("utf-8"))
+    n = header.get("payload_bytes", 0)
+    payload = _recv_exact(sock, n) if n else b""
+    return header, payload
+
+
+def segment_to_dict(s):
+    words = None
+    if getattr(s, "words", None) is not None:
+        words = [
+            {"start": w.start, "end": w.end, "word": w.word, "probability": w.probability}
+            for w in s.words
+        ]
+    return {
+        "id": s.id,
+        "seek": s.seek,
+        "start": s.start,
+        "end": s.end,
+        "text": s.text,
+        "avg_logprob": s.avg_logprob,
+        "no_speech_prob": s.no_speech_prob,
+        "compression_ratio": s.compression_ratio,
+        "temperature": s.temperature,
+        "words": words,
+    }
+
+
+def segment_from_dict(d):
+    # SimpleNamespace: نفس attributes حق Segment/Word (و w.word قابل للتعديل)
+    words = d.get("words")
+    if words is not None:
+        words = [SimpleNamespace(**w) for w in words]
+    return SimpleNamespace(**dict(d, words=words))
+
+
+# ----------------------------
+# Client (الويب ما يستورد faster_whisper أبدًا)
+# ----------------------------
+class AsrClient:
+    """
+    نفس واجهة WhisperModel.transcribe تقريبًا، لكن الموديل محمّل مرة وحدة
+    في asr_worker (process منفصل) وكل الـ jobs تتشاركه.
+    """
+
+    def __init__(self, socket_path: str | None = None, timeout: float | None = None):
+        self.socket_path = socket_path or DEFAULT_SOCKET
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def ping(self) -> bool:
+        try:
+            with self._connect() as sock:
+                send_frame(sock, {"op": "ping"})
+                header, _ = recv_frame(sock)
+                return bool(header.get("ok"))
+        except OSError:
+            return False
+
+    def stats(self) -> dict:
+        """{"cache": hits/misses/evictions أو None, "stages": توقيت مراحل الـ worker (app.metrics)}."""
+        with self._connect() as sock:
+            send_frame(sock, {"op": "stats"})
+            header, _ = recv_frame(sock)
+            return header
+
+    def cache_stats(self):
+        """hits/misses/evictions حق cache الـ worker (None لو مقفل)."""
+        return self.stats().get("cache")
+
+    def models(self) -> list:
+        """أسماء الموديلات المحمّلة في الـ worker (الأول = الافتراضي)."""
+        with self._connect() as sock:
+            send_frame(sock, {"op": "ping"})
+            header, _ = recv_frame(sock)
+            return header.get("models") or [header.get("model")]
+
+    def can_align(self) -> bool:
+        """الـ worker محمّل فيه موديل CTC (--ctc-model)؟"""
+        try:
+            with self._connect() as sock:
+                send_frame(sock, {"op": "ping"})
+                header, _ = recv_frame(sock)
+                return bool(header.get("aligner"))
+        except OSError:
+            return False
+
+    def align(self, audio, words):
+        """forced alignment: audio (مسار أو float32 16kHz) على words (كلمات المرجع بالترتيب)."""
+        header = {"op": "align", "audio": None, "words": list(words)}
+        payload = b""
+        if isinstance(audio, np.ndarray):
+            payload = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        else:
+            header["audio"] = os.path.abspath(audio)
+        with self._connect() as sock:
+            send_frame(sock, header, payload)
+            msg, _ = recv_frame(sock)
+        if "error" in msg:
+            raise RuntimeError(f"ASR worker error: {msg['error']}")
+        return msg["words"]
+
+    def transcribe_iter(self, audio, batched=False, model=None, **kwargs):
+        """
+        audio: مسار ملف أو np.ndarray (float32, 16kHz mono).
+        model: اسم موديل محمّل في الـ worker (None = الافتراضي).
+        يرجع (generator للـ segments, info) — الـ info يتعبى بعد آخر segment.
+        """
+        header = {"op": "transcribe", "kwargs": kwargs, "audio": None, "batched": batched, "model": model}
+        payload = b""
+        if isinstance(audio, np.ndarray):
+            payload = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        else:
+            header["audio"] = os.path.abspath(audio)
+
+        info = SimpleNamespace()
+        sock = self._connect()
+        send_frame(sock, header, payload)
+
+        def segments():
+            try:
+                while True:
+                    msg, _ = recv_frame(sock)
+                    if "error" in msg:
+                        raise RuntimeError(f"ASR worker error: {msg['error']}")
+                    if msg.get("done"):
+                        info.__dict__.update(msg.get("info") or {})
+                        return
+                    yield segment_from_dict(msg["segment"])
+            finally:
+                sock.close()
+
+        return segments(), info
+
+    def transcribe(self, audio, **kwargs):
+        """نفس model.transcribe لكن الـ segments list جاهزة."""
+        segs, info = self.transcribe_iter(audio, **kwargs)
+        return list(segs), info
+
+    def transcribe_batched(self, audio, **kwargs):
+        """نفس BatchedInferencePipeline.transcribe (clip_timestamps, batch_size ...)."""
+        segs, info = self.transcribe_iter(audio, batched=True, **kwargs)
+        return list(segs), info
+
+
+def get_asr(socket_path: str | None = None, model_name="medium", device="cpu", compute_type="int8"):
+    """
+    للـ scripts: لو asr_worker شغال نستخدمه (موديل دافي ومشترك)،
+    وإلا نحمّل WhisperModel محلي مثل قبل.
+    """
+    client = AsrClient(socket_path)
+    if client.ping():
+        return client
+
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_name, device=device, compute_type=compute_type)
@@ -0,0 +1,225 @@
+"""
+ASR worker: process واحد طويل العمر يحمّل WhisperModel مرة وحدة.
+
+التشغيل:
+    python -m app.asr_worker --model medium --cpu-threads 4 --num-workers 2 \
+        --cache-dir /var/cache/tayaqan-asr --cache-max-mb 2048
+
+--cascade-model small / --probe-model base: موديلات سريعة جنب --model (app/cascade.py و
+app/probe.py). الطلب يختار الموديل بـ "model" (فاضي = --model).
+--ctc-model model.onnx: موديل CTC للـ forced alignment لما السورة معروفة (app/forced_align.py).
+
+الويب (Flask/gunicorn) يكلمه عبر Unix socket من app.asr_client.AsrClient،
+فكل الـ jobs تتشارك نفس الموديل الدافي بدل ~1.5GB لكل process.
+"""
+import argparse
+import logging
+import os
+import socketserver
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.asr_cache import TranscriptionCache, cache_key
+from app.asr_client import DEFAULT_SOCKET, recv_frame, send_frame, segment_to_dict
+from app.audio import SAMPLE_RATE
+from app.metrics import snapshot, stage
+
+log = logging.getLogger("asr_worker")
+
+
+class AsrService:
+    def __init__(self, model_name, device, compute_type, cpu_threads, num_workers, cache=None,
+                 extra_models=(), ctc_model=None, ctc_vocab=None):
+        from faster_whisper import WhisperModel
+
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.cache = cache
+        # name -> WhisperModel (الأول = الافتراضي)
+        self.models = {
+            name: WhisperModel(
+                name,
+                device=device,
+                compute_type=compute_type,
+                cpu_threads=cpu_threads,
+                num_workers=num_workers,
+            )
+            for name in dict.fromkeys((model_name, *extra_models))
+        }
+        self.aligner = None
+        if ctc_model:
+            from app.forced_align import CtcAligner
+            self.aligner = CtcAligner(ctc_model, ctc_vocab or None, threads=cpu_threads)
+        # num_workers = كم transcribe يشتغل بالتوازي على نفس الموديل، والباقي ينتظر
+        self.slots = threading.BoundedSemaphore(max(1, num_workers))
+
+    def align(self, audio, words):
+        """forced alignment على كلمات المرجع -> [{"word", "start", "end", "score", "index"}]."""
+        if self.aligner is None:
+            raise ValueError("forced alignment model not loaded (--ctc-model)")
+        if isinstance(audio, str):
+            from faster_whisper import decode_audio
+            audio = decode_audio(audio)
+        with self.slots, stage("worker_align", audio_seconds=len(audio) / SAMPLE_RATE) as span:
+            out = self.aligner.align(audio, words)
+            span.items = len(out)
+        return out
+
+    def transcribe(self, audio, kwargs, info_out, batched=False, model_name=None):
+        """generator للـ segments (dict)، و info_out يتعبى بعد آخر segment."""
+        model_name = model_name or self.model_name
+        model = self.models.get(model_name)
+        if model is None:
+            raise ValueError(f"model not loaded: {model_name}")
+
+        key = None
+        if self.cache is not None:
+            if isinstance(audio, str):
+                # نفس الفك اللي يسويه model.transcribe، فنفكه مرة وحدة ونستخدمه للـ hash
+                from faster_whisper import decode_audio
+                audio = decode_audio(audio)
+            key = cache_key(audio, model_name, self.compute_type, kwargs, batched)
+            entry = self.cache.get(key)
+            if entry is not None:
+                with stage("worker_cache_hit", audio_seconds=entry["info"].get("duration"),
+                           items=len(entry["segments"]), model=model_name):
+                    yield from entry["segments"]
+                info_out.update(entry["info"], cached=True)
+                return
+
+        collected = []
+        with self.slots, stage("worker_transcribe", batched=batched, model=model_name) as span:
+            if batched:
+                # pipeline جديد لكل طلب: last_speech_timestamp حالة داخلية ما تتشارك بين threads
+                from faster_whisper import BatchedInferencePipeline
+                segments, info = BatchedInferencePipeline(model).transcribe(audio, **kwargs)
+            else:
+                segments, info = model.transcribe(audio, **kwargs)
+            span.audio_seconds = info.duration
+            for s in segments:
+                seg = segment_to_dict(s)
+                collected.append(seg)
+                yield seg
+            span.items = len(collected)
+            info_out.update({
+                "language": info.language,
+                "language_probability": info.language_probability,
+                "duration": info.duration,
+                "duration_after_vad": info.duration_after_vad,
+            })
+
+        # نخزن بس لو الـ transcription كمل (العميل ما قطع بالنص)
+        if key is not None:
+            self.cache.put(key, collected, dict(info_out))
+        info_out["cached"] = False
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service = self.server.service
+        try:
+            header, payload = recv_frame(self.request)
+        except (ConnectionError, ValueError):
+            return
+
+        op = header.get("op")
+        try:
+            if op == "ping":
+                send_frame(self.request, {"ok": True, "model": service.model_name,
+                                          "models": list(service.models),
+                                          "aligner": service.aligner is not None})
+                return
+
+            if op == "stats":
+                send_frame(self.request, {
+                    "cache": service.cache.stats() if service.cache else None,
+                    "stages": snapshot(),
+                })
+                return
+
+            if op not in ("transcribe", "align"):
+                send_frame(self.request, {"error": f"unknown op: {op}"})
+                return
+
+            audio = header.get("audio")
+            if audio is None:
+                audio = np.frombuffer(payload, dtype=np.float32)
+
+            if op == "align":
+                words = service.align(audio, header.get("words") or [])
+                send_frame(self.request, {"done": True, "words": words})
+                return
+
+            info = {}
+            kwargs = header.get("kwargs") or {}
+            for seg in service.transcribe(audio, kwargs, info, batched=bool(header.get("batched")),
+                                          model_name=header.get("model")):
+                send_frame(self.request, {"segment": seg})
+            send_frame(self.request, {"done": True, "info": info})
+
+        except (BrokenPipeError, ConnectionError):
+            log.warning("client disconnected during %s", op)
+        except Exception as e:
+            log.exception("ASR request failed")
+            try:
+                send_frame(self.request, {"error": str(e)})
+            except OSError:
+                pass
+
+
+class AsrServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, service):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.service = service
+        super().__init__(socket_path, _Handler)
+
+
+def main():
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description="Ta'yaqan ASR worker")
+    parser.add_argument("--socket", default=Config.ASR_SOCKET)
+    parser.add_argument("--model", default=Config.ASR_MODEL)
+    parser.add_argument("--cascade-model", default=Config.ASR_CASCADE_MODEL,
+                        help="fast model loaded next to --model (app/cascade.py)")
+    parser.add_argument("--probe-model", default=Config.ASR_PROBE_MODEL,
+                        help="model for the leading surah probe (app/probe.py)")
+    parser.add_argument("--ctc-model", default=Config.FORCED_ALIGN_MODEL,
+                        help="CTC .onnx model for forced alignment (app/forced_align.py)")
+    parser.add_argument("--ctc-vocab", default=Config.FORCED_ALIGN_VOCAB,
+                        help="vocab.json of --ctc-model (default: next to the model)")
+    parser.add_argument("--device", default=Config.ASR_DEVICE)
+    parser.add_argument("--compute-type", default=Config.ASR_COMPUTE_TYPE)
+    parser.add_argument("--cpu-threads", type=int, default=Config.ASR_CPU_THREADS)
+    parser.add_argument("--num-workers", type=int, default=Config.ASR_NUM_WORKERS)
+    parser.add_argument("--cache-dir", default=Config.ASR_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=int, default=Config.ASR_CACHE_MAX_MB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    log.info("loading model=%s cascade_model=%s device=%s compute_type=%s cpu_threads=%s num_workers=%s",
+             args.model, args.cascade_model or "-", args.device, args.compute_type, args.cpu_threads,
+             args.num_workers)
+
+    cache = None
+    if args.cache_dir:
+        cache = TranscriptionCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+        log.info("transcription cache %s (%s MB)", args.cache_dir, args.cache_max_mb)
+
+    service = AsrService(args.model, args.device, args.compute_type, args.cpu_threads,
+                         args.num_workers, cache=cache,
+                         extra_models=[m for m in (args.cascade_model, args.probe_model) if m],
+                         ctc_model=args.ctc_model, ctc_vocab=args.ctc_vocab)
+    with AsrServer(args.socket or DEFAULT_SOCKET, service) as server:
+        log.info("listening on %s", args.socket)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import contextlib
+import os
+import wave
+
+import av
+import numpy as np
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+SAMPLE_RATE = 16000              # اللي يحتاجه Whisper
+CHUNK_SIZE = 1 << 16             # 64KB: حجم القراءة من الـ stream للـ decoder
+ENERGY_FRAME_MS = 30             # طول الـ frame لحساب الطاقة (سكتات بدون VAD)
+SILENCE_DB = 35                  # frame أهدى من (أعلى طاقة - 35 dB) = سكتة
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def is_whisper_wav(path: str) -> bool:
+    """wav جاهز (16kHz mono PCM16) -> ما يحتاج ffmpeg مرة ثانية."""
+    try:
+        with contextlib.closing(wave.open(path, "rb")) as wf:
+            return (wf.getframerate() == SAMPLE_RATE
+                    and wf.getnchannels() == 1
+                    and wf.getsampwidth() == 2)
+    except (wave.Error, EOFError, OSError):
+        return False
+
+
+def _iter_pcm(container, fmt):
+    """يفك أول audio stream ويرجع chunks (numpy 1D) بـ 16kHz mono."""
+    if not container.streams.audio:
+        raise AudioDecodeError("no audio stream in input")
+
+    resampler = av.AudioResampler(format=fmt, layout="mono", rate=SAMPLE_RATE)
+    for frame in container.decode(audio=0):
+        for out in resampler.resample(frame):
+            yield out.to_ndarray().reshape(-1)
+
+    # آخر samples محبوسة داخل الـ resampler
+    for out in resampler.resample(None):
+        yield out.to_ndarray().reshape(-1)
+
+
+def decode_stream_to_wav(stream, dst_wav: str, chunk_size: int = CHUNK_SIZE) -> float:
+    """
+    يفك الـ upload وهو يوصل (PyAV يقرأ chunk_size كل مرة) ويكتب
+    16kHz mono PCM16 wav مباشرة — بدون MP3 وسيط وبدون تحميل الملف كامل بالذاكرة.
+    stream: أي file-like (request.stream أو FileStorage.stream).
+    يرجع المدة بالثواني.
+    """
+    frames = 0
+
+    try:
+        with av.open(stream, mode="r", buffer_size=chunk_size) as container, \
+                contextlib.closing(wave.open(dst_wav, "wb")) as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+
+            for pcm in _iter_pcm(container, "s16"):
+                wf.writeframes(pcm.tobytes())
+                frames += len(pcm)
+
+    except av.FFmpegError as e:
+        raise AudioDecodeError(str(e)) from e
+
+    return frames / float(SAMPLE_RATE)
+
+
+# ----------------------------
+# PCM في الذاكرة: نفك التسجيل مرة وحدة، وكل clip مجرد slice (بدون ffmpeg لكل كلمة)
+# ----------------------------
+def load_pcm(path: str, cache_path: str | None = None) -> np.ndarray:
+    """
+    يفك أي صيغة (wav/webm/mkv/m4a...) مرة وحدة إلى float32 16kHz mono.
+    cache_path: لو انحط، نكتب float32 خام للملف ونرجعه np.memmap
+    (التسجيلات الطويلة ما تنحجز كاملة في RAM).
+    """
+    try:
+        with av.open(path, mode="r") as container:
+            if cache_path is None:
+                chunks = list(_iter_pcm(container, "flt"))
+                if not chunks:
+                    return np.zeros(0, dtype=np.float32)
+                return np.concatenate(chunks).astype(np.float32, copy=False)
+
+            with open(cache_path, "wb") as f:
+                for pcm in _iter_pcm(container, "flt"):
+                    f.write(pcm.astype(np.float32, copy=False).tobytes())
+    except av.FFmpegError as e:
+        raise AudioDecodeError(str(e)) from e
+
+    if os.path.getsize(cache_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(cache_path, dtype=np.float32, mode="r")
+
+
+def read_wav_range(path: str, start_s: float, end_s: float) -> np.ndarray:
+    """جزء من wav جاهز (16kHz mono PCM16) بدون ما نفك الملف كامل -> float32."""
+    with contextlib.closing(wave.open(path, "rb")) as wf:
+        start = min(int(max(0.0, start_s) * SAMPLE_RATE), wf.getnframes())
+        wf.setpos(start)
+        raw = wf.readframes(max(0, int(end_s * SAMPLE_RATE) - start))
+    return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def pcm_duration(pcm: np.ndarray) -> float:
+    return len(pcm) / float(SAMPLE_RATE)
+
+
+def clip_pcm(pcm: np.ndarray, start_s: float, end_s: float) -> np.ndarray:
+    """slice (view) بدون نسخ — يمر مباشرة لـ model.transcribe."""
+    start = int(max(0.0, start_s) * SAMPLE_RATE)
+    end = int(max(0.0, end_s) * SAMPLE_RATE)
+    return pcm[start:max(start, end)]
+
+
+def quiet_frames(pcm: np.ndarray, frame_ms: int = ENERGY_FRAME_MS,
+                 silence_db: float = SILENCE_DB) -> np.ndarray:
+    """
+    bool لكل frame (frame_ms): True = سكتة.
+    السكتة = طاقة (RMS بالـ dB) تحت percentile 95 للتسجيل كامل ناقص silence_db.
+    numpy بس: الويب يقدر يستخدمها بدون faster_whisper.
+    """
+    frame = int(SAMPLE_RATE * frame_ms / 1000)
+    n = len(pcm) // frame
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    x = np.asarray(pcm[:n * frame], dtype=np.float32).reshape(n, frame)
+    db = 10 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+    return db < np.percentile(db, 95) - silence_db
@@ -0,0 +1,72 @@
+"""
+يعبي جدول quran_word من quran_ayah (مرة وحدة، وبعد أي تعديل على نص المصحف أو على app/arabic.py).
+
+    python -m app.backfill_quran_words            # يبني الصفوف ويقارنها باللي في DB، يعيد الكتابة لو تغيرت
+    python -m app.backfill_quran_words --check    # يقارن بس (exit code 1 لو الجدول قديم/فاضي)
+
+بعدها QuranIndex ياخذ الكلمات normalized من quran_word مرتبة بـ wordpos بدل normalize لكل آية.
+"""
+import argparse
+import sys
+import time
+
+from app import create_app, db
+from app.models import QuranWord
+from app.persistence import bulk_insert
+from app.quran_index import _fetch_rows, word_rows
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+QURAN_WORD_COLUMNS = (
+    "surahid", "ayahnumber", "word_index", "ayahid", "wordpos", "word", "norm_strict", "norm_lenient",
+    "norm_version", "ayah_hash",
+)
+
+
+def _current():
+    columns = [getattr(QuranWord, c) for c in QURAN_WORD_COLUMNS]
+    return [tuple(r) for r in db.session.query(*columns).order_by(QuranWord.wordpos).all()]
+
+
+def backfill(check=False):
+    """يرجع (rows, changed)."""
+    t0 = time.perf_counter()
+    rows = list(word_rows(_fetch_rows()))
+    wanted = [tuple(r[c] for c in QURAN_WORD_COLUMNS) for r in rows]
+    if _current() == wanted:
+        return len(rows), False
+    if check:
+        return len(rows), True
+
+    try:
+        QuranWord.query.delete(synchronize_session=False)
+        bulk_insert(QuranWord, QURAN_WORD_COLUMNS, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    print(f"wrote {len(rows)} words in {time.perf_counter() - t0:.1f}s")
+    return len(rows), True
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fill quran_word from quran_ayah.")
+    ap.add_argument("--check", action="store_true", help="only report whether quran_word is up to date")
+    args = ap.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        n, changed = backfill(check=args.check)
+    if not changed:
+        print(f"quran_word up to date ({n} words)")
+        return 0
+    if args.check:
+        print(f"quran_word out of date ({n} words expected)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""
+تحقق جماعي: مجلد تسجيلات (مثلاً مصحف قارئ كامل) أو manifest، بدل test_whisper_DB.py ملف ملف.
+
+    python -m app.batch_verify downloads/husary/ --out reports/husary
+    python -m app.batch_verify --manifest batch.csv --batch-size 16 --align-workers 4
+
+  (1) كل ملف -> pcm 16kHz، VAD -> clips <= 30 ثانية (القص عند السكتات)
+  (2) clips من ملفات كثيرة تنلصق (pack_clips) لين PACK_SECONDS وتنفك في BatchedInferencePipeline
+      واحد -> كل encoder batch يتعبى من أكثر من ملف (الملفات القصيرة ما تضيع batch ناقص)
+  (3) كلمات كل clip ترجع لملفها بوقتها، والملف اللي خلصت clips حقته يروح للـ align workers
+      (ProcessPool: تحديد السورة + build_report) والـ ASR يكمل على اللي بعده
+  (4) report_surah_N.json لكل ملف بنفس شكل test_whisper_DB.py + batch_summary.json
+
+manifest: CSV بأعمدة path,surah أو JSON lines {"path": ..., "surah": ...} (المسارات نسبية للـ manifest).
+surah فاضي -> نحدد السورة والمدى من النص (index.locate). في المجلد: السورة من أول رقم في اسم
+الملف (001.mp3 -> 1) لو بين 1 و 114.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from app.alignment import build_report
+from app.arabic import text_tokens
+from app.asr_client import get_asr
+from app.audio import SAMPLE_RATE, AudioDecodeError, clip_pcm, load_pcm
+from app.gap_repair import decode_clips
+from app.metrics import stage
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".ogg", ".flac", ".webm", ".mkv", ".mp4")
+MAX_CLIP_SECONDS = 30.0          # Whisper يشوف 30 ثانية بالكثير لكل clip
+PACK_SECONDS = 600.0             # صوت كل طلب batched (~38MB float32)
+BATCH_SIZE = 16
+ALIGN_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+VAD_OPTIONS = dict(min_silence_duration_ms=500, speech_pad_ms=400, max_speech_duration_s=MAX_CLIP_SECONDS)
+
+# نفس test_whisper_DB.py (beam 8) بدون condition_on_previous_text (كل clip لحاله في الـ batch)
+BATCH_KWARGS = dict(
+    language="ar",
+    beam_size=8,
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+)
+
+SURAH_RE = re.compile(r"\d+")
+
+
+class BatchItem(NamedTuple):
+    path: str
+    surah: int | None            # None -> index.locate
+
+
+class Clip(NamedTuple):
+    file: int                    # رقم الملف في القائمة
+    start: float                 # ثواني داخل الملف
+    audio: np.ndarray
+
+
+# ----------------------------
+# Inputs
+# ----------------------------
+def _surah(value):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return n if 1 <= n <= 114 else None
+
+
+def scan_dir(directory):
+    items = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        m = SURAH_RE.search(os.path.splitext(name)[0])
+        items.append(BatchItem(os.path.join(directory, name), _surah(m.group()) if m else None))
+    return items
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [
+        BatchItem(os.path.join(base, r["path"]), _surah(r.get("surah")))
+        for r in rows if r.get("path")
+    ]
+
+
+# ----------------------------
+# Clips + packing
+# ----------------------------
+def speech_clips(pcm):
+    """VAD -> [(start, end)] بالثواني، كل واحد <= MAX_CLIP_SECONDS (مقاطع كلام متجاورة تندمج)."""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(np.asarray(pcm, dtype=np.float32), VadOptions(**VAD_OPTIONS))
+    clips = []
+    for s in speech:
+        start, end = s["start"] / SAMPLE_RATE, s["end"] / SAMPLE_RATE
+        if clips and end - clips[-1][0] <= MAX_CLIP_SECONDS:
+            clips[-1][1] = end
+        else:
+            clips.append([start, end])
+    return [tuple(c) for c in clips]
+
+
+def iter_packs(items, files, pack_seconds=PACK_SECONDS):
+    """
+    يفك الملفات بالترتيب ويرجع packs (قائمة Clip) كل ما تعدى الصوت pack_seconds.
+    files[k] يتعبى لكل ملف: duration / pending (clips باقية) / error.
+    """
+    pack, seconds = [], 0.0
+    for k, item in enumerate(items):
+        try:
+            pcm = load_pcm(item.path)
+        except (AudioDecodeError, OSError) as e:
+            files[k].update(error=str(e), pending=0)
+            continue
+        spans = speech_clips(pcm)
+        files[k].update(duration=len(pcm) / SAMPLE_RATE, pending=len(spans))
+        for start, end in spans:
+            pack.append(Clip(k, start, clip_pcm(pcm, start, end)))
+            seconds += end - start
+            if seconds >= pack_seconds:
+                yield pack
+                pack, seconds = [], 0.0
+    if pack:
+        yield pack
+
+
+# ----------------------------
+# Align workers (process لكل واحد: QuranIndex من الـ cache مرة وحدة)
+# ----------------------------
+_index = None
+
+
+def _init_align():
+    global _index
+    from app import create_app
+    from app.quran_index import get_quran_index
+
+    with create_app().app_context():
+        _index = get_quran_index()
+
+
+def align_file(path, surah, words, duration, transcribe_time):
+    """نفس payload حق test_whisper_DB.py. يرجع (payload, ثواني المقارنة)."""
+    t0 = time.perf_counter()
+    start = end = None
+    if surah is None:
+        detection = _index.locate(text_tokens(" ".join(w["word"] for w in words)))
+        if detection is None:
+            raise ValueError("could not detect surah from the recitation")
+        surah, start, end = detection.surahid, detection.startayah, detection.endayah
+
+    ref_tokens = _index.surah_words(surah, start, end)
+    ref_to_ayah = _index.surah_word_ayahs(surah, start, end)
+    ayat = [(n, t) for n, t in _index.surah_ayat(surah)
+            if (start is None or n >= start) and (end is None or n <= end)]
+    report = build_report(ref_tokens, ref_to_ayah, words)
+
+    payload = {
+        "surah_no": surah,
+        "audio_path": path,
+        "duration": duration,
+        "transcribe_time": round(transcribe_time, 2),
+        "forced_alignment": False,
+        "reference_text_from_db": " ".join(t for _, t in ayat).strip(),
+        "report": report,
+    }
+    return payload, time.perf_counter() - t0
+
+
+def _report_name(out_dir, payload, used):
+    """report_surah_N.json، ولو نفس السورة تكررت في الـ batch نضيف اسم الملف."""
+    name = f"report_surah_{payload['surah_no']}.json"
+    if name in used:
+        stem = os.path.splitext(os.path.basename(payload["audio_path"]))[0]
+        name = f"report_surah_{payload['surah_no']}_{stem}.json"
+    used.add(name)
+    return os.path.join(out_dir, name)
+
+
+# ----------------------------
+# Batch
+# ----------------------------
+def run_batch(items, asr, out_dir, batch_size=BATCH_SIZE, align_workers=ALIGN_WORKERS,
+              pack_seconds=PACK_SECONDS):
+    os.makedirs(out_dir, exist_ok=True)
+    files = [{"duration": 0.0, "pending": None, "words": [], "asr_seconds": 0.0, "error": None}
+             for _ in items]
+    t0 = time.perf_counter()
+    stats = {"files": len(items), "failed": 0, "packs": 0, "clips": 0,
+             "asr_seconds": 0.0, "align_seconds": 0.0}
+    futures, used = {}, set()
+
+    if align_workers:
+        pool = ProcessPoolExecutor(max_workers=align_workers,
+                                   mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_align)
+        submit = pool.submit
+    else:
+        # بدون pool (debug): نفس الـ process
+        _init_align()
+        pool = None
+
+        def submit(fn, *args):
+            f = Future()
+            try:
+                f.set_result(fn(*args))
+            except Exception as e:
+                f.set_exception(e)
+            return f
+
+    def flush(done_only=True):
+        # الملفات اللي خلصت clips حقتها -> align workers
+        for k, f in enumerate(files):
+            if k in futures or f["pending"] is None or (done_only and f["pending"] > 0):
+                continue
+            if f["error"]:
+                futures[k] = None
+                continue
+            f["words"].sort(key=lambda w: w["start"])
+            futures[k] = submit(align_file, items[k].path, items[k].surah, f["words"],
+                                f["duration"], f["asr_seconds"])
+
+    try:
+        for pack in iter_packs(items, files, pack_seconds):
+            pack_audio = sum(len(c.audio) for c in pack) / SAMPLE_RATE
+            t = time.perf_counter()
+            with stage("batch_decode", audio_seconds=pack_audio, items=len(pack),
+                       files=len({c.file for c in pack})):
+                decoded = decode_clips(asr, [c.audio for c in pack], BATCH_KWARGS, batch_size)
+            elapsed = time.perf_counter() - t
+            stats["packs"] += 1
+            stats["clips"] += len(pack)
+            stats["asr_seconds"] += elapsed
+
+            for clip, ws in zip(pack, decoded):
+                f = files[clip.file]
+                f["words"].extend(dict(w, start=w["start"] + clip.start, end=w["end"] + clip.start)
+                                  for w in ws)
+                # وقت الـ pack يتوزع على الملفات حسب صوتها فيه
+                f["asr_seconds"] += elapsed * (len(clip.audio) / SAMPLE_RATE) / max(pack_audio, 1e-9)
+                f["pending"] -= 1
+            flush()
+        flush(done_only=False)
+
+        summary_files = []
+        for k, item in enumerate(items):
+            fut, f = futures.get(k), files[k]
+            entry = {"path": item.path, "surah": item.surah, "duration": round(f["duration"], 2)}
+            try:
+                if fut is None:
+                    raise ValueError(f["error"] or "no audio")
+                payload, align_seconds = fut.result()
+            except Exception as e:
+                stats["failed"] += 1
+                entry["error"] = str(e)
+                print(f"[FAIL] {item.path}: {e}")
+            else:
+                stats["align_seconds"] += align_seconds
+                out = _report_name(out_dir, payload, used)
+                with open(out, "w", encoding="utf-8") as fh:
+                    json.dump(payload, fh, ensure_ascii=False, indent=2)
+                entry.update(report=out, surah=payload["surah_no"])
+                print(f"[OK] {item.path} -> {out}")
+            summary_files.append(entry)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    wall = time.perf_counter() - t0
+    audio = sum(f["duration"] for f in files)
+    summary = dict(
+        stats,
+        audio_seconds=round(audio, 2),
+        wall_seconds=round(wall, 2),
+        asr_seconds=round(stats["asr_seconds"], 2),
+        align_seconds=round(stats["align_seconds"], 2),
+        rtf=round(wall / audio, 4) if audio else None,
+        asr_rtf=round(stats["asr_seconds"] / audio, 4) if audio else None,
+        audio_hours_per_hour=round(audio / wall, 2) if wall else None,
+        batch_size=batch_size,
+        align_workers=align_workers,
+        items=summary_files,
+    )
+    with open(os.path.join(out_dir, "batch_summary.json"), "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, ensure_ascii=False, indent=2)
+    return summary
+
+
+def main():
+    from app.config import Config
+
+    ap = argparse.ArgumentParser(description="Verify many recitations with cross-file batched inference.")
+    ap.add_argument("directory", nargs="?", help="folder of recordings (surah from the file name)")
+    ap.add_argument("--manifest", help="CSV (path,surah) or JSON lines with path/surah")
+    ap.add_argument("--out", default="reports", help="folder for report_surah_N.json files")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--pack-seconds", type=float, default=PACK_SECONDS,
+                    help="audio per batched request (clips from several files)")
+    ap.add_argument("--align-workers", type=int, default=ALIGN_WORKERS, help="0 = align in this process")
+    ap.add_argument("--model", default=Config.ASR_MODEL, help="local model when the ASR worker is not running")
+    ap.add_argument("--socket", default=Config.ASR_SOCKET)
+    args = ap.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        ap.error("give a directory or --manifest")
+    items = read_manifest(args.manifest) if args.manifest else scan_dir(args.directory)
+    if not items:
+        print("no audio files")
+        return 1
+
+    asr = get_asr(args.socket, args.model, device=Config.ASR_DEVICE, compute_type=Config.ASR_COMPUTE_TYPE)
+    s = run_batch(items, asr, args.out, args.batch_size, args.align_workers, args.pack_seconds)
+    print(f"{s['files'] - s['failed']}/{s['files']} files  audio={s['audio_seconds'] / 3600:.2f}h  "
+          f"wall={s['wall_seconds']:.0f}s  asr={s['asr_seconds']:.0f}s  align={s['align_seconds']:.0f}s  "
+          f"RTF={s['rtf']}  {s['audio_hours_per_hour']} audio-h/h  ({s['packs']} packs, {s['clips']} clips)")
+    return 1 if s["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Benchmark للمقارنة وتحديد السورة (بدون DB وبدون Whisper).
+
+لكل سورة من الـ 114: نصنع hypothesis من نص المرجع بنسب حذف/زيادة/تحريف معروفة، ونقيس
+    levenshtein_ops, edit_distance (أزواج التحريف), QuranIndex.locate, build_report
+الوقت + أعلى memory (tracemalloc، لأطول سورة في كل class) + دقة تحديد السورة، مجمعة حسب
+طول السورة. النتيجة JSON تنقارن مع baseline محفوظ.
+
+    python -m app.bench_alignment                       # يقارن مع benchmarks/alignment_baseline.json
+    python -m app.bench_alignment --update-baseline     # يحفظ النتيجة baseline جديد
+    python -m app.bench_alignment --export-fixture      # ينسخ quran_ayah من DB لملف الـ fixture
+
+المرجع من benchmarks/quran_fixture.json.gz (نسخة من quran_ayah). لو الملف مو موجود نستخدم نص
+صناعي ثابت (seed) بنفس عدد آيات كل سورة — يصلح لقياس السرعة بس الدقة أقرب للواقع مع النص الحقيقي.
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from app.alignment import build_report, edit_distance, levenshtein_ops
+from app.quran_index import SURAH_COUNT, QuranIndex
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+FIXTURE_PATH = os.path.join(BENCH_DIR, "quran_fixture.json.gz")
+BASELINE_PATH = os.path.join(BENCH_DIR, "alignment_baseline.json")
+
+# (deletion, insertion, substitution) نسبة من كلمات المرجع
+PROFILES = {
+    "clean": (0.0, 0.0, 0.0),
+    "light": (0.02, 0.02, 0.02),
+    "heavy": (0.10, 0.05, 0.10),
+}
+
+# تصنيف السور حسب عدد الكلمات
+LENGTH_CLASSES = (
+    ("short", 0, 100),
+    ("medium", 100, 1000),
+    ("long", 1000, None),
+)
+
+SECONDS_PER_WORD = 0.45          # توقيت صناعي للكلمات (build_report يحتاج start)
+
+# regression = أبطأ/أكبر من الـ baseline بأكثر من كذا، أو دقة أقل
+TIME_TOLERANCE = 0.30
+MEMORY_TOLERANCE = 0.20
+ACCURACY_TOLERANCE = 0.01
+TIME_FLOOR_S = 0.001             # أوقات أقل من كذا ضوضاء (ما نقارنها)
+
+# عدد آيات كل سورة (1..114) — للنص الصناعي لما ما فيه fixture
+SURAH_AYAT = (
+    7, 286, 200, 176, 120, 165, 206, 75, 129, 109, 123, 111, 43, 52, 99, 128, 111, 110, 98, 135,
+    112, 78, 118, 64, 77, 227, 93, 88, 69, 60, 34, 30, 73, 54, 45, 83, 182, 88, 75, 85,
+    54, 53, 89, 59, 37, 35, 38, 29, 18, 45, 60, 49, 62, 55, 78, 96, 29, 22, 24, 13,
+    14, 11, 11, 18, 12, 12, 30, 52, 52, 44, 28, 28, 20, 56, 40, 31, 50, 40, 46, 42,
+    29, 19, 36, 25, 22, 17, 19, 26, 30, 20, 15, 21, 11, 8, 8, 19, 5, 8, 8, 11,
+    11, 8, 3, 9, 5, 4, 7, 3, 6, 3, 5, 4, 5, 6,
+)
+
+_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهويةى"
+
+
+# ----------------------------
+# Reference fixture
+# ----------------------------
+def synthetic_rows(seed=0):
+    """نص صناعي ثابت: vocab بتوزيع Zipf + آيات أطول في السور الطويلة (مثل المصحف)."""
+    rnd = random.Random(seed)
+    vocab = sorted({"".join(rnd.choice(_LETTERS) for _ in range(rnd.randint(2, 7))) for _ in range(15000)})
+    rnd.shuffle(vocab)
+    weights = [1.0 / (k + 1) for k in range(len(vocab))]
+
+    rows, ayahid = [], 0
+    for sid, n_ayat in enumerate(SURAH_AYAT, start=1):
+        lo, hi = (3, 12) if n_ayat < 60 else (6, 25)
+        for num in range(1, n_ayat + 1):
+            ayahid += 1
+            words = rnd.choices(vocab, weights, k=rnd.randint(lo, hi))
+            rows.append((ayahid, sid, num, " ".join(words)))
+    return rows
+
+
+def load_fixture(path=FIXTURE_PATH):
+    """يرجع (rows, source). rows: (ayahid, surahid, ayahnumber, ayahtext) مرتبة."""
+    if os.path.exists(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = [tuple(r) for r in json.load(f)["rows"]]
+        return rows, "fixture"
+    return synthetic_rows(), "synthetic"
+
+
+def export_fixture(path=FIXTURE_PATH):
+    from app import create_app
+    from app.quran_index import _fetch_rows
+
+    app = create_app()
+    with app.app_context():
+        rows = [list(r) for r in _fetch_rows()]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"rows": rows}, f, ensure_ascii=False)
+    print(f"wrote {len(rows)} ayat to {path}")
+
+
+def build_index(rows):
+    fingerprint = (len(rows), max(r[0] for r in rows), sum(len(r[3]) for r in rows))
+    return QuranIndex.build(rows, fingerprint)
+
+
+# ----------------------------
+# Synthetic hypotheses
+# ----------------------------
+def corrupt(ref, rates, vocab, rnd):
+    """
+    ref tokens -> (hyp tokens, substitution pairs) بنسب (deletion, insertion, substitution).
+    التحريف يغير حرف واحد (مثل أخطاء Whisper الحقيقية) عشان edit_distance يكون واقعي.
+    """
+    p_del, p_ins, p_sub = rates
+    hyp, pairs = [], []
+    for tok in ref:
+        r = rnd.random()
+        if r < p_del:
+            continue
+        if r < p_del + p_sub:
+            k = rnd.randrange(len(tok))
+            wrong = tok[:k] + rnd.choice(_LETTERS) + tok[k + 1:]
+            hyp.append(wrong)
+            pairs.append((tok, wrong))
+        else:
+            hyp.append(tok)
+        if rnd.random() < p_ins:
+            hyp.append(rnd.choice(vocab))
+    return hyp, pairs
+
+
+def length_class(n_words):
+    for name, lo, hi in LENGTH_CLASSES:
+        if n_words >= lo and (hi is None or n_words < hi):
+            return name
+    return LENGTH_CLASSES[-1][0]
+
+
+# ----------------------------
+# Measurement
+# ----------------------------
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def peak_bytes(fn):
+    # tracemalloc يبطئ الـ DP (Python) كثير، فينقاس لحاله بعد الوقت
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_surah(index, sid, rates, rnd, memory=False):
+    """memory=True: كمان peak لكل عملية (tracemalloc) — نسويه لأطول سورة في كل class بس."""
+    ref = index.surah_words(sid)
+    ref_to_ayah = index.surah_word_ayahs(sid)
+    hyp, pairs = corrupt(ref, rates, index.vocab, rnd)
+    words = [{"word": w, "start": round(k * SECONDS_PER_WORD, 2)} for k, w in enumerate(hyp)]
+
+    out = {"surah": sid, "ref_words": len(ref), "hyp_words": len(hyp), "class": length_class(len(ref))}
+    ops = {
+        "levenshtein": lambda: levenshtein_ops(ref, hyp),
+        "edit_distance": lambda: [edit_distance(a, b) for a, b in pairs],
+        "detect": lambda: index.locate(hyp),
+        "report": lambda: build_report(ref, ref_to_ayah, words),
+    }
+    results = {}
+    for op, fn in ops.items():
+        results[op], out[f"{op}_s"] = timed(fn)
+        if memory:
+            out[f"{op}_peak"] = peak_bytes(fn)
+
+    det = results["detect"]
+    out["detected"] = bool(det and det.surahid == sid)
+    out["detected_start"] = bool(det and det.surahid == sid and det.startayah == 1)
+    out["error_rate"] = round(1 - results["report"]["summary"]["correct"] / max(1, len(ref)), 4)
+    return out
+
+
+def _p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(0.95 * len(values)))]
+
+
+def summarize(results):
+    """per profile -> per length class: الوقت (mean/p95/max)، أعلى peak، دقة التحديد."""
+    summary = {}
+    for profile, rows in results.items():
+        by_class = {}
+        for name, _, _ in LENGTH_CLASSES:
+            group = [r for r in rows if r["class"] == name]
+            if not group:
+                continue
+            s = {"surahs": len(group), "words": sum(r["ref_words"] for r in group)}
+            for op in ("levenshtein", "edit_distance", "detect", "report"):
+                times = [r[f"{op}_s"] for r in group]
+                s[f"{op}_mean_s"] = round(sum(times) / len(times), 6)
+                s[f"{op}_p95_s"] = round(_p95(times), 6)
+                s[f"{op}_max_s"] = round(max(times), 6)
+                peaks = [r[f"{op}_peak"] for r in group if f"{op}_peak" in r]
+                if peaks:
+                    s[f"{op}_peak_bytes"] = max(peaks)
+            s["detect_accuracy"] = round(sum(r["detected"] for r in group) / len(group), 4)
+            s["detect_start_accuracy"] = round(sum(r["detected_start"] for r in group) / len(group), 4)
+            by_class[name] = s
+        summary[profile] = by_class
+    return summary
+
+
+def compare(summary, baseline):
+    """يرجع list regressions (نص) مقابل baseline["summary"]."""
+    regressions = []
+    for profile, classes in summary.items():
+        for cls, s in classes.items():
+            b = baseline.get("summary", {}).get(profile, {}).get(cls)
+            if not b:
+                continue
+            for key, value in s.items():
+                if key not in b:
+                    continue
+                old = b[key]
+                if key.endswith("_s") and max(old, value) >= TIME_FLOOR_S and value > old * (1 + TIME_TOLERANCE):
+                    regressions.append(f"{profile}/{cls} {key}: {old:.6f}s -> {value:.6f}s")
+                elif key.endswith("_peak_bytes") and old > 0 and value > old * (1 + MEMORY_TOLERANCE):
+                    regressions.append(f"{profile}/{cls} {key}: {old} -> {value} bytes")
+                elif key.endswith("_accuracy") and value < old - ACCURACY_TOLERANCE:
+                    regressions.append(f"{profile}/{cls} {key}: {old} -> {value}")
+    return regressions
+
+
+def run(profiles, surahs, seed=0):
+    rows, source = load_fixture()
+    t0 = time.perf_counter()
+    index = build_index(rows)
+    build_s = time.perf_counter() - t0
+
+    # أطول سورة في كل class (من المختارة) تنقاس لها الـ memory
+    longest = {}
+    for sid in surahs:
+        n = len(index.surah_words(sid))
+        cls = length_class(n)
+        if n > longest.get(cls, (0, None))[0]:
+            longest[cls] = (n, sid)
+    traced = {sid for _, sid in longest.values()}
+
+    results = {}
+    for profile in profiles:
+        rnd = random.Random(seed)
+        results[profile] = [
+            bench_surah(index, sid, PROFILES[profile], rnd, memory=sid in traced) for sid in surahs
+        ]
+        print(f"{profile}: {len(surahs)} surahs done", file=sys.stderr, flush=True)
+
+    return {
+        "reference": {"source": source, "fingerprint": list(index.fingerprint)},
+        "surah_ids": list(surahs),
+        "seed": seed,
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "index_build_s": round(build_s, 4),
+        "profiles": {p: dict(zip(("deletion", "insertion", "substitution"), PROFILES[p])) for p in profiles},
+        "summary": summarize(results),
+        "surahs": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Alignment / surah detection benchmark.")
+    ap.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=list(PROFILES))
+    ap.add_argument("--surahs", type=int, nargs="+", default=None, help="default: all 114")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", help="write full JSON result here")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--export-fixture", action="store_true", help="copy quran_ayah from the DB and exit")
+    args = ap.parse_args()
+
+    if args.export_fixture:
+        export_fixture()
+        return 0
+
+    surahs = args.surahs or list(range(1, SURAH_COUNT + 1))
+    result = run(args.profiles, surahs, args.seed)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result["summary"], indent=2))
+
+    if args.update_baseline:
+        baseline = {k: v for k, v in result.items() if k != "surahs"}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare against (run with --update-baseline)", file=sys.stderr)
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("reference") != result["reference"]:
+        print("baseline was recorded on a different reference text; not comparing", file=sys.stderr)
+        return 0
+    if (baseline.get("surah_ids"), baseline.get("seed")) != (result["surah_ids"], result["seed"]):
+        # متوسطات الـ class تعتمد على السور المختارة
+        print("baseline was recorded on a different surah set or seed; not comparing", file=sys.stderr)
+        return 0
+
+    regressions = compare(result["summary"], baseline)
+    for r in regressions:
+        print("REGRESSION " + r, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Benchmark لإعدادات Whisper على تسجيلات downloads/ (بدل ما نقرا TRANSCRIBE_TIME من الـ stdout).
+
+    python -m app.bench_asr --models small medium --beam-sizes 1 5 8 --vad off pipeline
+    python -m app.bench_asr --files downloads/RF.wav --refs benchmarks/asr_refs.json
+
+لكل (model, compute_type) process جديد (الموديل ينحمل مرة وحدة، والـ RSS ما يتأثر بموديل قبله)،
+وداخله كل (beam_size, chunk_length, VAD) × كل ملف:
+    RTF = وقت transcribe / مدة الصوت
+    peak RSS (sampling لـ /proc أثناء التشغيل)
+    CPU = (user + sys) / wall  -> كم core مستخدم فعليًا
+    WER = levenshtein_ops على الكلمات (normalize/tokenize) مقابل المرجع
+
+المرجع: benchmarks/asr_refs.json {"RF.wav": {"surah": 79, "start_ayah": 1, "end_ayah": 46}} -> عمود WER.
+لو الملف مو فيه نحدد السورة من النص (index.locate) ونقارن مع المقطع اللي انحدد -> عمود
+"WER (detected)" لحاله: المقطع طالع من نفس النص فهو متحيز (كلمات ناقصة في الأطراف ما تنحسب)،
+وما يختلط مع WER الحقيقي ولا يدخل في الترتيب.
+النص المرجعي من fixture حق bench_alignment لو موجود، وإلا من DB.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+
+from app.alignment import levenshtein_ops
+from app.arabic import text_tokens
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+DOWNLOADS_DIR = "downloads"
+AUDIO_EXTENSIONS = (".wav", ".webm", ".mkv", ".m4a", ".mp4")
+REFS_PATH = os.path.join("benchmarks", "asr_refs.json")
+
+# VAD presets (نفس اللي في pipeline.py و test_whisper.py)
+VAD_PRESETS = {
+    "off": None,
+    "pipeline": dict(min_silence_duration_ms=200, speech_pad_ms=500),
+    "long": dict(min_silence_duration_ms=1100, speech_pad_ms=1800, min_speech_duration_ms=250,
+                 threshold=0.35, max_speech_duration_s=30),
+}
+
+BASE_KWARGS = dict(
+    language="ar",
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+    word_timestamps=True,
+)
+
+RSS_SAMPLE_SECONDS = 0.05
+
+
+# ----------------------------
+# Resource sampling
+# ----------------------------
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # مو Linux: أعلى RSS للـ process كامل (KB على Linux، bytes على macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """أعلى RSS أثناء with block (thread يقرا /proc/self/statm)."""
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _cpu_seconds():
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+
+# ----------------------------
+# Reference + WER
+# ----------------------------
+def reference_index():
+    """QuranIndex من الـ fixture (بدون DB) لو موجود، وإلا من DB."""
+    from app.bench_alignment import FIXTURE_PATH, build_index, load_fixture
+
+    if os.path.exists(FIXTURE_PATH):
+        rows, _ = load_fixture(FIXTURE_PATH)
+        return build_index(rows)
+
+    from app import create_app
+    from app.quran_index import get_quran_index
+
+    app = create_app()
+    with app.app_context():
+        return get_quran_index()
+
+
+def word_error_rate(ref, hyp):
+    if not ref:
+        return None
+    errors = sum(1 for kind, _, _ in levenshtein_ops(ref, hyp) if kind != "equal")
+    return errors / len(ref)
+
+
+def score(index, name, text, refs):
+    """wer بس مع مرجع من asr_refs؛ بدونه detected_wer (مقابل المقطع اللي انحدد من النص نفسه)."""
+    hyp = text_tokens(text)
+    spec = refs.get(name)
+    if spec:
+        ref = index.surah_words(spec["surah"], spec.get("start_ayah"), spec.get("end_ayah"))
+        source, key = "refs", "wer"
+    else:
+        det = index.locate(hyp)
+        if det is None:
+            return {"wer": None, "detected_wer": None, "ref_source": "undetected", "hyp_words": len(hyp)}
+        ref = index.surah_words(det.surahid, det.startayah, det.endayah)
+        source, key = f"detected {det.surahid}:{det.startayah}-{det.endayah}", "detected_wer"
+    wer = word_error_rate(ref, hyp)
+    out = {
+        "wer": None,
+        "detected_wer": None,
+        "ref_source": source,
+        "ref_words": len(ref),
+        "hyp_words": len(hyp),
+    }
+    out[key] = round(wer, 4) if wer is not None else None
+    return out
+
+
+# ----------------------------
+# Runs (child process لكل model/compute_type)
+# ----------------------------
+def _run_group(model_name, compute_type, device, cpu_threads, decode_grid, files, out_q):
+    from faster_whisper import WhisperModel
+
+    from app.audio import load_pcm, pcm_duration
+
+    t0 = time.perf_counter()
+    with RssSampler() as rss:
+        model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+    load = {"load_s": round(time.perf_counter() - t0, 2), "model_rss_bytes": rss.peak}
+
+    for path in files:
+        t0 = time.perf_counter()
+        pcm = load_pcm(path)
+        decode_s = time.perf_counter() - t0
+        duration = pcm_duration(pcm)
+
+        for beam_size, chunk_length, vad in decode_grid:
+            kwargs = dict(BASE_KWARGS, beam_size=beam_size, chunk_length=chunk_length)
+            if VAD_PRESETS[vad] is None:
+                kwargs["vad_filter"] = False
+            else:
+                kwargs.update(vad_filter=True, vad_parameters=VAD_PRESETS[vad])
+
+            cpu0 = _cpu_seconds()
+            t0 = time.perf_counter()
+            with RssSampler() as rss:
+                segments, _ = model.transcribe(pcm, **kwargs)
+                text = " ".join(s.text.strip() for s in segments)
+            wall = time.perf_counter() - t0
+            cpu = _cpu_seconds() - cpu0
+
+            out_q.put({
+                "file": os.path.basename(path),
+                "model": model_name,
+                "compute_type": compute_type,
+                "beam_size": beam_size,
+                "chunk_length": chunk_length,
+                "vad": vad,
+                "audio_s": round(duration, 2),
+                "decode_s": round(decode_s, 3),
+                "transcribe_s": round(wall, 2),
+                "rtf": round(wall / duration, 4) if duration else None,
+                "cpu_cores": round(cpu / wall, 2) if wall else None,
+                "cpu_util": round(100 * cpu / wall / (os.cpu_count() or 1), 1) if wall else None,
+                "peak_rss_bytes": rss.peak,
+                "text": text,
+                **load,
+            })
+    out_q.put(None)
+
+
+def run_grid(files, models, compute_types, beam_sizes, chunk_lengths, vads, device="cpu", cpu_threads=0):
+    decode_grid = list(itertools.product(beam_sizes, chunk_lengths, vads))
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for model_name, compute_type in itertools.product(models, compute_types):
+        q = ctx.Queue()
+        p = ctx.Process(target=_run_group, args=(
+            model_name, compute_type, device, cpu_threads, decode_grid, files, q))
+        p.start()
+        while True:
+            try:
+                row = q.get(timeout=1)
+            except queue.Empty:
+                if p.is_alive():
+                    continue
+                break  # الـ child طاح (OOM/موديل مو موجود) قبل ما يرسل None
+            if row is None:
+                break
+            rows.append(row)
+            print(f"{row['model']}/{row['compute_type']} beam={row['beam_size']} chunk={row['chunk_length']} "
+                  f"vad={row['vad']} {row['file']}: rtf={row['rtf']}", file=sys.stderr, flush=True)
+        p.join()
+        if p.exitcode:
+            print(f"{model_name}/{compute_type} failed (exit {p.exitcode})", file=sys.stderr)
+    return rows
+
+
+# ----------------------------
+# Output
+# ----------------------------
+TABLE_COLUMNS = (
+    ("model", "model"), ("compute_type", "compute"), ("beam_size", "beam"), ("chunk_length", "chunk"),
+    ("vad", "vad"), ("files", "files"), ("rtf", "RTF"), ("cpu_cores", "cores"),
+    ("cpu_util", "CPU %"), ("peak_rss_mb", "RSS MB"), ("wer", "WER"), ("detected_wer", "WER (detected)"),
+)
+
+
+def aggregate(rows):
+    """متوسط كل config على كل الملفات (RTF موزون بمدة الصوت)."""
+    groups = {}
+    for r in rows:
+        key = (r["model"], r["compute_type"], r["beam_size"], r["chunk_length"], r["vad"])
+        groups.setdefault(key, []).append(r)
+
+    out = []
+    for key, group in groups.items():
+        audio = sum(r["audio_s"] for r in group)
+        wall = sum(r["transcribe_s"] for r in group)
+        wers = [r["wer"] for r in group if r.get("wer") is not None]
+        detected = [r["detected_wer"] for r in group if r.get("detected_wer") is not None]
+        out.append({
+            **dict(zip(("model", "compute_type", "beam_size", "chunk_length", "vad"), key)),
+            "files": len(group),
+            "rtf": round(wall / audio, 4) if audio else None,
+            "cpu_cores": round(sum(r["cpu_cores"] * r["transcribe_s"] for r in group) / wall, 2) if wall else None,
+            "cpu_util": round(sum(r["cpu_util"] * r["transcribe_s"] for r in group) / wall, 1) if wall else None,
+            "peak_rss_mb": round(max(r["peak_rss_bytes"] for r in group) / 2 ** 20),
+            "wer": round(sum(wers) / len(wers), 4) if wers else None,
+            "detected_wer": round(sum(detected) / len(detected), 4) if detected else None,
+        })
+    # الأدق أول (WER من asr_refs بس)، وبعدين الأسرع
+    out.sort(key=lambda r: (r["wer"] is None, r["wer"] or 0, r["rtf"] or 0))
+    return out
+
+
+def markdown_table(summary):
+    head = "| " + " | ".join(t for _, t in TABLE_COLUMNS) + " |"
+    sep = "|" + "|".join("---" for _ in TABLE_COLUMNS) + "|"
+    lines = [head, sep]
+    for r in summary:
+        lines.append("| " + " | ".join("-" if r[k] is None else str(r[k]) for k, _ in TABLE_COLUMNS) + " |")
+    return "\n".join(lines)
+
+
+def find_audio(directory=DOWNLOADS_DIR):
+    return sorted(
+        os.path.join(directory, n) for n in os.listdir(directory)
+        if n.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sweep Whisper settings over recordings and compare RTF/RSS/CPU/WER.")
+    ap.add_argument("--files", nargs="+", help=f"default: every audio file in {DOWNLOADS_DIR}/")
+    ap.add_argument("--models", nargs="+", default=["small", "medium"])
+    ap.add_argument("--compute-types", nargs="+", default=["int8"])
+    ap.add_argument("--beam-sizes", type=int, nargs="+", default=[1, 5, 8])
+    ap.add_argument("--chunk-lengths", type=int, nargs="+", default=[30])
+    ap.add_argument("--vad", nargs="+", choices=sorted(VAD_PRESETS), default=["off", "pipeline"])
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--cpu-threads", type=int, default=0)
+    ap.add_argument("--refs", default=REFS_PATH)
+    ap.add_argument("--output", default=os.path.join("benchmarks", "bench_asr.json"))
+    ap.add_argument("--table", default=os.path.join("benchmarks", "bench_asr.md"))
+    args = ap.parse_args()
+
+    files = args.files or find_audio()
+    if not files:
+        print("no audio files", file=sys.stderr)
+        return 2
+
+    refs = {}
+    if os.path.exists(args.refs):
+        with open(args.refs, encoding="utf-8") as f:
+            refs = json.load(f)
+
+    rows = run_grid(files, args.models, args.compute_types, args.beam_sizes, args.chunk_lengths,
+                    args.vad, args.device, args.cpu_threads)
+
+    index = reference_index()
+    for r in rows:
+        r.update(score(index, r["file"], r.pop("text"), refs))
+
+    summary = aggregate(rows)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "runs": rows}, f, ensure_ascii=False, indent=2)
+    table = markdown_table(summary)
+    with open(args.table, "w", encoding="utf-8") as f:
+        f.write(table + "\n")
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Benchmark للـ normalization (app/arabic.py) مقابل الطريقة القديمة (re.sub + replace متسلسلة).
+
+    python -m app.bench_normalize                 # المصحف كامل (fixture أو نص صناعي مشكّل)
+    python -m app.bench_normalize --repeat 10
+
+المسارات:
+  ayat   : tokenize(normalize_ar(ayah)) لكل آية (QuranIndex.build, السور)
+  words  : كلمة كلمة (whisper words -> words_to_tokens)
+  lenient: نسخة asr_align.py القديمة (ى/ة/ؤ/ئ + حذف الترقيم)
+الجديد يتقاس مرتين: cold (cache فاضي) و warm (cache مليان، مثل ثاني طلب على نفس السورة).
+قبل القياس نتأكد إن الناتج مطابق للقديم حرف بحرف.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from app.arabic import LENIENT, normalize_tokens, text_tokens, word_tokens
+from app.bench_alignment import load_fixture
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+HARAKAT = "\u064B\u064C\u064D\u064E\u064F\u0650\u0651\u0652"
+DIACRITIZE_SEED = 0
+
+
+# ----------------------------
+# الطريقة القديمة (كما كانت في app/arabic.py و asr_align.py)
+# ----------------------------
+_OLD_DIACRITICS = re.compile(r"[\u0617-\u061A\u064B-\u0652\u0670\u0640]")
+_OLD_PUNCT = re.compile(r"[^\w\s\u0600-\u06FF]")
+
+
+def old_normalize(text):
+    text = (text or "").strip()
+    text = _OLD_DIACRITICS.sub("", text)
+    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def old_tokenize(text):
+    text = re.sub(r"[^\u0600-\u06FF\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return [w for w in text.split(" ") if w]
+
+
+def old_lenient(text):
+    text = (text or "").strip()
+    text = _OLD_DIACRITICS.sub("", text)
+    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
+    text = text.replace("ى", "ي").replace("ة", "ه")
+    text = text.replace("ؤ", "و").replace("ئ", "ي")
+    text = _OLD_PUNCT.sub(" ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+# ----------------------------
+# Reference text
+# ----------------------------
+def diacritize(text, rnd):
+    """النص الصناعي بدون تشكيل: نضيف حركة بعد كل حرف (مثل نص المصحف)."""
+    return "".join(c + rnd.choice(HARAKAT) if c != " " else c for c in text)
+
+
+def reference_texts():
+    rows, source = load_fixture()
+    texts = [r[3] or "" for r in rows]
+    if source == "synthetic":
+        rnd = random.Random(DIACRITIZE_SEED)
+        texts = [diacritize(t, rnd) for t in texts]
+    return texts, source
+
+
+# ----------------------------
+# Bench
+# ----------------------------
+def best_of(fn, repeat, before=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(repeat):
+    texts, source = reference_texts()
+    words = [" " + w for t in texts for w in t.split()]      # whisper words تبدأ بمسافة
+    lenient_new = lambda t: " ".join(text_tokens(t, LENIENT))
+
+    # الناتج لازم يطابق القديم قبل ما نقيس
+    for t in texts:
+        assert text_tokens(t) == old_tokenize(old_normalize(t)), t
+        assert lenient_new(t) == old_lenient(t) or _OLD_PUNCT.search(t), t
+    assert [list(x) for x in normalize_tokens(words)] == [old_tokenize(old_normalize(w)) for w in words]
+
+    paths = {
+        "ayat": (
+            lambda: [old_tokenize(old_normalize(t)) for t in texts],
+            lambda: [text_tokens(t) for t in texts],
+        ),
+        "words": (
+            lambda: [old_tokenize(old_normalize(w)) for w in words],
+            lambda: normalize_tokens(words),
+        ),
+        "lenient": (
+            lambda: [old_lenient(t) for t in texts],
+            lambda: [lenient_new(t) for t in texts],
+        ),
+    }
+
+    result = {"reference": source, "ayat": len(texts), "words": len(words), "repeat": repeat, "paths": {}}
+    for name, (old, new) in paths.items():
+        old_s = best_of(old, repeat)
+        cold_s = best_of(new, repeat, before=word_tokens.cache_clear)
+        new()
+        warm_s = best_of(new, repeat)
+        result["paths"][name] = {
+            "old_s": round(old_s, 4),
+            "cold_s": round(cold_s, 4),
+            "warm_s": round(warm_s, 4),
+            "speedup_cold": round(old_s / cold_s, 2),
+            "speedup_warm": round(old_s / warm_s, 2),
+        }
+    info = word_tokens.cache_info()
+    result["cache"] = {"entries": info.currsize, "maxsize": info.maxsize}
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Arabic normalization benchmark (old regex chain vs translate table).")
+    ap.add_argument("--repeat", type=int, default=5, help="best of N runs per path")
+    args = ap.parse_args()
+
+    result = run(args.repeat)
+    print(json.dumps(result, indent=2))
+    print(f"\n{'path':<8} {'old':>8} {'cold':>8} {'warm':>8} {'x cold':>7} {'x warm':>7}", file=sys.stderr)
+    for name, r in result["paths"].items():
+        print(f"{name:<8} {r['old_s']:>8.4f} {r['cold_s']:>8.4f} {r['warm_s']:>8.4f} "
+              f"{r['speedup_cold']:>7.2f} {r['speedup_warm']:>7.2f}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Cascade: موديل سريع (small/base) على التسجيل كامل، والموديل الكبير (medium) بس على المناطق
+اللي ما نثق فيها:
+  - كلمات probability حقها أقل من WORD_PROB_MIN
+  - كلمات ما تطابق المرجع (تحريف/زائد) أو كلمات مرجع ما انفكت (ناقص) بعد تحديد السورة
+المناطق (مع سياق) تندمج وتنفك batched بالموديل الكبير، وكلماتها تحل محل كلمات السريع.
+لو ما انحددت السورة من ناتج السريع أو المناطق أكثر من ESCALATE_MAX_FRACTION من التسجيل
+-> الموديل الكبير على التسجيل كامل (نفس بدون cascade).
+
+يحتاج asr_worker محمّل فيه الموديلين: python -m app.asr_worker --model medium --cascade-model small
+"""
+import time
+from typing import NamedTuple
+
+from app.alignment import levenshtein_ops
+from app.arabic import normalize_tokens, text_tokens
+from app.audio import load_pcm
+from app.gap_repair import decode_windows
+from app.metrics import stage
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+WORD_PROB_MIN = 0.6              # أقل من كذا = الموديل السريع مو متأكد
+ESCALATE_PAD = 1.0               # ثواني سياق حول كل كلمة مشكوك فيها
+MERGE_GAP = 2.0                  # منطقتين أقرب من كذا = وحدة (أرخص من نافذتين)
+MAX_WINDOW_SECONDS = 30.0        # Whisper يشوف 30 ثانية بالكثير لكل clip
+ESCALATE_MAX_FRACTION = 0.6      # أكثر من كذا -> الموديل الكبير على الكل
+
+
+class CascadeInfo(NamedTuple):
+    duration: float
+    seconds: float               # وقت الـ cascade كامل (wall)
+    fast_seconds: float
+    escalated_audio: float       # ثواني صوت انفكت بالموديل الكبير
+    regions: int
+    full_fallback: bool
+
+    @property
+    def rtf(self):
+        return self.seconds / self.duration if self.duration else 0.0
+
+    @property
+    def escalated_fraction(self):
+        return self.escalated_audio / self.duration if self.duration else 0.0
+
+
+def segments_to_words(segments):
+    words = []
+    for s in segments:
+        for w in getattr(s, "words", None) or ():
+            word = (w.word or "").strip()
+            if word:
+                words.append({
+                    "word": word,
+                    "start": float(w.start),
+                    "end": float(w.end),
+                    "probability": getattr(w, "probability", None),
+                })
+    return words
+
+
+def merge_regions(spans, duration, pad=ESCALATE_PAD, gap=MERGE_GAP, max_len=MAX_WINDOW_SECONDS):
+    regions = []
+    for start, end in sorted(spans):
+        start, end = max(0.0, start - pad), min(duration, end + pad)
+        if regions and start - regions[-1][1] <= gap and end - regions[-1][0] <= max_len:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    # منطقة أطول من max_len (كلمة طويلة جداً/فجوة) تنقسم
+    out = []
+    for start, end in regions:
+        while end - start > 0:
+            out.append((start, min(end, start + max_len)))
+            start = min(end, start + max_len)
+    return out
+
+
+def flag_regions(words, ref_tokens, duration):
+    """مناطق (start, end) لازم تنفك بالموديل الكبير."""
+    spans = [
+        (w["start"], w["end"]) for w in words
+        if w.get("probability") is not None and w["probability"] < WORD_PROB_MIN
+    ]
+
+    word_toks = normalize_tokens([w["word"] for w in words])
+    hyp_tokens, hyp_word = [], []
+    for k, toks in enumerate(word_toks):
+        hyp_tokens.extend(toks)
+        hyp_word.extend([k] * len(toks))
+
+    prev_end, missing = 0.0, False
+    for kind, ri, hj in levenshtein_ops(ref_tokens, hyp_tokens):
+        if kind == "delete":
+            missing = True
+            continue
+        w = words[hyp_word[hj]]
+        if missing:
+            spans.append((prev_end, w["start"]))
+            missing = False
+        if kind != "equal":
+            spans.append((w["start"], w["end"]))
+        prev_end = w["end"]
+    if missing:
+        spans.append((prev_end, duration))
+    return merge_regions(spans, duration)
+
+
+def splice_words(words, regions, decoded):
+    """كلمات السريع داخل المناطق تطلع، وكلمات الكبير داخلها تدخل بدالها."""
+    def inside(w):
+        mid = (w["start"] + w["end"]) / 2
+        return any(a <= mid < b for a, b in regions)
+
+    kept = [w for w in words if not inside(w)]
+    added = [w for k, ws in enumerate(decoded) for w in ws
+             if regions[k][0] <= (w["start"] + w["end"]) / 2 < regions[k][1]]
+    return sorted(kept + added, key=lambda w: w["start"])
+
+
+def transcribe_cascade(asr, wav_path, kwargs, index, fast_model, duration):
+    """
+    asr: AsrClient (الـ worker فيه fast_model + الافتراضي). يرجع (words, CascadeInfo).
+    words بنفس شكل collect_words: [{"word", "start", "end", "probability"}].
+    """
+    t0 = time.perf_counter()
+    with stage("cascade_fast", audio_seconds=duration, model=fast_model) as span:
+        segments, _ = asr.transcribe(wav_path, model=fast_model, **kwargs)
+        words = segments_to_words(segments)
+        span.items = len(words)
+    fast_seconds = time.perf_counter() - t0
+
+    detection = index.locate(text_tokens(" ".join(w["word"] for w in words)))
+    regions = []
+    if detection is not None:
+        ref_tokens = index.surah_words(detection.surahid, detection.startayah, detection.endayah)
+        regions = flag_regions(words, ref_tokens, duration)
+    escalated = sum(b - a for a, b in regions)
+
+    full = detection is None or escalated > ESCALATE_MAX_FRACTION * duration
+    with stage("cascade_escalate", audio_seconds=duration if full else escalated,
+               regions=len(regions), full=full) as span:
+        if full:
+            segments, _ = asr.transcribe(wav_path, **kwargs)
+            words = segments_to_words(segments)
+            escalated = duration
+        elif regions:
+            # نفس إعدادات الـ job (beam/temperature...) مو REPAIR_KWARGS حق الفجوات
+            decoded = decode_windows(asr, load_pcm(wav_path), regions, kwargs)
+            words = splice_words(words, regions, decoded)
+        span.items = len(words)
+
+    info = CascadeInfo(duration, time.perf_counter() - t0, fast_seconds, escalated, len(regions), full)
+    return words, info
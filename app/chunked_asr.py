@@ -0,0 +1,169 @@
+"""
+Transcribe متوازي للتسجيلات الطويلة (سورة كاملة 30-60 دقيقة).
+
+  (1) سكتات بالطاقة (RMS) على التسجيل كامل -> نقص عند منتصف السكتات فقط (ما نقطع كلمة)
+      بدون faster_whisper: الويب ما يحمّل VAD (ولا موديل) أبدًا
+  (2) كل chunk يتفرغ لـ process (أو لطلب متوازي للـ asr_worker)
+  (3) نرجع segments + words لخط زمني واحد (offset لكل chunk)، بنفس ترتيب
+      الـ single pass (بالـ chunk ثم داخل الـ chunk)
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.asr_client import segment_from_dict, segment_to_dict
+from app.audio import ENERGY_FRAME_MS, SAMPLE_RATE, quiet_frames
+from app.metrics import stage
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+CHUNK_SECONDS = 120              # طول الـ chunk التقريبي (يتمدد لأقرب سكتة)
+MAX_CHUNK_SECONDS = 300          # لو ما فيه سكتة نقص غصب هنا
+SPLIT_MIN_SILENCE_MS = 500       # أقل سكتة نعتبرها مكان قص
+
+
+def silence_midpoints(pcm: np.ndarray, min_silence_ms=SPLIT_MIN_SILENCE_MS) -> list:
+    """
+    منتصف كل سكتة (بالـ samples) طولها >= min_silence_ms.
+    السكتة من quiet_frames (طاقة، بدون VAD).
+    """
+    frame = int(SAMPLE_RATE * ENERGY_FRAME_MS / 1000)
+    quiet = quiet_frames(pcm)
+    n = len(quiet)
+    if n == 0:
+        return []
+
+    # حدود كل run من frames هادية
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], quiet.astype(np.int8), [0]))))
+    min_frames = max(1, min_silence_ms // ENERGY_FRAME_MS)
+    return [int(a + b) * frame // 2 for a, b in zip(edges[::2], edges[1::2])
+            if b - a >= min_frames and a > 0 and b < n]
+
+
+def split_points(pcm: np.ndarray, chunk_seconds=CHUNK_SECONDS,
+                 max_chunk_seconds=MAX_CHUNK_SECONDS) -> list:
+    """
+    يرجع [(start, end)] بالـ samples تغطي التسجيل كامل بدون فجوات.
+    القص في منتصف السكتة اللي بين speech regions.
+    """
+    n = len(pcm)
+    target = int(chunk_seconds * SAMPLE_RATE)
+    hard = int(max_chunk_seconds * SAMPLE_RATE)
+    if n <= target:
+        return [(0, n)]
+
+    # أماكن القص الممكنة = منتصف كل سكتة
+    cuts = silence_midpoints(pcm)
+
+    bounds, start = [], 0
+    for c in cuts:
+        while c - start > hard:
+            bounds.append((start, start + hard))
+            start += hard
+        if c - start >= target:
+            bounds.append((start, c))
+            start = c
+    while n - start > hard:
+        bounds.append((start, start + hard))
+        start += hard
+    bounds.append((start, n))
+    return bounds
+
+
+def _shift(seg: dict, offset: float, seek_offset: int) -> dict:
+    seg = dict(seg, start=seg["start"] + offset, end=seg["end"] + offset,
+               seek=seg["seek"] + seek_offset)
+    if seg.get("words") is not None:
+        seg["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset)
+                        for w in seg["words"]]
+    return seg
+
+
+def stitch(chunk_results, bounds) -> list:
+    """segments كل chunk (أوقات نسبية) -> خط زمني واحد، و ids متسلسلة."""
+    out = []
+    for (start, _), segs in zip(bounds, chunk_results):
+        offset = start / SAMPLE_RATE
+        for seg in segs:
+            out.append(_shift(seg, offset, int(offset * 100)))
+    for i, seg in enumerate(out, start=1):
+        seg["id"] = i
+    return out
+
+
+# ----------------------------
+# Process pool (موديل محلي لكل process)
+# ----------------------------
+_model = None
+
+
+def _init_process(model_name, device, compute_type, cpu_threads):
+    global _model
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(model_name, device=device, compute_type=compute_type,
+                          cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(audio, start, end, kwargs):
+    # audio: مسار memmap (float32 خام) أو slice جاهز
+    if isinstance(audio, str):
+        audio = np.memmap(audio, dtype=np.float32, mode="r")
+    clip = np.ascontiguousarray(audio[start:end], dtype=np.float32)
+    segments, _ = _model.transcribe(clip, **kwargs)
+    return [segment_to_dict(s) for s in segments]
+
+
+def transcribe_parallel(pcm: np.ndarray, kwargs: dict, workers: int,
+                        asr=None, model_name="medium", device="cpu",
+                        compute_type="int8", cpu_threads=0,
+                        chunk_seconds=CHUNK_SECONDS):
+    """
+    نفس model.transcribe لكن chunks متوازية -> (segments list, info).
+    asr: AsrClient -> طلبات متوازية للـ worker (لازم --num-workers >= workers).
+    بدونه: ProcessPoolExecutor وكل process يحمّل موديله (cpu_threads مقسومة بينهم).
+    """
+    with stage("vad", audio_seconds=len(pcm) / SAMPLE_RATE) as span:
+        bounds = split_points(pcm, chunk_seconds)
+        span.items = len(bounds)
+    workers = max(1, min(workers, len(bounds)))
+
+    if asr is not None:
+        def run(b):
+            segs, _ = asr.transcribe(pcm[b[0]:b[1]], **kwargs)
+            return [segment_to_dict(s) for s in segs]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr-chunk") as ex:
+            results = list(ex.map(run, bounds))
+    else:
+        threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+        # memmap -> كل process يفتح نفس الملف بدل ما ننسخ الصوت لكل task
+        source = None
+        if (isinstance(pcm, np.memmap) and pcm.offset == 0
+                and pcm.nbytes == os.path.getsize(pcm.filename)):
+            source = pcm.filename
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_process,
+            initargs=(model_name, device, compute_type, threads),
+        ) as ex:
+            futures = [
+                ex.submit(_transcribe_chunk, source or pcm[s:e],
+                          s if source else 0, e if source else e - s, kwargs)
+                for s, e in bounds
+            ]
+            results = [f.result() for f in futures]
+
+    segments = [segment_from_dict(d) for d in stitch(results, bounds)]
+    info = SimpleNamespace(
+        language=kwargs.get("language"),
+        duration=len(pcm) / SAMPLE_RATE,
+        chunks=len(bounds),
+        workers=workers,
+    )
+    return segments, info
@@ -14,4 +14,46 @@ class Config:
     if SQLALCHEMY_DATABASE_URI.startswith("postgres://"):
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
 
-    SQLALCHEMY_TRACK_MODIFICATIONS = False 
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # ✅ Quran reference index (يتبنى مرة وحدة، ولو انحط مسار يتشارك memory-mapped بين workers)
+    QURAN_INDEX_DIR = os.getenv("QURAN_INDEX_DIR")
+    QURAN_INDEX_CHECK_SECONDS = int(os.getenv("QURAN_INDEX_CHECK_SECONDS", "60"))
+    QURAN_INDEX_PRELOAD = os.getenv("QURAN_INDEX_PRELOAD", "1") == "1"
+
+    # ✅ ASR worker (process منفصل فيه WhisperModel واحد دافي: python -m app.asr_worker)
+    ASR_SOCKET = os.getenv("ASR_SOCKET", "/tmp/tayaqan-asr.sock")
+    ASR_MODEL = os.getenv("ASR_MODEL", "medium")
+    # ✅ cascade: موديل سريع على كل التسجيل والـ ASR_MODEL بس للمناطق المشكوك فيها (فاضي = مقفل)
+    ASR_CASCADE_MODEL = os.getenv("ASR_CASCADE_MODEL", "")
+    # ✅ probe: أول 30 ثانية بموديل سريع -> السورة قبل الـ decode الكامل (العرض المباشر يبدأ بدري)
+    #    ASR_PROBE_MODEL فاضي = ASR_CASCADE_MODEL لو موجود وإلا ASR_MODEL
+    #    الافتراضي مقفل إلا لو فيه موديل سريع (probe بالـ ASR_MODEL نفسه = decode زيادة بدون فايدة)
+    ASR_PROBE_MODEL = os.getenv("ASR_PROBE_MODEL", "")
+    ASR_PROBE = os.getenv("ASR_PROBE", "1" if ASR_PROBE_MODEL or ASR_CASCADE_MODEL else "0") == "1"
+    # ✅ forced alignment لما السورة معروفة: موديل CTC (.onnx) في الـ worker (فاضي = مقفل)
+    FORCED_ALIGN_MODEL = os.getenv("FORCED_ALIGN_MODEL", "")
+    FORCED_ALIGN_VOCAB = os.getenv("FORCED_ALIGN_VOCAB", "")
+    ASR_DEVICE = os.getenv("ASR_DEVICE", "cpu")
+    ASR_COMPUTE_TYPE = os.getenv("ASR_COMPUTE_TYPE", "int8")
+    ASR_CPU_THREADS = int(os.getenv("ASR_CPU_THREADS", "0"))
+    ASR_NUM_WORKERS = int(os.getenv("ASR_NUM_WORKERS", "1"))
+    # ✅ cache للـ transcription (نفس الصوت + نفس الإعدادات = بدون Whisper). فاضي = مقفل
+    ASR_CACHE_DIR = os.getenv("ASR_CACHE_DIR", "/tmp/tayaqan-asr-cache")
+    ASR_CACHE_MAX_MB = int(os.getenv("ASR_CACHE_MAX_MB", "2048"))
+    # ✅ التسجيلات الطويلة: chunks عند السكتات تتفرغ بالتوازي (1 = single pass)
+    #    مع asr_worker لازم ASR_NUM_WORKERS >= ASR_PARALLEL
+    ASR_PARALLEL = int(os.getenv("ASR_PARALLEL", "1"))
+    ASR_CHUNK_SECONDS = int(os.getenv("ASR_CHUNK_SECONDS", "120"))
+
+    # ✅ فجوات في الـ transcription (كلمات مرجع ما انفكت): نعيد فك ثوانيها بس (app/gap_repair.py)
+    GAP_REPAIR = os.getenv("GAP_REPAIR", "1") == "1"
+
+    # ✅ توقيت المراحل: سطر JSON لكل مرحلة على stderr (logger tayaqan.metrics) + /metrics
+    METRICS_LOG = os.getenv("METRICS_LOG", "1") == "1"
+    # ✅ /metrics مشترك بين gunicorn workers: كل worker يكتب أرقامه هنا (فاضي = لكل process)
+    #    يتفضى مع كل deploy (counters تبدأ من صفر زي أي restart)
+    METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/tayaqan-metrics")
+
+    # ✅ Verification jobs (threads في نفس process الويب؛ الشغل الثقيل في asr_worker)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
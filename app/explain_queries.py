@@ -0,0 +1,188 @@
+"""
+EXPLAIN للـ queries الثقيلة (app/queries.py) على قاعدة فيها بيانات بحجم حقيقي.
+
+    python -m app.explain_queries --seed 1000000     # يعبي مستخدم تجريبي بمليون كلمة ثم EXPLAIN
+    python -m app.explain_queries                    # EXPLAIN على آخر بيانات مزروعة
+    python -m app.explain_queries --cleanup          # يحذف البيانات التجريبية
+
+PostgreSQL: EXPLAIN (ANALYZE, BUFFERS). SQLite: EXPLAIN QUERY PLAN + الوقت.
+يرجع exit code 1 لو أي query سوت Seq Scan على recitation_word_details / recitation_inputs.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import RecitationInput, RecitationWordDetails, VerifierUser
+from app.persistence import WORD_COLUMNS, bulk_insert
+from app.queries import history_query, word_details_query, word_errors_query
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+SEED_EMAIL = "explain-seed@tayaqan.local"
+WORDS_PER_INPUT = 500
+WORDS_PER_AYAH = 12
+ERROR_RATE = 0.05
+SEED_BATCH = 50_000              # صفوف لكل commit أثناء الزرع
+HISTORY_PAGE = 21                # نفس limit صفحة السجل (HISTORY_PAGE_SIZE + 1)
+
+HOT_TABLES = ("recitation_word_details", "recitation_inputs")
+PG_BAD = re.compile(r"Seq Scan on (%s)\b" % "|".join(HOT_TABLES))
+SQLITE_BAD = re.compile(r"\bSCAN (%s)\b(?! USING)" % "|".join(HOT_TABLES))
+
+
+# ----------------------------
+# Seed
+# ----------------------------
+def _seed_user():
+    user = VerifierUser.query.filter_by(verifieremail=SEED_EMAIL).first()
+    if user is None:
+        user = VerifierUser(verifiername="explain-seed", verifieremail=SEED_EMAIL, verifierpassword="-")
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def seed(total_words, rnd):
+    user = _seed_user()
+    statuses = ("ناقص", "زائد", "تحريف")
+    n_inputs = max(1, total_words // WORDS_PER_INPUT)
+    base = datetime(2024, 1, 1)
+    t0 = time.perf_counter()
+
+    rows = []
+    for i in range(n_inputs):
+        rec = RecitationInput(
+            verifierid=user.verifierid, inputtype="seed", filepathorlink=f"seed/{i}.wav",
+            processingdate=base + timedelta(minutes=rnd.randrange(500_000)),
+            totalwords=WORDS_PER_INPUT,
+        )
+        db.session.add(rec)
+        db.session.flush()
+
+        missing = extra = wrong = 0
+        for k in range(WORDS_PER_INPUT):
+            status = rnd.choice(statuses) if rnd.random() < ERROR_RATE else "صحيح"
+            missing += status == "ناقص"
+            extra += status == "زائد"
+            wrong += status == "تحريف"
+            rows.append({
+                "inputid": rec.inputid,
+                "referenceayahid": None,
+                "ayahnumber": k // WORDS_PER_AYAH + 1,
+                "word_index": k % WORDS_PER_AYAH + 1,
+                "expected_word": "كلمة",
+                "spoken_word": None if status == "ناقص" else "كلمة",
+                "status": status,
+                "starttime": round(k * 0.45, 2),
+                "endtime": None,
+            })
+        rec.correctwords = WORDS_PER_INPUT - missing - extra - wrong
+        rec.missingcount, rec.extracount, rec.wrongcount = missing, extra, wrong
+
+        if len(rows) >= SEED_BATCH or i == n_inputs - 1:
+            bulk_insert(RecitationWordDetails, WORD_COLUMNS, rows)
+            db.session.commit()
+            rows = []
+            print(f"seeded {i + 1}/{n_inputs} inputs ({time.perf_counter() - t0:.1f}s)", flush=True)
+
+    # إحصائيات الـ planner بعد الزرع
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+
+def cleanup():
+    user = VerifierUser.query.filter_by(verifieremail=SEED_EMAIL).first()
+    if user is None:
+        return
+    ids = db.session.query(RecitationInput.inputid).filter_by(verifierid=user.verifierid)
+    RecitationWordDetails.query.filter(RecitationWordDetails.inputid.in_(ids)).delete(synchronize_session=False)
+    RecitationInput.query.filter_by(verifierid=user.verifierid).delete(synchronize_session=False)
+    db.session.delete(user)
+    db.session.commit()
+
+
+# ----------------------------
+# Explain
+# ----------------------------
+def _driver_sql(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[k] for k in compiled.positiontup)
+    return str(compiled), params
+
+
+def explain(query):
+    """يرجع (plan lines, ms)."""
+    sql, params = _driver_sql(query)
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == "postgresql":
+            res = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+            return [r[0] for r in res], None
+        plan = [" ".join(str(c) for c in r[1:]) for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)]
+        t0 = time.perf_counter()
+        conn.exec_driver_sql(sql, params).fetchall()
+        return plan, (time.perf_counter() - t0) * 1000
+
+
+def check(plan):
+    bad = PG_BAD if db.engine.dialect.name == "postgresql" else SQLITE_BAD
+    return [line for line in plan if bad.search(line)]
+
+
+def run(input_id, user_id):
+    queries = {
+        "results: word_details": word_details_query(input_id),
+        "history: word_errors": word_errors_query(input_id),
+        "history: first page": history_query(user_id).limit(HISTORY_PAGE),
+    }
+    failed = False
+    for name, q in queries.items():
+        plan, ms = explain(q)
+        bad = check(plan)
+        failed |= bool(bad)
+        print(f"\n== {name} {'SEQ SCAN' if bad else 'OK'}" + (f" ({ms:.2f} ms)" if ms is not None else ""))
+        for line in plan:
+            print("  " + line)
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="EXPLAIN the hot word-details/history queries.")
+    ap.add_argument("--seed", type=int, default=0, help="seed this many word rows first")
+    ap.add_argument("--cleanup", action="store_true", help="delete seeded rows and exit")
+    ap.add_argument("--input-id", type=int, help="input to explain (default: a seeded one)")
+    args = ap.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.cleanup:
+            cleanup()
+            return 0
+        if args.seed:
+            seed(args.seed, random.Random(0))
+
+        user = VerifierUser.query.filter_by(verifieremail=SEED_EMAIL).first()
+        input_id = args.input_id
+        if input_id is None:
+            if user is None:
+                print("no seeded data: run with --seed N or pass --input-id", file=sys.stderr)
+                return 2
+            ids = db.session.query(RecitationInput.inputid).filter_by(verifierid=user.verifierid)
+            input_id = ids.order_by(RecitationInput.inputid).offset(ids.count() // 2).limit(1).scalar()
+        user_id = user.verifierid if user else (
+            db.session.get(RecitationInput, input_id).verifierid)
+
+        print(f"dialect={db.engine.dialect.name} words={RecitationWordDetails.query.count()} input={input_id}")
+        return 1 if run(input_id, user_id) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
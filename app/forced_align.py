@@ -0,0 +1,270 @@
+"""
+Forced alignment: لما السورة معروفة (RecitationInput.surahid / surah_no في test_whisper_DB.py)
+ما نحتاج beam search مفتوح على كل العربي. موديل CTC صوتي (wav2vec2/MMS مصدّر ONNX، onnxruntime)
+يطلع احتمالات الحروف لكل frame، و Viterbi يمشي الصوت على كلمات المرجع بالترتيب:
+  -> لكل كلمة start/end + score (متوسط احتمال حروفها على الـ frames حقتها)
+الكلمات اللي score حقها واطي (تحريف/ناقص/زائد/سكوت طويل) -> مناطق تنفك بـ Whisper بس
+(نفس cascade: decode_windows + splice_words)، والباقي ياخذ كلمة المرجع كما هي.
+
+Viterbi على نوافذ ALIGN_WINDOW_SECONDS بنهاية حرة: نثبت الكلمات اللي خلصت قبل آخر
+COMMIT_MARGIN_SECONDS ونكمل من بعدها -> الذاكرة ثابتة مهما طال التسجيل، ولو القارئ وقف
+قبل نهاية السورة الكلمات الباقية ما تنحسب.
+
+الموديل في asr_worker (--ctc-model model.onnx، vocab.json جنبه بصيغة HF {"حرف": id}).
+"""
+import json
+import os
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from app.audio import SAMPLE_RATE, load_pcm
+from app.cascade import ESCALATE_MAX_FRACTION, merge_regions, segments_to_words, splice_words
+from app.gap_repair import decode_windows
+from app.metrics import stage
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+FRAME_STRIDE = 320               # samples لكل frame (wav2vec2/HuBERT/MMS = 20ms)
+CHUNK_SECONDS = 20.0             # الموديل ينفك على قطع (attention تكبر مع الطول)
+CHUNK_CONTEXT_SECONDS = 1.0      # سياق قبل/بعد كل قطعة (frames حقه تنشال)
+ALIGN_WINDOW_SECONDS = 30.0      # نافذة Viterbi
+COMMIT_MARGIN_SECONDS = 5.0      # كلمات تخلص قريب من نهاية النافذة تنعاد في اللي بعدها
+MAX_WORDS_PER_SECOND = 4.0       # سقف كلمات المرجع (التلاوة ~1.5-2.5 كلمة/ثانية)
+ALIGN_SCORE_MIN = 0.5            # أقل من كذا = الكلمة ما تطابق الصوت -> Whisper
+EDGE_MIN_SECONDS = 2.0           # صوت قبل أول/بعد آخر كلمة أطول من كذا -> Whisper (استعاذة/زيادة)
+
+BLANK_TOKENS = ("<pad>", "[PAD]", "<blank>", "<s>")
+WORD_SEPARATORS = ("|", " ")
+
+
+class AlignInfo(NamedTuple):
+    duration: float
+    seconds: float
+    aligned: int                 # كلمات مرجع انطبقت
+    escalated_audio: float
+    regions: int
+    full_fallback: bool
+
+    @property
+    def escalated_fraction(self):
+        return self.escalated_audio / self.duration if self.duration else 0.0
+
+
+def _log_softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    return x - np.log(np.exp(x).sum(axis=-1, keepdims=True))
+
+
+def ctc_viterbi(log_probs, targets, blank):
+    """
+    أفضل مسار CTC لـ targets على log_probs (T, V)، البداية من أول token والنهاية حرة.
+    يرجع state لكل frame: 2j+1 = targets[j]، زوجي = blank.
+    """
+    T, L = len(log_probs), len(targets)
+    ext = np.full(2 * L + 1, blank, dtype=np.int64)
+    ext[1::2] = targets
+    S = len(ext)
+    # s-2 -> s مسموح لو s حرف ومو نفس الحرف اللي قبله (لازم blank بين الحرفين المتكررين)
+    skip = np.zeros(S, dtype=bool)
+    skip[3::2] = ext[3::2] != ext[1:-2:2]
+
+    neg = np.float32(-1e30)
+    alpha = np.full(S, neg, dtype=np.float32)
+    alpha[0] = log_probs[0, ext[0]]
+    if S > 1:
+        alpha[1] = log_probs[0, ext[1]]
+    back = np.zeros((T, S), dtype=np.int8)
+    cand = np.empty((3, S), dtype=np.float32)
+    cols = np.arange(S)
+    for t in range(1, T):
+        cand[0] = alpha
+        cand[1, 0] = neg
+        cand[1, 1:] = alpha[:-1]
+        cand[2, :2] = neg
+        cand[2, 2:] = np.where(skip[2:], alpha[:-2], neg)
+        choice = cand.argmax(axis=0)
+        alpha = cand[choice, cols] + log_probs[t, ext]
+        back[t] = choice
+
+    path = np.empty(T, dtype=np.int64)
+    s = int(alpha.argmax())
+    for t in range(T - 1, -1, -1):
+        path[t] = s
+        s -= int(back[t, s])
+    return path
+
+
+class CtcAligner:
+    """onnxruntime session + vocab. align(pcm, words) -> [{"word", "start", "end", "score"}]."""
+
+    def __init__(self, model_path, vocab_path=None, threads=0):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        vocab_path = vocab_path or os.path.join(os.path.dirname(model_path), "vocab.json")
+        with open(vocab_path, encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.blank = next((self.vocab[t] for t in BLANK_TOKENS if t in self.vocab), 0)
+        self.separator = next((self.vocab[t] for t in WORD_SEPARATORS if t in self.vocab), None)
+
+    def emissions(self, pcm):
+        """log-probs (frames, vocab) للتسجيل كامل، قطعة قطعة مع سياق."""
+        chunk = int(CHUNK_SECONDS * SAMPLE_RATE) // FRAME_STRIDE * FRAME_STRIDE
+        ctx = int(CHUNK_CONTEXT_SECONDS * SAMPLE_RATE) // FRAME_STRIDE * FRAME_STRIDE
+        out = []
+        for start in range(0, len(pcm), chunk):
+            a, b = max(0, start - ctx), min(len(pcm), start + chunk + ctx)
+            x = np.asarray(pcm[a:b], dtype=np.float32)
+            x = (x - x.mean()) / (x.std() + 1e-7)          # نفس do_normalize حق wav2vec2
+            logits = self.session.run(None, {self.input_name: x[None, :]})[0][0]
+            skip = (start - a) // FRAME_STRIDE
+            keep = (min(len(pcm), start + chunk) - start) // FRAME_STRIDE
+            out.append(logits[skip:skip + keep])
+        if not out:
+            return np.zeros((0, len(self.vocab)), dtype=np.float32)
+        return _log_softmax(np.concatenate(out).astype(np.float32))
+
+    def _targets(self, words):
+        """tokens الحروف + owner (رقم الكلمة أو -1 للفاصل). كلمة بدون حروف في الـ vocab تنتخطى."""
+        targets, owner = [], []
+        for k, word in enumerate(words):
+            ids = [self.vocab[ch] for ch in word if ch in self.vocab]
+            if not ids:
+                continue
+            targets.extend(ids)
+            owner.extend([k] * len(ids))
+            if self.separator is not None:
+                targets.append(self.separator)
+                owner.append(-1)
+        return np.asarray(targets, dtype=np.int64), np.asarray(owner, dtype=np.int64)
+
+    def align(self, pcm, words):
+        log_probs = self.emissions(pcm)
+        return align_emissions(log_probs, self._targets(words), words, self.blank)
+
+
+def align_emissions(log_probs, targets_owner, words, blank):
+    """Viterbi على نوافذ. يرجع كلمات المرجع اللي انطبقت بالترتيب مع أوقاتها و score."""
+    targets, owner = targets_owner
+    T = len(log_probs)
+    sec = FRAME_STRIDE / SAMPLE_RATE
+    window = int(ALIGN_WINDOW_SECONDS / sec)
+    margin = int(COMMIT_MARGIN_SECONDS / sec)
+
+    # آخر token (حرف) لكل كلمة
+    last_target = {int(k): j for j, k in enumerate(owner) if k >= 0}
+
+    out = []
+    f0, j0 = 0, 0
+    while f0 < T and j0 < len(targets):
+        f1 = min(T, f0 + window)
+        last = f1 == T
+        # CTC يحتاج frame واحد على الأقل لكل حرف
+        j1 = min(len(targets), j0 + (f1 - f0) // 2)
+        path = ctc_viterbi(log_probs[f0:f1], targets[j0:j1], blank)
+
+        spans = {}                       # word -> [first, last, sum logp, frames, آخر token وصله]
+        for t, s in enumerate(path):
+            if s % 2 == 0:
+                continue
+            j = j0 + s // 2
+            k = int(owner[j])
+            if k < 0:
+                continue
+            span = spans.setdefault(k, [t, t, 0.0, 0, j])
+            span[1] = t
+            span[2] += float(log_probs[f0 + t, targets[j]])
+            span[3] += 1
+            span[4] = j
+
+        # تثبت الكلمة لو المسار خلص كل حروفها وانتهت قبل الهامش (أو آخر نافذة)
+        done = [
+            k for k, sp in sorted(spans.items())
+            if sp[4] == last_target[k] and (last or sp[1] < (f1 - f0) - margin)
+        ]
+        if not done:
+            f0 = f1 if last else max(f0 + 1, f1 - margin)
+            continue
+
+        for k in done:
+            first, end, logp, n, _ = spans[k]
+            out.append({
+                "word": words[k],
+                "start": round((f0 + first) * sec, 3),
+                "end": round((f0 + end + 1) * sec, 3),
+                "score": float(np.exp(logp / n)),
+                "index": k,
+            })
+        if last:
+            break
+        f0 += spans[done[-1]][1] + 1
+        j0 = last_target[done[-1]] + 1
+        if j0 < len(owner) and owner[j0] < 0:
+            j0 += 1                      # الفاصل بعد الكلمة
+    return out
+
+
+def flag_words(aligned, duration):
+    """
+    مناطق (start, end) لـ Whisper: كلمات score واطي (تحريف/ناقص/زائد ينضغط على كلمات المرجع)،
+    كلمات ما انطبقت بين كلمتين، وصوت قبل أول كلمة / بعد آخر كلمة (استعاذة، زيادة، ...).
+    """
+    spans = [(w["start"], w["end"]) for w in aligned if w["score"] < ALIGN_SCORE_MIN]
+    if aligned[0]["start"] >= EDGE_MIN_SECONDS:
+        spans.append((0.0, aligned[0]["start"]))
+    if duration - aligned[-1]["end"] >= EDGE_MIN_SECONDS:
+        spans.append((aligned[-1]["end"], duration))
+    prev = None
+    for w in aligned:
+        # كلمة مرجع ما لها حروف في vocab الموديل -> ما انطبقت
+        if prev is not None and w["index"] > prev["index"] + 1:
+            spans.append((prev["end"], w["start"]))
+        prev = w
+    return merge_regions(spans, duration)
+
+
+def transcribe_forced(asr, wav_path, kwargs, index, surahid, start_ayah, duration):
+    """
+    asr: AsrClient (الـ worker فيه --ctc-model): align + transcribe + transcribe_batched.
+    يرجع (words, AlignInfo)، words بنفس شكل collect_words (+ "forced": True لكلمات المرجع).
+    """
+    t0 = time.perf_counter()
+    ref = index.surah_words(surahid, start_ayah)
+    ref = ref[:max(1, int(duration * MAX_WORDS_PER_SECOND))]
+
+    with stage("forced_align", audio_seconds=duration, surah=surahid) as span:
+        aligned = asr.align(wav_path, ref)
+        span.items = len(aligned)
+
+    regions = flag_words(aligned, duration) if aligned else []
+    escalated = sum(b - a for a, b in regions)
+    words = [
+        {"word": w["word"], "start": w["start"], "end": w["end"], "probability": w["score"],
+         "forced": True}
+        for w in aligned
+    ]
+
+    full = not aligned or escalated > ESCALATE_MAX_FRACTION * duration
+    with stage("forced_escalate", audio_seconds=duration if full else escalated,
+               regions=len(regions), full=full) as span:
+        if full:
+            segments, _ = asr.transcribe(wav_path, **kwargs)
+            words = segments_to_words(segments)
+            escalated = duration
+        elif regions:
+            # نفس إعدادات الـ job (beam/temperature...) مو REPAIR_KWARGS حق الفجوات
+            decoded = decode_windows(asr, load_pcm(wav_path), regions, kwargs)
+            words = splice_words(words, regions, decoded)
+        span.items = len(words)
+
+    info = AlignInfo(duration, time.perf_counter() - t0, len(aligned), escalated, len(regions), full)
+    return words, info
@@ -0,0 +1,176 @@
+"""
+إصلاح الفجوات: كلمات مرجع ما انطبقت (runs من delete في levenshtein_ops) -> نافذة صوت بين
+الكلمتين اللي حولها -> نعيد فك النوافذ هذي بس (batched + word timestamps) -> نلصق الكلمات
+الجديدة بأوقاتها في مكانها.
+
+بدل transcribe_tail القديم (آخر 120 ثانية beam 10 والنص يتلصق في الآخر بدون أوقات):
+  - أي فجوة في أي مكان، مو بس النهاية
+  - الثواني الناقصة بس تنفك، مو دقيقتين كاملة
+  - ناخذ بس الكلمات اللي داخل الفجوة (بين الكلمتين حولها) -> ما فيه تكرار
+  - الكلمات تنلصق بس لو تطابق كلمات المرجع المتوقعة (ما نلصق هلوسة)
+  - الصوت بعد آخر كلمة فجوة بس لو فيه كلام فعلاً (طاقة)، ويتفك بدون no_speech_threshold=0
+بدون prompt من المرجع: لو القارئ فعلاً نقص كلمات ما نبغى الموديل يكتبها عنه.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from app.alignment import levenshtein_ops
+from app.arabic import normalize_tokens
+from app.audio import ENERGY_FRAME_MS, clip_pcm, pcm_duration, quiet_frames
+from app.metrics import stage
+from app.recheck import clip_words
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+GAP_MIN_WORDS = 2                # ناقص كلمة وحدة = خطأ عادي (المقارنة + recheck تكفي)
+GAP_MIN_SECONDS = 0.8            # فجوة أقصر من كذا ما فيها كلمتين
+GAP_PAD = 0.5                    # سياق قبل/بعد (كلماته ما تنلصق)
+MAX_WINDOW_SECONDS = 30.0        # Whisper يشوف 30 ثانية بالكثير لكل clip
+REPAIR_BATCH_SIZE = 8
+TAIL_MIN_SPEECH_SECONDS = 0.5    # صوت بعد آخر كلمة = فجوة بس لو فيه كلام بهالطول (مو سكتة/نَفَس)
+REPAIR_MIN_MATCH = 0.5           # نسبة tokens الإصلاح اللي لازم تطابق المرجع المتوقع
+
+REPAIR_KWARGS = dict(
+    language="ar",
+    beam_size=8,
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+    no_speech_threshold=0.0,     # الفجوة نعرف إن فيها تلاوة متوقعة
+    log_prob_threshold=-1.0,
+    compression_ratio_threshold=2.4,
+)
+# الذيل ممكن يكون سكتة أو تصفيق: نخلي الموديل يقول "ما فيه كلام"
+TAIL_KWARGS = dict(REPAIR_KWARGS, no_speech_threshold=0.6)
+
+
+class Gap(NamedTuple):
+    ref_start: int               # أول كلمة مرجع ناقصة
+    ref_end: int                 # بعد آخر وحدة (exclusive)
+    start: float                 # نهاية الكلمة اللي قبل (ثواني)
+    end: float                   # بداية الكلمة اللي بعد
+    tail: bool = False           # بعد آخر كلمة لين نهاية التسجيل
+
+
+def speech_seconds(pcm, start, end, quiet=None):
+    """ثواني الكلام (frames مو هادية) بين start و end."""
+    if quiet is None:
+        quiet = quiet_frames(pcm)
+    frame_s = ENERGY_FRAME_MS / 1000
+    return float(np.count_nonzero(~quiet[int(start / frame_s):int(end / frame_s)])) * frame_s
+
+
+def find_gaps(ref_tokens, words, pcm):
+    """
+    words: [{"word", "start", "end"}] (نفس collect_words) -> [Gap].
+    كلمات مرجع ناقصة في الآخر (ref_tokens ممكن تكمل لآخر السورة) = فجوة tail، بس لو
+    الصوت بعد آخر كلمة فيه كلام فعلاً — القارئ وقف = سكتة، مو كلمات ناقصة.
+    """
+    duration = pcm_duration(pcm)
+    word_toks = normalize_tokens([w["word"] for w in words])
+    hyp_tokens, hyp_word = [], []
+    for k, toks in enumerate(word_toks):
+        hyp_tokens.extend(toks)
+        hyp_word.extend([k] * len(toks))
+
+    ops = levenshtein_ops(ref_tokens, hyp_tokens) if ref_tokens else []
+    gaps = []
+    prev_end, run = 0.0, []
+
+    def close(next_start, tail=False):
+        if len(run) >= GAP_MIN_WORDS and next_start - prev_end >= GAP_MIN_SECONDS:
+            if tail and speech_seconds(pcm, prev_end, next_start) < TAIL_MIN_SPEECH_SECONDS:
+                return
+            gaps.append(Gap(run[0], run[-1] + 1, prev_end, next_start, tail))
+
+    for kind, ri, hj in ops:
+        if kind == "delete":
+            run.append(ri)
+            continue
+        if hj is not None:
+            w = words[hyp_word[hj]]
+            if run:
+                close(float(w["start"]))
+            prev_end = float(w["end"])
+        run = []
+    if run:
+        close(duration, tail=True)
+    return gaps
+
+
+def gap_windows(gaps, duration, pad=GAP_PAD, max_len=MAX_WINDOW_SECONDS):
+    """فجوة -> نافذة أو أكثر (بحد max_len). يرجع (windows [(start, end)], owner)."""
+    windows, owner = [], []
+    for g, gap in enumerate(gaps):
+        start, end = max(0.0, gap.start - pad), min(duration, gap.end + pad)
+        while end - start > 0:
+            stop = min(end, start + max_len)
+            windows.append((start, stop))
+            owner.append(g)
+            start = stop
+    return windows, owner
+
+
+def decode_clips(model, clips, kwargs, batch_size=REPAIR_BATCH_SIZE):
+    """
+    clips (float32) ملصوقة في BatchedInferencePipeline واحد -> [[{"word", "start", "end"}] لكل clip]
+    بأوقات من بداية الـ clip. model: AsrClient أو WhisperModel محلي.
+    """
+    # الـ clips محددة -> VAD حق الـ job (لو فيه) ما له دور هنا
+    kwargs = {k: v for k, v in kwargs.items() if k != "vad_parameters"}
+    return clip_words(model, clips, dict(kwargs, vad_filter=False), batch_size)
+
+
+def decode_windows(model, pcm, windows, kwargs=REPAIR_KWARGS, batch_size=REPAIR_BATCH_SIZE):
+    """كل النوافذ في BatchedInferencePipeline واحد -> [[{"word", "start", "end"}] لكل نافذة] بأوقات التسجيل."""
+    decoded = decode_clips(model, [clip_pcm(pcm, a, b) for a, b in windows], kwargs, batch_size)
+    return [
+        [dict(w, start=w["start"] + a, end=w["end"] + a) for w in ws]
+        for (a, _), ws in zip(windows, decoded)
+    ]
+
+
+def matches_reference(ws, expected):
+    """كلمات الإصلاح تطابق (بالترتيب) كلمات المرجع المتوقعة بنسبة >= REPAIR_MIN_MATCH."""
+    hyp = [t for toks in normalize_tokens([w["word"] for w in ws]) for t in toks]
+    if not hyp or not expected:
+        return False
+    equal = sum(1 for kind, _, _ in levenshtein_ops(expected, hyp) if kind == "equal")
+    return equal >= REPAIR_MIN_MATCH * len(hyp)
+
+
+def repair_gaps(model, pcm, gaps, words, ref_tokens):
+    """
+    يعيد فك الفجوات ويلصق الكلمات (اللي نصها داخل الفجوة) بين words — بس لو تطابق
+    ref_tokens[gap.ref_start:gap.ref_end] (نفس ref_tokens اللي راحت لـ find_gaps).
+    يرجع (words جديدة مرتبة بالوقت, عدد الكلمات المضافة). المضاف عليه "repaired": True.
+    """
+    windows, owner = gap_windows(gaps, pcm_duration(pcm))
+    with stage("gap_repair", audio_seconds=sum(b - a for a, b in windows), gaps=len(gaps)) as span:
+        # نوافذ الذيل بـ TAIL_KWARGS (batch لحاله)، والباقي REPAIR_KWARGS
+        decoded = [None] * len(windows)
+        for tail, kwargs in ((False, REPAIR_KWARGS), (True, TAIL_KWARGS)):
+            idx = [k for k, g in enumerate(owner) if gaps[g].tail == tail]
+            for k, ws in zip(idx, decode_windows(model, pcm, [windows[k] for k in idx], kwargs)):
+                decoded[k] = ws
+
+        found = [[] for _ in gaps]
+        for k, ws in enumerate(decoded):
+            gap = gaps[owner[k]]
+            found[owner[k]].extend(w for w in ws if gap.start <= (w["start"] + w["end"]) / 2 < gap.end)
+
+        added, rejected = [], 0
+        for gap, ws in zip(gaps, found):
+            if matches_reference(ws, ref_tokens[gap.ref_start:gap.ref_end]):
+                added.extend(dict(w, repaired=True) for w in ws)
+            elif ws:
+                rejected += 1
+        span.items = len(added)
+        span.fields["rejected"] = rejected
+
+    if not added:
+        return words, 0
+    return sorted(words + added, key=lambda w: w["start"]), len(added)
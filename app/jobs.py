@@ -0,0 +1,72 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app import db
+from app.models import VerificationJob
+
+log = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get("JOB_WORKERS", 2),
+                thread_name_prefix="verify",
+            )
+        return _executor
+
+
+def _run(app, job_id):
+    from app.pipeline import run_verification
+
+    with app.app_context():
+        try:
+            run_verification(job_id)
+        except Exception as e:
+            log.exception("verification job %s failed", job_id)
+            db.session.rollback()
+            job = db.session.get(VerificationJob, job_id)
+            if job is not None:
+                job.stage = "failed"
+                job.error = str(e)
+                db.session.commit()
+        finally:
+            db.session.remove()
+
+
+def submit_verification(rec, audiopath=None):
+    """
+    ينشئ VerificationJob للـ RecitationInput ويحطه في الطابور.
+    الـ pipeline كامل (download -> ... -> persist) يشتغل خارج الطلب.
+    """
+    job = VerificationJob(
+        jobid=str(uuid.uuid4()),
+        inputid=rec.inputid,
+        stage="queued",
+        audiopath=audiopath,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor(app).submit(_run, app, job.jobid)
+    return job
+
+
+def job_status(job):
+    return {
+        "job_id": job.jobid,
+        "input_id": job.inputid,
+        "stage": job.stage,
+        "error": job.error,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
@@ -0,0 +1,177 @@
+"""
+مقارنة تدريجية (incremental) مع المرجع وهي الـ segments تطلع من Whisper.
+
+بدل ما ننتظر list(segments) كامل:
+  - نجمع الكلمات لين نقدر نحدد السورة (index.locate)
+  - كل ما توصل كلمات جديدة نقارن الذيل اللي ما انحسم مع نافذة من المرجع
+  - الآية تنحسم (وتنرسل) لما يجي بعد آخر كلمة فيها CONFIRM_MATCHES كلمات صحيحة
+    من الآيات اللي بعدها — يعني القارئ أكيد تعداها
+  - الذيل ما يزيد عن MAX_TAIL_TOKENS: لو ما انحسم شي (تلاوة بعيدة عن المرجع) نقص غصب
+    -> كل feed يكلف O(MAX_TAIL_TOKENS * band) مو يكبر مع التسجيل
+
+النتيجة النهائية (اللي تنحفظ) ما زالت build_report على التسجيل كامل؛ هذا للعرض المباشر.
+"""
+from app.alignment import levenshtein_ops, ops_to_rows, words_to_tokens
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+MIN_DETECT_TOKENS = 12           # أقل عدد كلمات قبل ما نحاول نحدد السورة
+CONFIRM_MATCHES = 3              # كلمات صحيحة بعد نهاية الآية عشان نعتبرها منتهية
+REF_SLACK = 1.5                  # نافذة المرجع = طول الذيل * كذا + REF_EXTRA
+REF_EXTRA = 20
+MAX_TAIL_TOKENS = 300            # أطول ذيل نقارنه؛ أكثر منه = نحسم نصه غصب
+
+
+class IncrementalAligner:
+    def __init__(self, index, surahid=None, start_ayah=1, min_detect_tokens=MIN_DETECT_TOKENS,
+                 per_word=False):
+        self.index = index
+        self.min_detect_tokens = min_detect_tokens
+        # per_word: نحسم أي كلمة تأكدت (للتسميع المباشر) بدل ما ننتظر نهاية الآية
+        self.per_word = per_word
+        self.detection = None
+
+        self.hyp, self.times = [], []
+        self.ref = self.ref_to_ayah = None
+        self.ref_pos = 0             # أول كلمة مرجعية ما انحسمت
+        self.hyp_pos = 0             # أول كلمة من Whisper ما انحسمت
+
+        if surahid is not None:
+            self.set_reference(surahid, start_ayah)
+
+    def set_reference(self, surahid, start_ayah=1):
+        # من آية البداية لآخر السورة (النهاية ما نعرفها لين يخلص التسجيل)
+        self.ref = self.index.surah_words(surahid, start_ayah)
+        self.ref_to_ayah = self.index.surah_word_ayahs(surahid, start_ayah)
+
+    def feed(self, words):
+        """
+        words: [{"word", "start"}] (نفس collect_words).
+        يرجع الآيات اللي انحسمت الحين: [{"ayah_number", "rows", "counts"}].
+        """
+        toks, times = words_to_tokens(words)
+        self.hyp.extend(toks)
+        self.times.extend(times)
+
+        if self.ref is None:
+            if len(self.hyp) < self.min_detect_tokens:
+                return []
+            self.detection = self.index.locate(self.hyp)
+            if self.detection is None:
+                return []
+            self.set_reference(self.detection.surahid, self.detection.startayah)
+
+        return self._drain(final=False)
+
+    def finish(self):
+        """آخر التسجيل: نحسم الباقي (لين آخر آية فيها كلمة صحيحة)."""
+        if self.ref is None:
+            return []
+        return self._drain(final=True)
+
+    # ----------------------------
+    def _drain(self, final):
+        # ذيل أطول من MAX_TAIL_TOKENS: نحسم على دفعات لين يرجع تحت الحد
+        out = []
+        while True:
+            over = len(self.hyp) - self.hyp_pos > MAX_TAIL_TOKENS
+            groups = self._advance(final and not over, forced=over)
+            out.extend(groups)
+            if not groups or not over:
+                return out
+
+    def _advance(self, final, forced=False):
+        tail = self.hyp[self.hyp_pos:self.hyp_pos + MAX_TAIL_TOKENS]
+        if not tail or self.ref_pos >= len(self.ref):
+            return []
+
+        win_end = min(len(self.ref), self.ref_pos + int(len(tail) * REF_SLACK) + REF_EXTRA)
+        ops = [
+            (k,
+             None if ri is None else ri + self.ref_pos,
+             None if hj is None else hj + self.hyp_pos)
+            for k, ri, hj in levenshtein_ops(self.ref[self.ref_pos:win_end], tail)
+        ]
+
+        cut = self._final_cut(ops) if final else self._confirmed_cut(ops)
+        if cut < 0 and forced:
+            cut = self._forced_cut(ops)
+        if cut < 0:
+            return []
+
+        done = ops[:cut + 1]
+        for _, ri, hj in done:
+            if ri is not None:
+                self.ref_pos = ri + 1
+            if hj is not None:
+                self.hyp_pos = hj + 1
+        return self._group(done)
+
+    def _confirmed_cut(self, ops):
+        # suffix[p] = عدد الـ equal من p لآخر ops
+        suffix = [0] * (len(ops) + 1)
+        for p in range(len(ops) - 1, -1, -1):
+            suffix[p] = suffix[p + 1] + (ops[p][0] == "equal")
+
+        cut = -1
+        for p, (_, ri, _) in enumerate(ops):
+            if ri is None or not (self.per_word or self._ayah_ends_at(ri)):
+                continue
+            if suffix[p + 1] >= CONFIRM_MATCHES:
+                cut = p
+        return cut
+
+    def _forced_cut(self, ops):
+        # أول نص الذيل: نقص عند آخر نهاية آية فيه، وإلا عند النص بالضبط
+        limit = self.hyp_pos + MAX_TAIL_TOKENS // 2
+        cut = ayah_cut = -1
+        for p, (_, ri, hj) in enumerate(ops):
+            if hj is not None and hj >= limit:
+                break
+            cut = p
+            if ri is not None and self._ayah_ends_at(ri):
+                ayah_cut = p
+        return ayah_cut if ayah_cut >= 0 else cut
+
+    def _final_cut(self, ops):
+        # الآيات اللي بعد آخر كلمة صحيحة ما انقرت أصلاً (مو ناقصة) -> ما نرسلها
+        last_ayah = None
+        for kind, ri, _ in ops:
+            if kind == "equal":
+                last_ayah = self.ref_to_ayah[ri]
+        cut = len(ops) - 1
+        if last_ayah is not None:
+            while cut >= 0 and ops[cut][0] == "delete" and self.ref_to_ayah[ops[cut][1]] != last_ayah:
+                cut -= 1
+        return cut
+
+    def _ayah_ends_at(self, ri):
+        return ri + 1 >= len(self.ref_to_ayah) or self.ref_to_ayah[ri + 1] != self.ref_to_ayah[ri]
+
+    def _group(self, ops):
+        rows, _ = ops_to_rows(ops, self.ref, self.ref_to_ayah, self.hyp, self.times)
+
+        # الزائد يتعلق بآية الكلمة المرجعية اللي قبله (أو اللي بعده لو هو أول شي)
+        ayah_of = []
+        last = None
+        for r in rows:
+            if r["ayah_number"] is not None:
+                last = r["ayah_number"]
+            ayah_of.append(last)
+        nxt = None
+        for i in range(len(rows) - 1, -1, -1):
+            if rows[i]["ayah_number"] is not None:
+                nxt = rows[i]["ayah_number"]
+            if ayah_of[i] is None:
+                ayah_of[i] = nxt
+
+        out = []
+        for r, a in zip(rows, ayah_of):
+            if not out or out[-1]["ayah_number"] != a:
+                out.append({"ayah_number": a, "rows": [], "counts": dict.fromkeys(
+                    ("correct", "addition", "deletion", "substitution"), 0)})
+            out[-1]["rows"].append(r)
+            out[-1]["counts"][r["type"] or "correct"] += 1
+        return out
@@ -0,0 +1,270 @@
+"""
+تسميع مباشر من المايك (صفحة /listen).
+
+المتصفح يرسل frames قصيرة (PCM float32 16kHz mono) بـ POST متتالية:
+  - VAD بسيط بالطاقة (numpy) يقص نافذة لما القارئ يسكت (أو تطول النافذة)
+  - كل نافذة تروح لـ Whisper (asr_worker) في thread خاص بالجلسة
+  - الكلمات تدخل IncrementalAligner (per_word) والأخطاء ترجع markers
+    (ناقص/زائد/تحريف) مع رد أي POST جاي
+
+كل الـ buffers محدودة: الصوت (LIVE_MAX_BUFFER_SECONDS)، النوافذ المنتظرة،
+والـ markers. الجلسات في ذاكرة الـ process (gunicorn: sticky sessions أو worker واحد).
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+
+from app.audio import SAMPLE_RATE
+from app.live_align import IncrementalAligner
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+FRAME_MS = 30                    # دقة الـ VAD
+SPEECH_RATIO = 3.0               # كلام = طاقة أعلى من الضوضاء بكذا مرة
+MIN_SPEECH_RMS = 0.01            # حد أدنى (مايك هادي جدًا)
+NOISE_FLOOR = 0.002              # مستوى الضوضاء المبدئي
+NOISE_RISE = 0.002               # سرعة صعود مستوى الضوضاء (لكل frame)
+END_SILENCE_MS = 400             # سكتة بعد كلام = نهاية نافذة
+MIN_WINDOW_SECONDS = 0.5
+MAX_WINDOW_SECONDS = 8.0         # نافذة أطول من كذا نقصها حتى لو ما سكت
+
+LIVE_MAX_BUFFER_SECONDS = 30     # أقصى صوت محجوز لكل جلسة
+LIVE_MAX_PENDING = 3             # نوافذ تنتظر Whisper
+LIVE_MAX_MARKERS = 500
+LIVE_MAX_SESSIONS = 8
+LIVE_IDLE_SECONDS = 60
+LIVE_MAX_FRAME_SECONDS = 2       # أكبر frame نقبله في POST واحد
+
+STATUS_AR = {
+    "deletion": "ناقص",
+    "addition": "زائد",
+    "substitution": "تحريف",
+}
+
+LIVE_KWARGS = dict(
+    language="ar",
+    beam_size=5,
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+    word_timestamps=True,
+    vad_filter=False,
+)
+
+
+class EnergyVad:
+    """
+    VAD بالطاقة (RMS لكل frame). مستوى الضوضاء: ينزل فورًا مع أهدى frame،
+    ويطلع ببطء (NOISE_RISE) عشان الكلام المتواصل ما يصير "ضوضاء".
+    """
+
+    def __init__(self):
+        self.frame = int(SAMPLE_RATE * FRAME_MS / 1000)
+        self.noise = NOISE_FLOOR
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.mean(frame * frame))) if len(frame) else 0.0
+        if rms < self.noise:
+            self.noise = max(rms, 1e-5)
+        else:
+            self.noise += NOISE_RISE * (rms - self.noise)
+        return rms > max(MIN_SPEECH_RMS, self.noise * SPEECH_RATIO)
+
+
+class LiveSession:
+    def __init__(self, asr, index, surahid=None, start_ayah=1, owner=None):
+        self.id = str(uuid.uuid4())
+        self.owner = owner
+        self.asr = asr
+        self.aligner = IncrementalAligner(index, surahid, start_ayah, per_word=True)
+        self.vad = EnergyVad()
+
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.buf_start = 0               # sample index (من بداية الجلسة) لأول sample في buf
+        self.scan = 0                    # لين وين فحصنا الـ VAD داخل buf
+        self.had_speech = False
+        self.silence = 0                 # frames
+        self.dropped = 0.0               # ثواني انرمت لأن الـ buffer امتلى
+
+        self.markers = deque(maxlen=LIVE_MAX_MARKERS)
+        self.seq = 0
+        self.touched = time.monotonic()
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._push_lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=LIVE_MAX_PENDING)
+        self._thread = threading.Thread(target=self._decode_loop, name=f"live-{self.id[:8]}", daemon=True)
+        self._thread.start()
+
+    # ----------------------------
+    # Audio in
+    # ----------------------------
+    def push(self, pcm: np.ndarray):
+        with self._push_lock:
+            self._push(pcm)
+
+    def _push(self, pcm):
+        self.touched = time.monotonic()
+        self.buf = np.concatenate([self.buf, pcm.astype(np.float32, copy=False)])
+
+        f = self.vad.frame
+        while self.scan + f <= len(self.buf):
+            speech = self.vad.is_speech(self.buf[self.scan:self.scan + f])
+            self.scan += f
+            if speech:
+                self.had_speech = True
+                self.silence = 0
+            else:
+                self.silence += 1
+
+            length = self.scan / SAMPLE_RATE
+            ended = self.had_speech and self.silence * FRAME_MS >= END_SILENCE_MS
+            if (ended and length >= MIN_WINDOW_SECONDS) or length >= MAX_WINDOW_SECONDS:
+                self._cut(self.scan)
+            elif not self.had_speech and self.silence * FRAME_MS >= END_SILENCE_MS:
+                # سكتة بدون كلام: نرميها بدل ما نرسلها لـ Whisper
+                self._drop(self.scan)
+
+        # buffer محدود: لو Whisper متأخر نرمي الأقدم
+        limit = int(LIVE_MAX_BUFFER_SECONDS * SAMPLE_RATE)
+        if len(self.buf) > limit:
+            self.dropped += (len(self.buf) - limit) / SAMPLE_RATE
+            self._drop(len(self.buf) - limit)
+
+    def _drop(self, n):
+        self.buf = self.buf[n:]
+        self.buf_start += n
+        self.scan = max(0, self.scan - n)
+        self.silence = 0
+        self.had_speech = False
+
+    def _cut(self, n):
+        try:
+            self._pending.put_nowait((self.buf_start, self.buf[:n].copy()))
+        except queue.Full:
+            return  # Whisper مشغول: النافذة تكبر لين يفضى (أو يقصها حد الـ buffer)
+        self._drop(n)
+
+    def finish(self):
+        """آخر الجلسة: نرسل الباقي وننتظر Whisper يخلص."""
+        with self._push_lock:
+            if self.had_speech and self.scan:
+                self._pending.put((self.buf_start, self.buf[:self.scan].copy()))
+        self._pending.put(None)
+        self._thread.join()
+        self.closed = True
+        self._publish(self.aligner.finish())
+
+    def abort(self):
+        # جلسة مهجورة: نوقف الـ thread بدون ما ننتظره
+        self.closed = True
+        try:
+            self._pending.put_nowait(None)
+        except queue.Full:
+            pass
+
+    # ----------------------------
+    # Whisper + alignment (thread الجلسة)
+    # ----------------------------
+    def _decode_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None or self.closed:
+                return
+            start, window = item
+            offset = start / SAMPLE_RATE
+            try:
+                # بدون initial_prompt من المرجع: الكلمات اللي ما انقرت تطلع ناقص
+                segments, _ = self.asr.transcribe(window, **LIVE_KWARGS)
+            except Exception:
+                log.exception("live session %s: transcribe failed", self.id)
+                continue
+
+            words = [
+                {"word": (w.word or "").strip(), "start": float(w.start) + offset}
+                for s in segments for w in (s.words or [])
+            ]
+            self._publish(self.aligner.feed(words))
+
+    def _publish(self, ayat):
+        with self._lock:
+            for a in ayat:
+                for r in a["rows"]:
+                    self.seq += 1
+                    self.markers.append({
+                        "seq": self.seq,
+                        "ayah": a["ayah_number"],
+                        "status": STATUS_AR.get(r["type"], "صحيح"),
+                        "expected": r["expected"],
+                        "actual": r["actual"],
+                        "time": r["time"],
+                    })
+
+    def markers_after(self, seq: int):
+        with self._lock:
+            return [m for m in self.markers if m["seq"] > seq]
+
+    def state(self, after=0):
+        det = self.aligner.detection
+        return {
+            "session_id": self.id,
+            "surahid": det.surahid if det else None,
+            "markers": self.markers_after(after),
+            "dropped_seconds": round(self.dropped, 2),
+            "pending_windows": self._pending.qsize(),
+        }
+
+
+# ----------------------------
+# Registry (جلسات مفتوحة في هذا الـ process)
+# الجلسة (الصوت + الـ aligner + thread الـ ASR) تعيش هنا بس: كل طلبات الجلسة لازم توصل
+# نفس الـ process -> gunicorn بـ worker واحد (-w 1 --threads N)، أو sticky routing على
+# session_id. process ثاني ما يعرفها ويرجع 404.
+# ----------------------------
+_sessions = {}
+_lock = threading.Lock()
+
+
+class TooManySessions(Exception):
+    pass
+
+
+def _expire_idle():
+    now = time.monotonic()
+    for sid, s in list(_sessions.items()):
+        if now - s.touched > LIVE_IDLE_SECONDS:
+            _sessions.pop(sid, None)
+            s.abort()
+
+
+def open_session(asr, index, surahid=None, start_ayah=1, owner=None) -> LiveSession:
+    with _lock:
+        _expire_idle()
+        if len(_sessions) >= LIVE_MAX_SESSIONS:
+            raise TooManySessions()
+        s = LiveSession(asr, index, surahid, start_ayah, owner)
+        _sessions[s.id] = s
+        return s
+
+
+def get_session(sid):
+    with _lock:
+        return _sessions.get(sid)
+
+
+def close_session(sid):
+    with _lock:
+        s = _sessions.pop(sid, None)
+    if s is not None:
+        s.finish()
+    return s
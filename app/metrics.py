@@ -0,0 +1,221 @@
+"""
+توقيت كل مرحلة في التحقق (رفع، تحميل، فك، VAD، Whisper، تحديد السورة، مقارنة، recheck، حفظ...).
+
+    with stage("transcribe", audio_seconds=duration) as s:
+        ...
+        s.items = len(segments)
+
+كل مرحلة:
+  - سطر log JSON (logger "tayaqan.metrics"): stage, seconds, audio_seconds, items, ok + أي fields
+  - histogram + counters في الذاكرة -> /metrics (Prometheus text)
+
+الأرقام في ذاكرة كل process. مع set_shared_dir (METRICS_DIR) كل process يكتب نسخته لملف
+في مجلد مشترك بعد كل مرحلة، و shared_snapshot يجمع كل الملفات -> كل gunicorn worker يرجع نفس
+الأرقام وما ترجع لورا (ملفات الـ workers الميتة تبقى للـ counters، بدون in_progress).
+asr_worker (process واحد) يرجع أرقامه مع op "stats" و /metrics يضيفها بـ source="asr_worker".
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+log = logging.getLogger("tayaqan.metrics")
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+PREFIX = "tayaqan_stage"
+
+
+class Span:
+    """اللي داخل الـ with يقدر يعدل audio_seconds / items / fields قبل ما تنتهي المرحلة."""
+
+    def __init__(self, name, audio_seconds=None, items=None, fields=None):
+        self.name = name
+        self.audio_seconds = audio_seconds
+        self.items = items
+        self.fields = fields or {}
+
+
+_lock = threading.Lock()
+_stats = {}
+_shared_dir = None
+_write_lock = threading.Lock()   # threads نفس الـ process يكتبون نفس الملف
+_file = None                     # (pid, path): يتجدد بعد fork (gunicorn --preload)
+
+
+def _new_stats():
+    return {
+        "count": 0,
+        "errors": 0,
+        "seconds": 0.0,
+        "audio_seconds": 0.0,
+        "items": 0,
+        "in_progress": 0,
+        "buckets": [0] * len(BUCKETS),
+    }
+
+
+def record(name, seconds, audio_seconds=None, items=None, ok=True, **fields):
+    with _lock:
+        s = _stats.setdefault(name, _new_stats())
+        s["count"] += 1
+        s["errors"] += not ok
+        s["seconds"] += seconds
+        s["audio_seconds"] += audio_seconds or 0.0
+        s["items"] += items or 0
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                s["buckets"][i] += 1
+
+    _flush()
+
+    entry = {"stage": name, "seconds": round(seconds, 4), "ok": ok}
+    if audio_seconds is not None:
+        entry["audio_seconds"] = round(audio_seconds, 2)
+        if audio_seconds > 0:
+            entry["rtf"] = round(seconds / audio_seconds, 4)
+    if items is not None:
+        entry["items"] = items
+    entry.update(fields)
+    log.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+@contextmanager
+def stage(name, audio_seconds=None, items=None, **fields):
+    span = Span(name, audio_seconds, items, fields)
+    with _lock:
+        _stats.setdefault(name, _new_stats())["in_progress"] += 1
+    _flush()
+    ok = False
+    t0 = time.perf_counter()
+    try:
+        yield span
+        ok = True
+    except GeneratorExit:
+        # generator انقفل داخل المرحلة (العميل قطع أثناء yield) = مو خطأ في المرحلة
+        ok = True
+        span.fields["cancelled"] = True
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        with _lock:
+            _stats[name]["in_progress"] -= 1
+        record(name, seconds, span.audio_seconds, span.items, ok, **span.fields)
+
+
+def snapshot():
+    """نسخة JSON-serializable (تنرسل من asr_worker للويب)."""
+    with _lock:
+        return {name: dict(s, buckets=list(s["buckets"])) for name, s in _stats.items()}
+
+
+# ----------------------------
+# Shared store (كل processes الويب)
+# ----------------------------
+def set_shared_dir(directory):
+    """مجلد مشترك للأرقام (None/فاضي = كل process لحاله). يتفضى مع كل deploy."""
+    global _shared_dir
+    _shared_dir = directory or None
+    if _shared_dir:
+        os.makedirs(_shared_dir, exist_ok=True)
+
+
+def _path():
+    global _file
+    pid = os.getpid()
+    if _file is None or _file[0] != pid:
+        # pid ممكن يتكرر بعد restart -> اسم فريد لكل process عشان ما نكتب فوق أرقام قديمة
+        _file = (pid, os.path.join(_shared_dir, f"{pid}-{uuid.uuid4().hex[:8]}.json"))
+    return _file[1]
+
+
+def _flush():
+    if not _shared_dir:
+        return
+    try:
+        with _write_lock:
+            path = _path()
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp, path)
+    except OSError:
+        log.warning("could not write metrics to %s", _shared_dir, exc_info=True)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def shared_snapshot():
+    """مجموع كل processes الويب (أو snapshot() لو ما فيه مجلد مشترك)."""
+    if not _shared_dir:
+        return snapshot()
+    _flush()
+
+    total = {}
+    for path in glob.glob(os.path.join(_shared_dir, "*.json")):
+        try:
+            with open(path) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _alive(int(os.path.basename(path).split("-", 1)[0]))
+        for name, s in stats.items():
+            t = total.setdefault(name, _new_stats())
+            for key in ("count", "errors", "seconds", "audio_seconds", "items"):
+                t[key] += s[key]
+            if alive:
+                t["in_progress"] += s["in_progress"]
+            t["buckets"] = [a + b for a, b in zip(t["buckets"], s["buckets"])]
+    return total
+
+
+# ----------------------------
+# Prometheus text format
+# ----------------------------
+def _fmt(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus(sources):
+    """sources: {"web": snapshot(), "asr_worker": {...}} -> نص /metrics."""
+    out = [
+        f"# HELP {PREFIX}_seconds Time spent per pipeline stage.",
+        f"# TYPE {PREFIX}_seconds histogram",
+    ]
+    for source, stats in sources.items():
+        for name, s in sorted(stats.items()):
+            labels = f'source="{source}",stage="{name}"'
+            for le, n in zip(BUCKETS, s["buckets"]):
+                out.append(f'{PREFIX}_seconds_bucket{{{labels},le="{le}"}} {n}')
+            out.append(f'{PREFIX}_seconds_bucket{{{labels},le="+Inf"}} {s["count"]}')
+            out.append(f"{PREFIX}_seconds_sum{{{labels}}} {_fmt(s['seconds'])}")
+            out.append(f"{PREFIX}_seconds_count{{{labels}}} {s['count']}")
+
+    for metric, key, kind, help_ in (
+        ("audio_seconds_total", "audio_seconds", "counter", "Seconds of audio processed per stage."),
+        ("items_total", "items", "counter", "Items (segments, words, rows...) processed per stage."),
+        ("errors_total", "errors", "counter", "Stage runs that raised."),
+        ("in_progress", "in_progress", "gauge", "Stage runs currently executing."),
+    ):
+        out.append(f"# HELP {PREFIX}_{metric} {help_}")
+        out.append(f"# TYPE {PREFIX}_{metric} {kind}")
+        for source, stats in sources.items():
+            for name, s in sorted(stats.items()):
+                out.append(f'{PREFIX}_{metric}{{source="{source}",stage="{name}"}} {_fmt(s[key])}')
+    return "\n".join(out) + "\n"
@@ -0,0 +1,103 @@
+"""
+Migrations خفيفة: python -m app.migrations (مرة وحدة مع كل deploy، قبل تشغيل الويب).
+
+create_all ينشئ الجداول الناقصة بس، ما يضيف أعمدة لجدول موجود (Neon/محلي).
+ما تشتغل داخل create_app: كل gunicorn worker كان يشغلها بنفس الوقت ويتسابقون.
+كل خطوة idempotent: ADD COLUMN IF NOT EXISTS / CREATE INDEX IF NOT EXISTS
+(SQLite ما يدعم IF NOT EXISTS على الأعمدة -> نشيك أول، وهو محلي بس).
+"""
+import logging
+import sys
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app import create_app, db
+
+log = logging.getLogger(__name__)
+
+
+def _has_column(table, column):
+    return any(c["name"] == column for c in inspect(db.engine).get_columns(table))
+
+
+def add_column(table, column, ddl_type):
+    if db.engine.dialect.name == "postgresql":
+        sql = f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl_type}"
+    elif _has_column(table, column):
+        return
+    else:
+        sql = f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"
+    with db.engine.begin() as conn:
+        conn.execute(text(sql))
+    log.info("migration: ensured %s.%s", table, column)
+
+
+def create_index(index):
+    # ddl_if(dialect=...) ما ينطبق على CreateIndex المباشر -> نشيكه هنا
+    ddl_if = getattr(index, "_ddl_if", None)
+    if ddl_if is not None and ddl_if.dialect not in (None, db.engine.dialect.name):
+        return
+    with db.engine.begin() as conn:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# ----------------------------
+# Steps
+# ----------------------------
+def error_counters():
+    """عدادات الأخطاء لكل RecitationInput + backfill للسجلات القديمة."""
+    for col in ("missingcount", "extracount", "wrongcount"):
+        add_column("recitation_inputs", col, "INTEGER")
+
+    counts = {"missingcount": "ناقص", "extracount": "زائد", "wrongcount": "تحريف"}
+    sets = ", ".join(
+        f"{col} = (SELECT COUNT(*) FROM recitation_word_details w "
+        f"WHERE w.inputid = recitation_inputs.inputid AND w.status = :{col})"
+        for col in counts
+    )
+    with db.engine.begin() as conn:
+        res = conn.execute(
+            text(f"UPDATE recitation_inputs SET {sets} WHERE missingcount IS NULL"),
+            counts,
+        )
+    if res.rowcount:
+        log.info("migration: backfilled error counters for %s inputs", res.rowcount)
+
+
+def quran_word_versions():
+    """نسخة الـ normalizer + md5(ayahtext) لكل صف quran_word (الصفوف القديمة = 0 / فاضي -> تنتجاهل)."""
+    add_column("quran_word", "norm_version", "INTEGER NOT NULL DEFAULT 0")
+    add_column("quran_word", "ayah_hash", "VARCHAR(32) NOT NULL DEFAULT ''")
+
+
+def model_indexes():
+    """indexes المعرفة في models.py على جداول كانت موجودة قبلها (create_all يتخطاها)."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            create_index(index)
+
+
+MIGRATIONS = (
+    error_counters,
+    quran_word_versions,
+    model_indexes,
+)
+
+
+def run_migrations():
+    for step in MIGRATIONS:
+        log.info("migration: %s", step.__name__)
+        step()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    app = create_app()
+    with app.app_context():
+        run_migrations()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
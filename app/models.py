@@ -62,6 +62,36 @@ class QuranAyah(db.Model):
     errors = db.relationship("ErrorDetails", backref="ayah", lazy=True)
 
 
+# =========================
+# 4b) Quran_Word (كلمات المصحف normalized مسبقاً - يعبيها python -m app.backfill_quran_words)
+# =========================
+class QuranWord(db.Model):
+    __tablename__ = "quran_word"
+
+    # word_index يبدأ من 1 داخل الآية (نفس RecitationWordDetails.word_index)
+    surahid = db.Column(db.Integer, db.ForeignKey("quran_surah.surahid"), primary_key=True, autoincrement=False)
+    ayahnumber = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    word_index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    ayahid = db.Column(db.Integer, db.ForeignKey("quran_ayah.ayahid"), nullable=False)
+    # موقع الكلمة في المصحف كامل (0..) = global word position حق QuranIndex
+    wordpos = db.Column(db.Integer, nullable=False)
+
+    word = db.Column(db.Text, nullable=False)            # الكلمة كما هي في ayahtext
+    norm_strict = db.Column(db.Text, nullable=False)     # app.arabic profile strict
+    norm_lenient = db.Column(db.Text, nullable=False)    # app.arabic profile lenient
+    # وقت الـ backfill: نسخة الـ normalizer + md5(ayahtext) -> الصفوف القديمة تنكشف وتنتجاهل
+    norm_version = db.Column(db.Integer, nullable=False, server_default="0")
+    ayah_hash = db.Column(db.String(32), nullable=False, server_default="")
+
+    __table_args__ = (
+        # تحميل المصحف للـ index: ORDER BY wordpos
+        db.Index("ix_quran_word_pos", "wordpos", unique=True),
+        # كلمات آية وحدة (referenceayahid -> كلماتها)
+        db.Index("ix_quran_word_ayah", "ayahid", "word_index"),
+    )
+
+
 # =========================
 # 5) Recitation_Inputs
 # =========================
@@ -84,12 +114,33 @@ class RecitationInput(db.Model):
     totalwords = db.Column(db.Integer, nullable=True)
     correctwords = db.Column(db.Integer, nullable=True)
 
+    # ✅ عدادات الأخطاء تنحسب وقت الحفظ (السجل ما يعد صفوف الكلمات كل مرة)
+    missingcount = db.Column(db.Integer, nullable=True)
+    extracount = db.Column(db.Integer, nullable=True)
+    wrongcount = db.Column(db.Integer, nullable=True)
+
     # ✅ علاقة مع السورة
     surah = db.relationship("QuranSurah", backref="inputs", lazy=True)
 
     errors = db.relationship("ErrorDetails", backref="input", lazy=True)
     reports = db.relationship("Report", backref="input", lazy=True)
 
+
+# ✅ سجل المستخدم (keyset): verifierid + (processingdate DESC NULLS LAST, inputid DESC)
+#    SQLite ما يقبل NULLS LAST في index (وهو أصلاً يرتب NULL أول في ASC = آخر في DESC)
+db.Index(
+    "ix_inputs_history",
+    RecitationInput.verifierid,
+    RecitationInput.processingdate.desc().nullslast(),
+    RecitationInput.inputid.desc(),
+).ddl_if(dialect="postgresql")
+db.Index(
+    "ix_inputs_history_lite",
+    RecitationInput.verifierid,
+    RecitationInput.processingdate.desc(),
+    RecitationInput.inputid.desc(),
+).ddl_if(dialect="sqlite")
+
 # =========================
 # 6) Error_Details
 # =========================
@@ -108,6 +159,10 @@ class ErrorDetails(db.Model):
     errorstarttime = db.Column(db.Numeric(8, 2), nullable=True)
     errorendtime = db.Column(db.Numeric(8, 2), nullable=True)
 
+    __table_args__ = (
+        db.Index("ix_error_details_input", "inputid"),
+    )
+
 
 # =========================
 # 7) Reports
@@ -141,6 +196,18 @@ class RecitationWordDetails(db.Model):
     # علاقات (اختياري لكن مفيد)
     input = db.relationship("RecitationInput", backref=db.backref("word_details", lazy=True))
     ayah  = db.relationship("QuranAyah", backref=db.backref("word_details", lazy=True))
+
+    __table_args__ = (
+        # صفحة النتائج: WHERE inputid = ? ORDER BY ayahnumber, word_index, starttime, wordid
+        db.Index("ix_word_details_order", "inputid", "ayahnumber", "word_index", "starttime", "wordid"),
+        # الأخطاء فقط (السجل): partial index صغير (~5% من الصفوف)
+        db.Index(
+            "ix_word_details_errors", "inputid", "ayahnumber", "word_index",
+            postgresql_where=db.text("status IN ('ناقص', 'زائد', 'تحريف')"),
+            sqlite_where=db.text("status IN ('ناقص', 'زائد', 'تحريف')"),
+        ),
+    )
+
 class Report(db.Model):
     __tablename__ = "reports"
 
@@ -171,3 +238,48 @@ class ActivityLog(db.Model):
     activitytype = db.Column(db.String(30), nullable=False)
     description = db.Column(db.Text, nullable=True)
 
+
+# =========================
+# 9) Verification_Jobs
+# =========================
+class VerificationJob(db.Model):
+    __tablename__ = "verification_jobs"
+    __table_args__ = (
+        # آخر job لكل input (السجل يعرض حالته) -> بدون scan
+        db.Index("ix_jobs_input", "inputid", "created_at"),
+    )
+
+    # uuid يرجع للمستخدم مباشرة (job id)
+    jobid = db.Column(db.String(36), primary_key=True)
+    inputid = db.Column(db.Integer, db.ForeignKey("recitation_inputs.inputid"), nullable=False)
+
+    # queued / downloading / decoding / transcribing / aligning / persisting / done / failed
+    stage = db.Column(db.String(20), nullable=False, server_default="queued")
+    audiopath = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+
+    input = db.relationship("RecitationInput", backref=db.backref("jobs", lazy=True))
+
+
+# =========================
+# 10) Job_Ayah_Results (نتائج جزئية آية بآية أثناء التحقق -> /jobs/<id>?after=seq)
+# =========================
+class JobAyahResult(db.Model):
+    __tablename__ = "job_ayah_results"
+
+    resultid = db.Column(db.Integer, primary_key=True)
+    jobid = db.Column(db.String(36), db.ForeignKey("verification_jobs.jobid"), nullable=False, index=True)
+
+    # ترتيب النشر (صفحة النتائج تكمل من آخر seq وصلها)
+    seq = db.Column(db.Integer, nullable=False)
+    ayahnumber = db.Column(db.Integer, nullable=True)
+
+    # JSON: [{"word_index", "expected_word", "spoken_word", "status", "starttime"}]
+    payload = db.Column(db.Text, nullable=False)
+
+    created_at = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+    job = db.relationship("VerificationJob", backref=db.backref("ayah_results", lazy=True))
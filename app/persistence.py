@@ -0,0 +1,180 @@
+"""
+حفظ نتيجة build_report في DB دفعة وحدة.
+
+سورة كاملة = آلاف صفوف RecitationWordDetails، و session.add لكل صف أبطأ من المقارنة نفسها.
+  - PostgreSQL: COPY ... FROM STDIN (CSV) على نفس connection حق الـ session
+  - غيره (SQLite للتجارب): insert() executemany على دفعات
+الصفوف + ErrorDetails + totals/عدادات الأخطاء حق RecitationInput كلها في transaction وحدة (commit واحد).
+"""
+import csv
+import io
+import logging
+import time
+
+from app import db
+from app.models import ErrorDetails, RecitationWordDetails
+
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+INSERT_BATCH = 1000              # صفوف لكل executemany (لما ما فيه COPY)
+
+# report type -> status بالعربي (نفس قيم RecitationWordDetails.status)
+STATUS_AR = {
+    None: "صحيح",
+    "deletion": "ناقص",
+    "addition": "زائد",
+    "substitution": "تحريف",
+}
+
+WORD_COLUMNS = (
+    "inputid", "referenceayahid", "ayahnumber", "word_index",
+    "expected_word", "spoken_word", "status", "starttime", "endtime",
+)
+ERROR_COLUMNS = (
+    "inputid", "referenceayahid", "errortype", "mismatchedtext", "errorstarttime", "errorendtime",
+)
+
+
+def error_message(status, expected_word, spoken_word):
+    # نفس النص اللي يطلع في صفحة السجل
+    if status == "ناقص":
+        return f"نقص كلمة: {expected_word or ''}".strip()
+    if status == "زائد":
+        return f"زيادة كلمة: {spoken_word or ''}".strip()
+    return f"تحريف: المتوقع '{expected_word or ''}' — المنطوق '{spoken_word or ''}'".strip()
+
+
+def _anchors(report):
+    """لكل row: ref_index حقه، أو آخر ref_index قبله (للزائد)."""
+    anchor = None
+    for r in report["rows"]:
+        if r["ref_index"] is not None:
+            anchor = r["ref_index"]
+        yield r, (r["ref_index"] if r["ref_index"] is not None else anchor)
+
+
+def report_to_word_rows(inputid, report, ref_ayah_ids, ref_to_ayah):
+    """
+    report rows -> dicts جاهزة لـ RecitationWordDetails.
+    الزائد (addition) ما له آية بالـ report، نعلقه على آخر كلمة مرجعية قبله
+    عشان يطلع بمكانه في صفحة النتائج.
+    """
+    # word_index داخل الآية (يبدأ من 1)
+    word_index, last_ayah, k = [], None, 0
+    for a in ref_to_ayah:
+        k = k + 1 if a == last_ayah else 1
+        last_ayah = a
+        word_index.append(k)
+
+    rows = []
+    for r, pos in _anchors(report):
+        ri = r["ref_index"]
+        rows.append({
+            "inputid": inputid,
+            "referenceayahid": ref_ayah_ids[ri] if ri is not None else None,
+            "ayahnumber": ref_to_ayah[pos] if pos is not None else None,
+            "word_index": word_index[pos] if pos is not None else None,
+            "expected_word": r["expected"],
+            "spoken_word": r["actual"],
+            "status": STATUS_AR[r["type"]],
+            "starttime": r["time"],
+            "endtime": None,
+        })
+    return rows
+
+
+def report_to_error_rows(inputid, report, ref_ayah_ids):
+    """الأخطاء فقط -> ErrorDetails (referenceayahid إجباري: الزائد ياخذ آية اللي قبله)."""
+    rows = []
+    for r, pos in _anchors(report):
+        if r["type"] is None or not ref_ayah_ids:
+            continue
+        status = STATUS_AR[r["type"]]
+        rows.append({
+            "inputid": inputid,
+            "referenceayahid": ref_ayah_ids[pos if pos is not None else 0],
+            "errortype": status,
+            "mismatchedtext": error_message(status, r["expected"], r["actual"]),
+            "errorstarttime": r["time"],
+            "errorendtime": None,
+        })
+    return rows
+
+
+# ----------------------------
+# Bulk write
+# ----------------------------
+def _copy_rows(table, columns, rows):
+    """PostgreSQL COPY على نفس الـ connection (نفس الـ transaction حق الـ session)."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        # None -> خانة فاضية بدون quotes = NULL في COPY CSV
+        w.writerow(["" if r[c] is None else r[c] for c in columns])
+    buf.seek(0)
+
+    dbapi_conn = db.session.connection().connection.driver_connection
+    with dbapi_conn.cursor() as cur:
+        cur.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+
+
+def _insert_rows(table, rows):
+    for i in range(0, len(rows), INSERT_BATCH):
+        db.session.execute(table.insert(), rows[i:i + INSERT_BATCH])
+
+
+def bulk_insert(model, columns, rows):
+    if not rows:
+        return
+    table = model.__table__
+    if db.session.get_bind().dialect.name == "postgresql":
+        _copy_rows(table, columns, rows)
+    else:
+        _insert_rows(table, rows)
+
+
+def persist_report(rec, report, ref_ayah_ids, ref_to_ayah):
+    """
+    يحفظ تفاصيل الكلمات + الأخطاء ويحدث totals حق rec، ثم commit واحد.
+    يرجع {"rows", "seconds", "rows_per_s"}.
+    """
+    t0 = time.perf_counter()
+
+    word_rows = report_to_word_rows(rec.inputid, report, ref_ayah_ids, ref_to_ayah)
+    error_rows = report_to_error_rows(rec.inputid, report, ref_ayah_ids)
+
+    try:
+        bulk_insert(RecitationWordDetails, WORD_COLUMNS, word_rows)
+        bulk_insert(ErrorDetails, ERROR_COLUMNS, error_rows)
+
+        summary = report["summary"]
+        rec.totalwords = summary["total_words"]
+        rec.correctwords = summary["correct"]
+        rec.verificationstatus = summary["is_valid"]
+        rec.missingcount = summary["deletion"]
+        rec.extracount = summary["addition"]
+        rec.wrongcount = summary["substitution"]
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    seconds = time.perf_counter() - t0
+    n = len(word_rows) + len(error_rows)
+    stats = {
+        "rows": n,
+        "seconds": round(seconds, 4),
+        "rows_per_s": round(n / seconds) if seconds > 0 else None,
+    }
+    log.info("persisted input %s: %s rows in %.3fs (%s rows/s)",
+             rec.inputid, n, seconds, stats["rows_per_s"])
+    return stats
@@ -0,0 +1,309 @@
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import wave
+
+from flask import current_app
+
+from app import db
+from app.models import RecitationInput, VerificationJob, JobAyahResult
+from app.arabic import text_tokens
+from app.alignment import build_report
+from app.asr_client import AsrClient
+from app.audio import SAMPLE_RATE, is_whisper_wav, load_pcm
+from app.cascade import transcribe_cascade
+from app.chunked_asr import transcribe_parallel
+from app.forced_align import transcribe_forced
+from app.gap_repair import find_gaps, repair_gaps
+from app.live_align import IncrementalAligner
+from app.metrics import stage
+from app.persistence import STATUS_AR, persist_report
+from app.probe import probe_surah
+from app.quran_index import get_quran_index, fill_recitation_input
+
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+VAD_MIN_DURATION = 120           # ثواني: VAD للطويل فقط (مثل test_whisper_DB)
+
+
+# ----------------------------
+# Stages helpers
+# ----------------------------
+def set_stage(job, stage):
+    job.stage = stage
+    db.session.commit()
+
+
+def download_youtube(url: str, out_dir: str, file_id: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    cmd = [
+        "yt-dlp",
+        "-x",
+        "--audio-format", "mp3",
+        "--audio-quality", "0",
+        "-o", os.path.join(out_dir, f"{file_id}.%(ext)s"),
+        url
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return os.path.join(out_dir, f"{file_id}.mp3")
+
+
+def decode_to_wav(src: str, dst: str) -> str:
+    # 16kHz mono PCM: اللي يحتاجه Whisper مباشرة
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", src,
+        "-vn",
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        dst
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return dst
+
+
+def get_audio_duration(path: str) -> float:
+    try:
+        with contextlib.closing(wave.open(path, "rb")) as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except Exception:
+        return 0.0
+
+
+def transcribe_kwargs(duration: float) -> dict:
+    kwargs = dict(
+        language="ar",
+        beam_size=8,
+        temperature=0.0,
+        best_of=1,
+        condition_on_previous_text=True,
+        word_timestamps=True,
+    )
+    if duration >= VAD_MIN_DURATION:
+        kwargs.update(dict(
+            vad_filter=True,
+            vad_parameters=dict(min_silence_duration_ms=200, speech_pad_ms=500),
+            condition_on_previous_text=False,
+        ))
+    else:
+        kwargs.update(dict(vad_filter=False))
+    return kwargs
+
+
+def collect_words(segments):
+    whisper_words = []
+    for s in segments:
+        if getattr(s, "words", None):
+            for w in s.words:
+                whisper_words.append({
+                    "word": (w.word or "").strip(),
+                    "start": float(w.start),
+                    "end": float(w.end),
+                    "probability": getattr(w, "probability", None),
+                })
+
+    # fallback لو ما طلعت words (نادر)
+    if not whisper_words:
+        for s in segments:
+            toks = text_tokens(s.text)
+            if not toks:
+                continue
+            seg_len = max(0.001, (s.end - s.start))
+            step = seg_len / len(toks)
+            for i, tok in enumerate(toks):
+                whisper_words.append({
+                    "word": tok,
+                    "start": float(s.start + i * step),
+                    "end": float(s.start + (i + 1) * step),
+                })
+    return whisper_words
+
+
+def publish_ayat(job, ayat, seq):
+    """نتائج آيات انحسمت -> job_ayah_results (صفحة النتائج تقراها من /jobs/<id>?after=seq)."""
+    for a in ayat:
+        payload = []
+        k = 0
+        for r in a["rows"]:
+            if r["ref_index"] is not None:
+                k += 1
+            payload.append({
+                "word_index": k if r["ref_index"] is not None else None,
+                "expected_word": r["expected"],
+                "spoken_word": r["actual"],
+                "status": STATUS_AR[r["type"]],
+                "starttime": r["time"],
+            })
+        seq += 1
+        db.session.add(JobAyahResult(
+            jobid=job.jobid,
+            seq=seq,
+            ayahnumber=a["ayah_number"],
+            payload=json.dumps(payload, ensure_ascii=False),
+        ))
+    if ayat:
+        db.session.commit()
+    return seq
+
+
+def transcribe_live(job, asr, wav_path, kwargs, index, detection=None):
+    """
+    نستهلك الـ segments وهي تطلع من الـ worker، ونرسل الآيات اللي انحسمت أول بأول.
+    detection (من الـ probe): المقارنة تبدأ من أول segment بدل ما تنتظر التحديد.
+    يرجع كل الـ segments (للمقارنة النهائية).
+    """
+    segment_iter, _ = asr.transcribe_iter(wav_path, **kwargs)
+    if detection is not None:
+        aligner = IncrementalAligner(index, detection.surahid, detection.startayah)
+    else:
+        aligner = IncrementalAligner(index)
+    segments, seq = [], 0
+    for seg in segment_iter:
+        segments.append(seg)
+        seq = publish_ayat(job, aligner.feed(collect_words([seg])), seq)
+    publish_ayat(job, aligner.finish(), seq)
+    return segments
+
+
+# ----------------------------
+# Pipeline: download -> decode -> transcribe -> align -> persist
+# (يشتغل في thread خارج الطلب — شوفي app/jobs.py)
+# ----------------------------
+def run_verification(job_id: str):
+    job = db.session.get(VerificationJob, job_id)
+    rec = db.session.get(RecitationInput, job.inputid)
+    file_id = job_id
+
+    # (1) downloading (يوتيوب فقط)
+    source = job.audiopath
+    if rec.inputtype == "youtube":
+        set_stage(job, "downloading")
+        out_dir = os.path.join(current_app.root_path, "static", "uploads", "youtube")
+        with stage("download", job=job_id):
+            source = download_youtube(rec.filepathorlink, out_dir, file_id)
+
+    # (2) decoding -> wav 16kHz mono (الرفع المباشر انفك وهو يوصل، فنتخطاه)
+    wav_path = source
+    if not is_whisper_wav(source):
+        set_stage(job, "decoding")
+        wav_path = os.path.splitext(source)[0] + ".wav"
+        if os.path.abspath(wav_path) == os.path.abspath(source):
+            wav_path = os.path.splitext(source)[0] + ".16k.wav"
+        with stage("decode", job=job_id) as s:
+            decode_to_wav(source, wav_path)
+            s.audio_seconds = get_audio_duration(wav_path)
+        job.audiopath = wav_path
+    duration = get_audio_duration(wav_path)
+
+    # (3) transcribing (الموديل في asr_worker)
+    set_stage(job, "transcribing")
+    index = get_quran_index()
+    asr = AsrClient(current_app.config["ASR_SOCKET"])
+    parallel = current_app.config["ASR_PARALLEL"]
+    chunk_seconds = current_app.config["ASR_CHUNK_SECONDS"]
+    cascade = current_app.config["ASR_CASCADE_MODEL"]
+    kwargs = transcribe_kwargs(duration)
+
+    # السورة معروفة من المستخدم (surahid وقت الرفع) + موديل CTC في الـ worker -> forced alignment
+    forced = bool(rec.surahid and current_app.config["FORCED_ALIGN_MODEL"] and index.surah_ayat(rec.surahid))
+    if forced and not asr.can_align():
+        log.warning("FORCED_ALIGN_MODEL set but the ASR worker has no --ctc-model; job %s decodes normally", job_id)
+        forced = False
+
+    # (3a) probe: أول ثواني بموديل سريع -> السورة + آية البداية قبل الـ decode الكامل
+    # بس للـ transcribe_live (المقارنة المباشرة تبدأ من أول segment) — الـ decode نفسه بدون prompt
+    live = not forced and not cascade and not (parallel > 1 and duration > chunk_seconds)
+    probe = None
+    if current_app.config["ASR_PROBE"] and live:
+        try:
+            with stage("probe", job=job_id) as s:
+                probe = probe_surah(asr, wav_path, index, duration,
+                                    model=current_app.config["ASR_PROBE_MODEL"] or cascade or None)
+                s.audio_seconds = probe.audio_seconds
+                s.items = probe.tokens
+                s.fields["confident"] = probe.confident
+                if probe.detection is not None:
+                    s.fields["surah"] = probe.detection.surahid
+        except RuntimeError:
+            # مثلاً الموديل مو محمّل في الـ worker: الـ probe اختياري
+            log.warning("probe failed for job %s", job_id, exc_info=True)
+            probe = None
+        if probe is not None and not probe.confident:
+            probe = None        # غامض -> تحديد من النص كامل
+
+    with stage("transcribe", audio_seconds=duration, job=job_id) as s:
+        s.fields["probe"] = probe is not None
+        if forced:
+            # كلمات المرجع على الصوت (CTC)، و Whisper بس للكلمات اللي ما تطابق (app/forced_align.py)
+            whisper_words, info = transcribe_forced(asr, wav_path, kwargs, index,
+                                                    rec.surahid, rec.startayah or 1, duration)
+            s.fields.update(
+                forced=rec.surahid,
+                escalated_seconds=round(info.escalated_audio, 2),
+                escalated_fraction=round(info.escalated_fraction, 4),
+            )
+        elif cascade:
+            # موديل سريع على الكل + الكبير بس للمناطق المشكوك فيها (app/cascade.py)
+            whisper_words, info = transcribe_cascade(asr, wav_path, kwargs, index, cascade, duration)
+            s.fields.update(
+                cascade=cascade,
+                escalated_seconds=round(info.escalated_audio, 2),
+                escalated_fraction=round(info.escalated_fraction, 4),
+            )
+        else:
+            if not live:
+                segments, info = transcribe_parallel(load_pcm(wav_path), kwargs,
+                                                     parallel, asr=asr, chunk_seconds=chunk_seconds)
+                s.fields["chunks"] = info.chunks
+            else:
+                segments = transcribe_live(job, asr, wav_path, kwargs, index,
+                                           probe.detection if probe else None)
+            whisper_words = collect_words(segments)
+        s.items = len(whisper_words)
+
+    # (4) aligning: نحدد السورة + المدى من المصحف كامل ثم نقارن
+    # لو المستخدم حدد السورة (و forced alignment انعمل عليها) نحدد المدى داخلها بس، ما نبدلها
+    set_stage(job, "aligning")
+    known = rec.surahid if rec.surahid and index.surah_ayat(rec.surahid) else None
+    hyp_tokens = text_tokens(" ".join(w["word"] for w in whisper_words))
+    with stage("detect", items=len(hyp_tokens), job=job_id, known_surah=known):
+        detection = index.locate(hyp_tokens, known)
+    if detection is None:
+        if known:
+            raise ValueError(f"Could not find the recitation in surah {known}")
+        raise ValueError("Could not detect surah from the recitation")
+
+    # (4b) فجوات: كلمات مرجع ما انفكت (أو كلام بعد آخر كلمة) -> نعيد فك ثوانيها بس
+    if current_app.config["GAP_REPAIR"]:
+        # المرجع لآخر السورة: المدى المكتشف ممكن يكون قصير لأن النهاية أصلاً ما انفكت
+        ayat = index.surah_ayat(detection.surahid)
+        endayah = ayat[-1][0] if ayat else detection.endayah
+        ref_tokens = index.surah_words(detection.surahid, detection.startayah, endayah)
+        pcm = load_pcm(wav_path)
+        gaps = find_gaps(ref_tokens, whisper_words, pcm)
+        if gaps:
+            whisper_words, added = repair_gaps(asr, pcm, gaps, whisper_words, ref_tokens)
+            if added:
+                hyp_tokens = text_tokens(" ".join(w["word"] for w in whisper_words))
+                detection = index.locate(hyp_tokens, known) or detection
+
+    fill_recitation_input(rec, detection)
+    ref_tokens = index.surah_words(detection.surahid, detection.startayah, detection.endayah)
+    ref_to_ayah = index.surah_word_ayahs(detection.surahid, detection.startayah, detection.endayah)
+    ref_ayah_ids = index.surah_word_ayah_ids(detection.surahid, detection.startayah, detection.endayah)
+    with stage("align", audio_seconds=duration, items=len(ref_tokens), job=job_id):
+        report = build_report(ref_tokens, ref_to_ayah, whisper_words)
+
+    # (5) persisting: كل الصفوف + totals + done في transaction وحدة
+    set_stage(job, "persisting")
+    job.stage = "done"
+    with stage("persist", job=job_id) as s:
+        s.items = persist_report(rec, report, ref_ayah_ids, ref_to_ayah)["rows"]
+    return report
@@ -0,0 +1,72 @@
+"""
+Probe: نحدد السورة وآية البداية من أول ثواني التلاوة قبل الـ decode الكامل.
+
+  (1) أول PROBE_SECONDS (VAD داخل الـ worker يشيل السكوت) بموديل سريع وbeam 1
+      — لو الكلمات قليلة (مقدمة/سكوت طويل) نكمل النافذة اللي بعدها لين PROBE_MAX_SECONDS
+  (2) index.locate على الكلمات -> Detection
+  (3) لو واضح (كلمات كفاية + score عالي): المقارنة المباشرة (IncrementalAligner) تبدأ
+      من أول segment بدون ما تنتظر التحديد
+الـ decode الكامل نفسه ما يتغير (بدون prompt من المرجع: لو القارئ غلط ما نبغى الموديل
+يصحح عنه). لو مو واضح: locate على النص كامل زي العادة.
+التحديد النهائي (المدى اللي ينحفظ) دايماً من النص كامل.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from app.arabic import text_tokens
+from app.audio import clip_pcm, read_wav_range
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+PROBE_SECONDS = 30               # نافذة الـ probe (ثواني تسجيل)
+PROBE_MAX_SECONDS = 90           # لو الكلام قليل نكمل لين كذا
+PROBE_MIN_TOKENS = 12            # أقل من كذا ما يكفي للتحديد (نفس live_align)
+PROBE_MIN_SCORE = 50.0           # score حق locate (0..100) تحته = غامض
+
+PROBE_KWARGS = dict(
+    language="ar",
+    beam_size=1,
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+    word_timestamps=False,
+    vad_filter=True,
+    vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=200),
+)
+
+
+class ProbeResult(NamedTuple):
+    detection: object            # Detection أو None
+    tokens: int
+    audio_seconds: float
+    confident: bool
+
+
+def _clip(audio, start, end):
+    if isinstance(audio, np.ndarray):
+        return clip_pcm(audio, start, end)
+    return read_wav_range(audio, start, end)
+
+
+def probe_surah(asr, audio, index, duration, model=None):
+    """
+    audio: مسار wav جاهز (16kHz mono PCM16) أو pcm float32.
+    model: اسم موديل في asr_worker (None = الافتراضي / WhisperModel المحلي نفسه).
+    """
+    kwargs = dict(PROBE_KWARGS, **({"model": model} if model else {}))
+    tokens, start = [], 0.0
+    while start < min(duration, PROBE_MAX_SECONDS):
+        end = min(duration, start + PROBE_SECONDS)
+        segments, _ = asr.transcribe(_clip(audio, start, end), **kwargs)
+        tokens += text_tokens(" ".join(s.text for s in segments))
+        start = end
+        if len(tokens) >= PROBE_MIN_TOKENS:
+            break
+
+    detection = index.locate(tokens)
+    confident = (detection is not None and len(tokens) >= PROBE_MIN_TOKENS
+                 and detection.score >= PROBE_MIN_SCORE)
+    return ProbeResult(detection, len(tokens), start, confident)
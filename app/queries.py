@@ -0,0 +1,93 @@
+"""
+الـ queries الثقيلة على recitation_word_details / recitation_inputs.
+
+مكانها هنا (مو داخل routes) عشان app/explain_queries.py يطلع EXPLAIN لنفس الـ SQL بالضبط
+اللي تشغله الصفحات. أي تعديل على الترتيب أو الفلاتر لازم يطابق الـ indexes في models.py.
+"""
+from sqlalchemy import and_, func, or_, select
+
+from app import db
+from app.models import QuranSurah, RecitationInput, RecitationWordDetails, VerificationJob
+
+
+ERROR_STATUSES = ("ناقص", "زائد", "تحريف")
+
+
+def word_details_query(input_id):
+    """كل كلمات التلاوة بترتيب العرض (صفحة النتائج) -> ix_word_details_order."""
+    return (
+        RecitationWordDetails.query
+        .filter_by(inputid=input_id)
+        .order_by(
+            RecitationWordDetails.ayahnumber.asc().nullslast(),
+            RecitationWordDetails.word_index.asc().nullslast(),
+            RecitationWordDetails.starttime.asc().nullslast(),
+            RecitationWordDetails.wordid.asc())
+    )
+
+
+def word_errors_query(input_id):
+    """الأخطاء فقط (ناقص/زائد/تحريف) -> partial index ix_word_details_errors."""
+    return (
+        db.session.query(
+            RecitationWordDetails.ayahnumber,
+            RecitationWordDetails.status,
+            RecitationWordDetails.expected_word,
+            RecitationWordDetails.spoken_word,
+        )
+        .filter(RecitationWordDetails.inputid == input_id)
+        .filter(RecitationWordDetails.status.in_(ERROR_STATUSES))
+        .order_by(
+            RecitationWordDetails.ayahnumber.asc().nullslast(),
+            RecitationWordDetails.word_index.asc().nullslast(),
+        )
+    )
+
+
+def _latest_job_stage():
+    """stage آخر VerificationJob للـ input (correlated subquery -> ix_jobs_input)."""
+    return (
+        select(VerificationJob.stage)
+        .where(VerificationJob.inputid == RecitationInput.inputid)
+        .order_by(VerificationJob.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def history_query(user_id, cursor=None):
+    """
+    سجل المستخدم بترتيب (processingdate DESC NULLS LAST, inputid DESC) -> ix_inputs_history.
+    cursor = (processingdate, inputid) لآخر سطر في الصفحة اللي قبل (keyset).
+    job_stage = stage آخر job للـ input (None للسجلات القديمة بدون job = منتهية):
+    RecitationInput ينحفظ قبل المعالجة، فبدونه الـ queued/failed تطلع "سليمة" (0 أخطاء).
+    """
+    # عدد الأخطاء من عدادات RecitationInput (تنحسب وقت الحفظ) بدل GROUP BY على جدول الكلمات
+    errors_count = (
+        func.coalesce(RecitationInput.missingcount, 0)
+        + func.coalesce(RecitationInput.extracount, 0)
+        + func.coalesce(RecitationInput.wrongcount, 0)
+    )
+    q = (
+        db.session.query(
+            RecitationInput,
+            QuranSurah.surahname.label("surahname"),
+            errors_count.label("errors_count"),
+            _latest_job_stage().label("job_stage"),
+        )
+        .outerjoin(QuranSurah, QuranSurah.surahid == RecitationInput.surahid)
+        .filter(RecitationInput.verifierid == user_id)
+    )
+
+    if cursor is not None:
+        c_date, c_id = cursor
+        if c_date is not None:
+            q = q.filter(or_(
+                RecitationInput.processingdate < c_date,
+                and_(RecitationInput.processingdate == c_date, RecitationInput.inputid < c_id),
+                RecitationInput.processingdate.is_(None),
+            ))
+        else:
+            q = q.filter(RecitationInput.processingdate.is_(None), RecitationInput.inputid < c_id)
+
+    return q.order_by(RecitationInput.processingdate.desc().nullslast(), RecitationInput.inputid.desc())
@@ -0,0 +1,473 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from itertools import groupby
+from typing import NamedTuple
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app import db
+from app.models import QuranAyah, QuranWord
+from app.arabic import LENIENT, NORMALIZER_VERSION, STRICT, text_tokens, word_tokens
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+SURAH_COUNT = 114
+
+NGRAM = 3                        # طول الـ n-gram (كلمات) في الـ inverted index
+MAX_NGRAM_HITS = 64              # n-gram يتكرر أكثر من كذا (مثل البسملة) ما يفيد بالتصويت
+DIAG_BIN = 32                    # دقة التصويت على القطر (g - j) بالكلمات
+MAX_CHAIN_GAP = 40               # قفزة أكبر من كذا بين hits متتالية = مقطع ثاني
+
+INDEX_FORMAT = 2                 # يتغير لو تغير شكل الملفات المحفوظة
+
+_ARRAYS = (
+    "token_ids",         # [W] رقم الكلمة (normalized) في vocab
+    "word_ayah",         # [W] رقم الآية (global position 0..6235) لكل كلمة
+    "ayah_word_start",   # [A+1] offset أول كلمة في كل آية
+    "ayah_surah",        # [A] surahid
+    "ayah_number",       # [A] ayahnumber
+    "ayah_id",           # [A] ayahid (PK في quran_ayah)
+    "surah_ayah_start",  # [116] offset أول آية في كل سورة (index = surahid)
+    "ngram_keys",        # [G] مفاتيح الـ n-grams مرتبة (inverted index)
+    "ngram_pos",         # [G] موقع أول كلمة (global word position) لكل مفتاح
+)
+
+
+class Detection(NamedTuple):
+    """نفس أعمدة RecitationInput: surahid / startayah / endayah (+ score 0..100)."""
+    surahid: int
+    startayah: int
+    endayah: int
+    score: float
+
+
+def fill_recitation_input(rec, detection):
+    """يعبي RecitationInput.surahid/startayah/endayah من نتيجة locate."""
+    if detection is None:
+        return rec
+    rec.surahid = detection.surahid
+    rec.startayah = detection.startayah
+    rec.endayah = detection.endayah
+    return rec
+
+
+def ayah_hash(text):
+    """md5 حق نص الآية (اللي انبنت منه كلمات quran_word)."""
+    return hashlib.md5((text or "").strip().encode("utf-8")).hexdigest()
+
+
+def word_rows(rows):
+    """
+    rows (ayahid, surahid, ayahnumber, ayahtext) -> صفوف QuranWord.
+    كلمة = token بعد normalize (نفس text_tokens)، فـ wordpos = global word position حق الـ index.
+    """
+    pos = 0
+    for aid, sid, num, text in rows:
+        digest = ayah_hash(text)
+        k = 0
+        for piece in (text or "").split():
+            for strict, lenient in zip(word_tokens(piece, STRICT), word_tokens(piece, LENIENT)):
+                k += 1
+                yield {
+                    "surahid": sid, "ayahnumber": num, "word_index": k, "ayahid": aid,
+                    "wordpos": pos, "word": piece, "norm_strict": strict, "norm_lenient": lenient,
+                    "norm_version": NORMALIZER_VERSION, "ayah_hash": digest,
+                }
+                pos += 1
+
+
+def _ngram_keys(ids, vocab_size):
+    """مفتاح int64 لكل n-gram متتالي (ids لازم int64)."""
+    keys = np.zeros(len(ids) - NGRAM + 1, dtype=np.int64)
+    for k in range(NGRAM):
+        keys = keys * vocab_size + ids[k:len(ids) - NGRAM + 1 + k]
+    return keys
+
+
+def _longest_chain(js, gs):
+    """
+    أطول سلسلة hits فيها j و g يزيدون مع بعض (LIS على g بعد الترتيب على j).
+    js مرتبة تصاعدي، و g تنازلي داخل نفس j عشان ما ناخذ hit مرتين لنفس الكلمة.
+    """
+    tails, tails_idx = [], []
+    prev = [-1] * len(gs)
+    for k, g in enumerate(gs):
+        pos = bisect_left(tails, g)
+        if pos > 0:
+            prev[k] = tails_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(g)
+            tails_idx.append(k)
+        else:
+            tails[pos] = g
+            tails_idx[pos] = k
+
+    chain = []
+    k = tails_idx[-1] if tails_idx else -1
+    while k >= 0:
+        chain.append((js[k], gs[k]))
+        k = prev[k]
+    chain.reverse()
+    return chain
+
+
+# ----------------------------
+# Index
+# ----------------------------
+class QuranIndex:
+    """
+    كل المصحف (6236 آية) normalized + tokenized مرة وحدة.
+
+    المصفوفات numpy (ممكن تكون memory-mapped من ملف مشترك بين gunicorn workers)،
+    و vocab + نصوص الآيات الأصلية في meta.json.
+    """
+
+    def __init__(self, fingerprint, vocab, ayah_texts, arrays):
+        self.fingerprint = tuple(fingerprint)
+        self.vocab = vocab
+        self.ayah_texts = ayah_texts
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+
+        self._words_cache = {}
+        self._vocab_ids = {tok: i for i, tok in enumerate(vocab)}
+
+    # ---------- build ----------
+    @classmethod
+    def build(cls, rows, fingerprint, words=None):
+        """
+        rows: (ayahid, surahid, ayahnumber, ayahtext) مرتبة surahid, ayahnumber.
+        words: (ayahid, norm_strict, ayah_hash) مرتبة wordpos من quran_word (بدون normalize)، أو None.
+        آية كلماتها مو موجودة أو ayah_hash حقها ما يطابق نصها الحالي -> text_tokens (نص جديد ما انعمل له backfill).
+        """
+        by_ayah = {}
+        if words is not None:
+            for aid, g in groupby(words, key=lambda w: w[0]):
+                g = list(g)
+                by_ayah[aid] = (g[0][2], [w[1] for w in g])
+        vocab, vocab_ids = [], {}
+        token_ids, word_ayah = [], []
+        ayah_word_start = [0]
+        ayah_surah, ayah_number, ayah_id, ayah_texts = [], [], [], []
+        surah_ayah_start = [0] * (SURAH_COUNT + 2)
+
+        for pos, (aid, sid, num, text) in enumerate(rows):
+            text = (text or "").strip()
+            stored = by_ayah.get(aid)
+            toks = stored[1] if stored and stored[0] == ayah_hash(text) else text_tokens(text)
+            for tok in toks:
+                tid = vocab_ids.get(tok)
+                if tid is None:
+                    tid = vocab_ids[tok] = len(vocab)
+                    vocab.append(tok)
+                token_ids.append(tid)
+                word_ayah.append(pos)
+            ayah_word_start.append(len(token_ids))
+            ayah_surah.append(sid)
+            ayah_number.append(num)
+            ayah_id.append(aid)
+            ayah_texts.append(text)
+            surah_ayah_start[sid + 1] = pos + 1
+
+        # سور ما لها آيات (نادر) تاخذ نفس offset اللي قبلها
+        for s in range(1, SURAH_COUNT + 2):
+            surah_ayah_start[s] = max(surah_ayah_start[s], surah_ayah_start[s - 1])
+
+        # inverted index: كل n-gram داخل نفس السورة -> موقعه
+        ids = np.asarray(token_ids, dtype=np.int64)
+        word_surah = np.asarray(ayah_surah, dtype=np.int32)[np.asarray(word_ayah, dtype=np.int32)]
+        if len(ids) >= NGRAM:
+            keys = _ngram_keys(ids, max(1, len(vocab)))
+            starts = np.arange(len(keys), dtype=np.int32)
+            same_surah = word_surah[:len(keys)] == word_surah[NGRAM - 1:]
+            keys, starts = keys[same_surah], starts[same_surah]
+            order = np.argsort(keys, kind="stable")
+            ngram_keys, ngram_pos = keys[order], starts[order]
+        else:
+            ngram_keys = np.zeros(0, dtype=np.int64)
+            ngram_pos = np.zeros(0, dtype=np.int32)
+
+        arrays = {
+            "token_ids": np.asarray(token_ids, dtype=np.int32),
+            "word_ayah": np.asarray(word_ayah, dtype=np.int32),
+            "ayah_word_start": np.asarray(ayah_word_start, dtype=np.int32),
+            "ayah_surah": np.asarray(ayah_surah, dtype=np.int32),
+            "ayah_number": np.asarray(ayah_number, dtype=np.int32),
+            "ayah_id": np.asarray(ayah_id, dtype=np.int32),
+            "surah_ayah_start": np.asarray(surah_ayah_start, dtype=np.int32),
+            "ngram_keys": ngram_keys,
+            "ngram_pos": ngram_pos.astype(np.int32),
+        }
+        return cls(fingerprint, vocab, ayah_texts, arrays)
+
+    # ---------- disk (memory-mapped) ----------
+    @staticmethod
+    def _tag(fingerprint):
+        payload = json.dumps([INDEX_FORMAT, *fingerprint]).encode()
+        return hashlib.sha1(payload).hexdigest()[:12]
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"quran_index-{self._tag(self.fingerprint)}")
+
+        for name in _ARRAYS:
+            tmp = f"{base}.{name}.tmp.npy"
+            np.save(tmp, np.asarray(getattr(self, name)))
+            os.replace(tmp, f"{base}.{name}.npy")
+
+        # meta آخر شي: وجوده معناه الملفات كاملة
+        tmp = f"{base}.meta.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": list(self.fingerprint),
+                "vocab": self.vocab,
+                "ayah_texts": self.ayah_texts,
+            }, f, ensure_ascii=False)
+        os.replace(tmp, f"{base}.meta.json")
+
+    @classmethod
+    def load(cls, directory, fingerprint):
+        base = os.path.join(directory, f"quran_index-{cls._tag(fingerprint)}")
+        if not os.path.exists(f"{base}.meta.json"):
+            return None
+        if not all(os.path.exists(f"{base}.{name}.npy") for name in _ARRAYS):
+            return None
+
+        with open(f"{base}.meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta["fingerprint"]) != tuple(fingerprint):
+            return None
+
+        arrays = {name: np.load(f"{base}.{name}.npy", mmap_mode="r") for name in _ARRAYS}
+        return cls(fingerprint, meta["vocab"], meta["ayah_texts"], arrays)
+
+    # ---------- lookups (بدون DB) ----------
+    def _ayah_range(self, surah_no):
+        if surah_no < 1 or surah_no > SURAH_COUNT:
+            return 0, 0
+        return int(self.surah_ayah_start[surah_no]), int(self.surah_ayah_start[surah_no + 1])
+
+    def _word_range(self, surah_no, start_ayah=None, end_ayah=None):
+        a0, a1 = self._ayah_range(surah_no)
+        numbers = self.ayah_number[a0:a1]
+        if start_ayah is not None:
+            a0 += int(np.searchsorted(numbers, start_ayah, "left"))
+        if end_ayah is not None:
+            a1 = a1 - len(numbers) + int(np.searchsorted(numbers, end_ayah, "right"))
+        a1 = max(a0, a1)
+        return int(self.ayah_word_start[a0]), int(self.ayah_word_start[a1])
+
+    def surah_ayat(self, surah_no):
+        """[(ayahnumber, ayahtext), ...] مثل get_surah_ayat_from_db."""
+        a0, a1 = self._ayah_range(surah_no)
+        return [
+            (int(self.ayah_number[p]), self.ayah_texts[p])
+            for p in range(a0, a1) if self.ayah_texts[p]
+        ]
+
+    def surah_words(self, surah_no, start_ayah=None, end_ayah=None):
+        """كلمات السورة normalized (نفس get_surah_words_from_db)، واختياري مدى آيات."""
+        words = self._words_cache.get(surah_no)
+        if words is None:
+            w0, w1 = self._word_range(surah_no)
+            vocab = self.vocab
+            words = [vocab[t] for t in self.token_ids[w0:w1].tolist()]
+            self._words_cache[surah_no] = words
+        if start_ayah is None and end_ayah is None:
+            return list(words)
+        base = self._word_range(surah_no)[0]
+        w0, w1 = self._word_range(surah_no, start_ayah, end_ayah)
+        return words[w0 - base:w1 - base]
+
+    def surah_word_ayahs(self, surah_no, start_ayah=None, end_ayah=None):
+        """رقم الآية لكل كلمة (نفس ref_to_ayah في build_ref_word_to_ayah_map)."""
+        w0, w1 = self._word_range(surah_no, start_ayah, end_ayah)
+        return self.ayah_number[self.word_ayah[w0:w1]].tolist()
+
+    def surah_word_ayah_ids(self, surah_no, start_ayah=None, end_ayah=None):
+        """ayahid لكل كلمة (لـ referenceayahid)."""
+        w0, w1 = self._word_range(surah_no, start_ayah, end_ayah)
+        return self.ayah_id[self.word_ayah[w0:w1]].tolist()
+
+    # ---------- locate (n-gram voting) ----------
+    def locate(self, hyp_tokens, surahid=None):
+        """
+        يحدد مكان التلاوة في المصحف كامل (حتى لو بدأ القارئ من نص السورة):
+          1) كل n-gram من الـ hypothesis -> hits من الـ inverted index
+          2) تصويت على القطر (g - j) -> أقوى سورة
+          3) أطول سلسلة hits متسقة داخل السورة -> أول وآخر آية
+        surahid: السورة معروفة (من المستخدم) -> نحدد المدى داخلها بس.
+        يرجع Detection أو None.
+        """
+        if len(hyp_tokens) < NGRAM or not len(self.ngram_keys):
+            return None
+
+        ids = np.fromiter(
+            (self._vocab_ids.get(t, -1) for t in hyp_tokens),
+            dtype=np.int64, count=len(hyp_tokens),
+        )
+        keys = _ngram_keys(np.maximum(ids, 0), max(1, len(self.vocab)))
+        known = np.ones(len(keys), dtype=bool)
+        for k in range(NGRAM):
+            known &= ids[k:len(ids) - NGRAM + 1 + k] >= 0
+        total = int(known.sum())
+        hyp_pos = np.nonzero(known)[0]
+        keys = keys[known]
+
+        lo = np.searchsorted(self.ngram_keys, keys, "left")
+        cnt = np.searchsorted(self.ngram_keys, keys, "right") - lo
+        keep = (cnt > 0) & (cnt <= MAX_NGRAM_HITS)
+        hyp_pos, lo, cnt = hyp_pos[keep], lo[keep], cnt[keep]
+        if not len(cnt):
+            return None
+
+        # فك الـ ranges: كل hit = (j في hyp, g في المصحف)
+        first = np.repeat(np.cumsum(cnt) - cnt, cnt)
+        js = np.repeat(hyp_pos, cnt)
+        gs = np.asarray(self.ngram_pos)[np.repeat(lo, cnt) + np.arange(int(cnt.sum())) - first]
+        weights = np.repeat(1.0 / cnt, cnt)   # n-gram نادر صوته أقوى
+        surahs = np.asarray(self.ayah_surah)[np.asarray(self.word_ayah)[gs]]
+        if surahid is not None:
+            mine = surahs == surahid
+            if not mine.any():
+                return None
+            gs, js, weights, surahs = gs[mine], js[mine], weights[mine], surahs[mine]
+
+        # (2) أقوى قطر (مع الجيران عشان الانزياح البسيط)
+        diag = (gs.astype(np.int64) - js) // DIAG_BIN
+        dmin = int(diag.min())
+        votes = np.bincount(diag - dmin, weights=weights)
+        smooth = votes.copy()
+        smooth[1:] += votes[:-1]
+        smooth[:-1] += votes[1:]
+        peak = int(np.argmax(smooth)) + dmin
+        near = np.abs(diag - peak) <= 1
+        surah = int(np.argmax(np.bincount(surahs[near], weights=weights[near])))
+
+        # (3) السلسلة داخل السورة -> نقسمها عند القفزات وناخذ أكبر مقطع
+        sel = surahs == surah
+        order = np.lexsort((-gs[sel], js[sel]))
+        chain = _longest_chain(js[sel][order].tolist(), gs[sel][order].tolist())
+
+        best, cur = [], [chain[0]]
+        for (j0, g0), (j1, g1) in zip(chain, chain[1:]):
+            if abs((g1 - g0) - (j1 - j0)) > MAX_CHAIN_GAP:
+                if len(cur) > len(best):
+                    best = cur
+                cur = []
+            cur.append((j1, g1))
+        if len(cur) > len(best):
+            best = cur
+
+        g_start, g_end = best[0][1], best[-1][1] + NGRAM - 1
+        start_ayah = int(self.ayah_number[self.word_ayah[g_start]])
+        end_ayah = int(self.ayah_number[self.word_ayah[g_end]])
+        score = round(100.0 * len(best) / max(1, total), 2)
+        return Detection(surah, start_ayah, end_ayah, score)
+
+
+# ----------------------------
+# Process-wide instance
+# ----------------------------
+_lock = threading.Lock()
+_index = None
+_checked_at = 0.0
+
+
+def _fingerprint():
+    # أي تعديل في quran_ayah (إضافة/حذف/تعديل نص حتى لو بنفس الطول) يغير الـ md5
+    # md5 على "ayahid:ayahtext|..." بترتيب ayahid -> نفس القيمة في Postgres و SQLite
+    count, max_id = db.session.query(func.count(QuranAyah.ayahid), func.max(QuranAyah.ayahid)).one()
+    if db.engine.dialect.name == "postgresql":
+        entry = func.concat(QuranAyah.ayahid, ":", func.coalesce(QuranAyah.ayahtext, ""))
+        digest = db.session.query(
+            func.md5(func.string_agg(entry, aggregate_order_by(literal("|"), QuranAyah.ayahid)))
+        ).scalar()
+    else:
+        # SQLite: group_concat ما يضمن الترتيب -> نحسبه هنا (6236 صف)
+        rows = db.session.query(QuranAyah.ayahid, QuranAyah.ayahtext).order_by(QuranAyah.ayahid.asc())
+        payload = "|".join(f"{ayahid}:{text or ''}" for ayahid, text in rows)
+        digest = hashlib.md5(payload.encode("utf-8")).hexdigest() if count else None
+    return (int(count or 0), int(max_id or 0), digest or "")
+
+
+def _fetch_rows():
+    return (
+        db.session.query(
+            QuranAyah.ayahid,
+            QuranAyah.surahid,
+            QuranAyah.ayahnumber,
+            QuranAyah.ayahtext,
+        )
+        .order_by(QuranAyah.surahid.asc(), QuranAyah.ayahnumber.asc())
+        .all()
+    )
+
+
+def _words_fingerprint():
+    # بس صفوف نسخة الـ normalizer الحالية (الأقدم منها = كأنها مو موجودة)
+    count, ayat, max_id = (
+        db.session.query(
+            func.count(QuranWord.wordpos),
+            func.count(func.distinct(QuranWord.ayahid)),
+            func.max(QuranWord.ayahid),
+        )
+        .filter(QuranWord.norm_version == NORMALIZER_VERSION)
+        .one()
+    )
+    return (int(count or 0), int(ayat or 0), int(max_id or 0))
+
+
+def _fetch_words():
+    # index scan وحد على ix_quran_word_pos
+    return (
+        db.session.query(QuranWord.ayahid, QuranWord.norm_strict, QuranWord.ayah_hash)
+        .filter(QuranWord.norm_version == NORMALIZER_VERSION)
+        .order_by(QuranWord.wordpos.asc())
+        .all()
+    )
+
+
+def get_quran_index():
+    """
+    يرجع الـ index المشترك (لازم app context).
+    - يتحقق من fingerprint حق quran_ayah كل QURAN_INDEX_CHECK_SECONDS
+    - لو quran_word معبّى لكل الآيات (بنسخة الـ normalizer الحالية) ياخذ الكلمات normalized منه
+      (وإلا normalize من ayahtext)، وأي آية تغير نصها بعد الـ backfill ترجع لـ text_tokens
+    - لو QURAN_INDEX_DIR مضبوط: يحمّل الملف memory-mapped (أو يبنيه ويحفظه مرة وحدة)
+    """
+    global _index, _checked_at
+
+    now = time.monotonic()
+    check_every = current_app.config.get("QURAN_INDEX_CHECK_SECONDS", 60)
+    if _index is not None and now - _checked_at < check_every:
+        return _index
+
+    with _lock:
+        if _index is not None and time.monotonic() - _checked_at < check_every:
+            return _index
+
+        fp = _fingerprint()
+        wfp = _words_fingerprint()
+        use_words = wfp[1] == fp[0] and wfp[2] == fp[1] and fp[0] > 0
+        fp = fp + (wfp[0] if use_words else 0, NORMALIZER_VERSION)
+        if _index is None or _index.fingerprint != fp:
+            directory = current_app.config.get("QURAN_INDEX_DIR")
+            index = QuranIndex.load(directory, fp) if directory else None
+            if index is None:
+                index = QuranIndex.build(_fetch_rows(), fp, _fetch_words() if use_words else None)
+                if directory:
+                    index.save(directory)
+            _index = index
+
+        _checked_at = time.monotonic()
+        return _index
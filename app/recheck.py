@@ -0,0 +1,191 @@
+"""
+فحص صوتي (محافظ) للكلمات المشكوك فيها — batched.
+
+قبل: لكل تحريف مرشح transcribe مرتين (neutral + guided) = مئات الـ decoder calls
+للتلاوة الضعيفة. الحين:
+  (1) نجمع كل المرشحين من levenshtein_ops ونلم النوافذ المتداخلة في نافذة وحدة
+  (2) الـ neutral pass لكل النوافذ في BatchedInferencePipeline واحد (clip_timestamps) مع
+      word timestamps، وكل مرشح يتقيم بس على كلماته هو: [time - CLIP_LEFT, time + CLIP_RIGHT]
+      (مو النافذة المدموجة كاملة اللي ممكن توصل 30 ثانية فيها expected من مكان ثاني)
+  (3) الـ guided pass (prompt خاص لكل كلمة) فقط للي نجح في الـ neutral —
+      القرار AND فاللي فشل ما يحتاجه
+"""
+import math
+from typing import NamedTuple
+
+import numpy as np
+from rapidfuzz import fuzz
+
+from app.arabic import normalize_ar
+from app.audio import SAMPLE_RATE, clip_pcm
+from app.metrics import stage
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+AUDIO_MARGIN = 10                # لازم expected يفوز بفارق واضح عشان نصحح
+CLIP_LEFT = 1.0                  # ثواني قبل الكلمة
+CLIP_RIGHT = 1.5                 # ثواني بعد الكلمة
+MAX_WINDOW_SECONDS = 30.0        # Whisper يشوف 30 ثانية بالكثير لكل clip
+RECHECK_BATCH_SIZE = 8
+
+FRAMES_PER_SECOND = 100          # Segment.seek = offset * 100 (نستخدمه نرجع كل segment لنافذته)
+
+CLIP_KWARGS = dict(
+    language="ar",
+    beam_size=8,
+    temperature=0.0,
+    best_of=1,
+    condition_on_previous_text=False,
+)
+
+
+class Candidate(NamedTuple):
+    hyp_index: int
+    ref_index: int
+    time: float
+    actual: str
+    expected: str
+    prompt: str
+
+
+def merge_windows(times, left=CLIP_LEFT, right=CLIP_RIGHT, max_len=MAX_WINDOW_SECONDS):
+    """
+    [t-left, t+right] لكل وقت، والمتداخل يندمج (بحد max_len).
+    يرجع (windows [(start, end)], owner) — owner[i] = رقم نافذة الوقت i.
+    """
+    order = sorted(range(len(times)), key=lambda i: times[i])
+    windows, owner = [], [0] * len(times)
+    for i in order:
+        start, end = max(0.0, times[i] - left), times[i] + right
+        if windows and start <= windows[-1][1] and end - windows[-1][0] <= max_len:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+        owner[i] = len(windows) - 1
+    return [tuple(w) for w in windows], owner
+
+
+def pack_clips(clips):
+    """
+    يلصق الـ clips في buffer واحد ويرجع (audio, clip_timestamps بالثواني).
+    نرسل للـ worker الأجزاء اللي نحتاجها بس، مو التسجيل كامل.
+    """
+    clips = [np.asarray(c, dtype=np.float32) for c in clips]
+    stamps, pos = [], 0
+    for c in clips:
+        stamps.append({"start": pos / SAMPLE_RATE, "end": (pos + len(c)) / SAMPLE_RATE})
+        pos += len(c)
+    audio = np.concatenate(clips) if clips else np.zeros(0, dtype=np.float32)
+    return audio, stamps
+
+
+def clip_segments(model, clips, kwargs, batch_size=RECHECK_BATCH_SIZE):
+    """
+    الـ clips ملصوقة في BatchedInferencePipeline واحد -> ([[segment] لكل clip], stamps).
+    model: AsrClient (الـ worker عنده الـ pipeline) أو WhisperModel محلي.
+    """
+    audio, stamps = pack_clips(clips)
+    kwargs = dict(kwargs, clip_timestamps=stamps, batch_size=batch_size)
+    if hasattr(model, "transcribe_batched"):
+        segments, _ = model.transcribe_batched(audio, **kwargs)
+    else:
+        from faster_whisper import BatchedInferencePipeline
+        segments, _ = BatchedInferencePipeline(model).transcribe(audio, **kwargs)
+
+    # seek = int(offset * 100): نفس الحساب اللي يسويه faster_whisper
+    by_seek = {
+        int(int(st["start"] * SAMPLE_RATE) / SAMPLE_RATE * FRAMES_PER_SECOND): k
+        for k, st in enumerate(stamps)
+    }
+    out = [[] for _ in clips]
+    for s in segments:
+        k = by_seek.get(s.seek)
+        if k is not None:
+            out[k].append(s)
+    return out, stamps
+
+
+def clip_words(model, clips, kwargs, batch_size=RECHECK_BATCH_SIZE):
+    """نفس clip_segments مع word timestamps -> [[{"word", "start", "end"}] لكل clip] بأوقات من بداية الـ clip."""
+    if not clips:
+        return []
+
+    per_clip, stamps = clip_segments(model, clips, dict(kwargs, word_timestamps=True), batch_size)
+    out = []
+    for segs, st in zip(per_clip, stamps):
+        # أوقات الـ words على الـ buffer الملصوق -> نرجعها لوقتها داخل الـ clip
+        shift = -st["start"]
+        out.append([
+            {"word": w.word.strip(), "start": float(w.start) + shift, "end": float(w.end) + shift}
+            for s in segs for w in (getattr(s, "words", None) or ()) if (w.word or "").strip()
+        ])
+    return out
+
+
+def transcribe_clips(model, clips, prompt=None, batch_size=RECHECK_BATCH_SIZE):
+    """كل الـ clips في BatchedInferencePipeline واحد -> نص (normalized) لكل clip."""
+    if not clips:
+        return []
+
+    kwargs = dict(CLIP_KWARGS, initial_prompt=prompt, without_timestamps=True, word_timestamps=False)
+    per_clip, _ = clip_segments(model, clips, kwargs, batch_size)
+    return [normalize_ar(" ".join(s.text.strip() for s in segs)) for segs in per_clip]
+
+
+def clip_text(model, clip, prompt):
+    segs, _ = model.transcribe(clip, vad_filter=False, initial_prompt=prompt, **CLIP_KWARGS)
+    txt = " ".join([s.text.strip() for s in segs]).strip()
+    return normalize_ar(txt)
+
+
+def _wins(text, actual, expected):
+    return (fuzz.token_set_ratio(text, normalize_ar(expected))
+            - fuzz.token_set_ratio(text, normalize_ar(actual))) >= AUDIO_MARGIN
+
+
+def audio_recheck(model, pcm, candidates, batch_size=RECHECK_BATCH_SIZE):
+    """
+    يرجع (approved: set(hyp_index), stats).
+    stats يوضح كم decoder call وفرنا مقارنة بـ 2 transcribe لكل مرشح.
+    """
+    stats = {
+        "candidates": len(candidates),
+        "windows": 0,
+        "neutral_batches": 0,
+        "guided": 0,
+        "decoder_calls": 0,
+        "decoder_calls_before": 2 * len(candidates),
+        "saved": 0,
+    }
+    if not candidates:
+        return set(), stats
+
+    with stage("recheck", items=len(candidates)) as span:
+        windows, owner = merge_windows([c.time for c in candidates])
+        words = clip_words(model, [clip_pcm(pcm, s, e) for s, e in windows], CLIP_KWARGS, batch_size)
+
+        approved = set()
+        for i, c in enumerate(candidates):
+            # بس كلمات المرشح نفسه من النافذة المدموجة (نفس مدى الـ clip القديم)
+            start = windows[owner[i]][0]
+            lo, hi = c.time - CLIP_LEFT, c.time + CLIP_RIGHT
+            neutral = normalize_ar(" ".join(
+                w["word"] for w in words[owner[i]]
+                if lo <= start + (w["start"] + w["end"]) / 2 <= hi
+            ))
+            if not _wins(neutral, c.actual, c.expected):
+                continue
+            # guided: نافذة الكلمة نفسها (مثل قبل) لأن الـ prompt خاص فيها
+            clip = clip_pcm(pcm, c.time - CLIP_LEFT, c.time + CLIP_RIGHT)
+            stats["guided"] += 1
+            if _wins(clip_text(model, clip, c.prompt), c.actual, c.expected):
+                approved.add(c.hyp_index)
+
+        stats["windows"] = len(windows)
+        stats["neutral_batches"] = math.ceil(len(windows) / batch_size)
+        stats["decoder_calls"] = stats["neutral_batches"] + stats["guided"]
+        stats["saved"] = stats["decoder_calls_before"] - stats["decoder_calls"]
+        span.fields.update(windows=stats["windows"], decoder_calls=stats["decoder_calls"])
+    return approved, stats
@@ -1,8 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, jsonify
+from flask import Response
 from werkzeug.utils import secure_filename
 
 from app import db
-from sqlalchemy import func
 
 from app.models import (
     VerifierUser,
@@ -10,12 +10,24 @@ from app.models import (
     QuranSurah,
     QuranAyah,
     ErrorDetails,
-    RecitationWordDetails
+    VerificationJob,
+    JobAyahResult
 )
 from flask_mail import Message
 from . import mail
+from app.jobs import submit_verification, job_status
+from app.audio import decode_stream_to_wav, AudioDecodeError, SAMPLE_RATE
+from app.asr_client import AsrClient
+from app.quran_index import get_quran_index
+from app.persistence import error_message
+from app.queries import history_query, word_details_query, word_errors_query
+from app import live_session
+from app.metrics import render_prometheus, shared_snapshot, stage
 
-import os, subprocess, uuid
+import numpy as np
+
+import os, uuid, json
+from datetime import datetime
 
 main = Blueprint("main", __name__)
 
@@ -69,10 +81,42 @@ def about():
 def upload():
     if not session.get("user_id"):
         return redirect(url_for("auth.login"))
-    return render_template("upload.html")
+    surahs = QuranSurah.query.order_by(QuranSurah.surahid.asc()).all()
+    return render_template("upload.html", surahs=surahs)
+
+def _job_accepted(rec, job, message):
+    """JSON (202 + job id) للـ API، و flash + redirect للفورم."""
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "job_id": job.jobid,
+            "input_id": rec.inputid,
+            "stage": job.stage,
+            "status_url": url_for("main.job_status_view", job_id=job.jobid),
+        }), 202
+
+    flash(f"{message} — رقم المهمة: {job.jobid}", "success")
+    # صفحة النتائج تتعبى آية بآية (polling) لين يخلص التحقق
+    return redirect(url_for("main.results", input_id=rec.inputid))
+
+def _known_surah(values):
+    """
+    surahid/startayah اختيارية: لو المستخدم يعرف السورة -> forced alignment بدل الـ decode المفتوح.
+    آية البداية لازم تكون داخل السورة (حسب المصحف)، وإلا نتجاهل التحديد ونرجع للـ decode العادي.
+    """
+    try:
+        surahid = int(values.get("surahid") or 0)
+        startayah = int(values.get("startayah") or 1)
+    except (TypeError, ValueError):
+        return None, None
+    if not 1 <= surahid <= 114:
+        return None, None
+    ayat = get_quran_index().surah_ayat(surahid)
+    if not ayat or not ayat[0][0] <= startayah <= ayat[-1][0]:
+        return None, None
+    return surahid, startayah
 
 # =========================
-# ✅ (A) يوتيوب: زي ما هو عندك
+# ✅ (A) يوتيوب: التحميل + التحقق في الخلفية (job)
 # =========================
 @main.route("/upload/youtube", methods=["POST"])
 def youtube_verify():
@@ -85,32 +129,23 @@ def youtube_verify():
         flash("الرجاء إدخال رابط يوتيوب", "error")
         return redirect(url_for("main.upload"))
 
-    downloads_dir = os.path.join(current_app.root_path, "static", "uploads", "youtube")
-    os.makedirs(downloads_dir, exist_ok=True)
-
-    file_id = str(uuid.uuid4())
-    output_template = os.path.join(downloads_dir, f"{file_id}.%(ext)s")
-
-    try:
-        cmd = [
-            "yt-dlp",
-            "-x",
-            "--audio-format", "mp3",
-            "--audio-quality", "0",
-            "-o", output_template,
-            youtube_url
-        ]
-        subprocess.run(cmd, check=True)
-
-    except subprocess.CalledProcessError:
-        flash("صار خطأ أثناء تحميل/تحويل اليوتيوب. تأكدي من ffmpeg و yt-dlp.", "error")
-        return redirect(url_for("main.upload"))
+    surahid, startayah = _known_surah(request.form)
+    rec = RecitationInput(
+        verifierid=session["user_id"],
+        inputtype="youtube",
+        filepathorlink=youtube_url,
+        processingdate=datetime.now(),
+        surahid=surahid,
+        startayah=startayah,
+    )
+    db.session.add(rec)
+    db.session.commit()
 
-    flash("تم تحميل الصوت من اليوتيوب بنجاح ✅", "success")
-    return redirect(url_for("main.upload"))
+    job = submit_verification(rec)
+    return _job_accepted(rec, job, "تم استلام رابط اليوتيوب وبدأ التحقق ✅")
 
 # =========================
-# ✅ (B) رفع ملف + تحويله MP3 باستخدام ffmpeg (الجديد)
+# ✅ (B) رفع ملف: نفكه وهو يوصل (stream -> decoder -> wav 16kHz) ونكمل في الخلفية (job)
 # =========================
 @main.route("/upload/file", methods=["POST"])
 def file_verify():
@@ -118,45 +153,82 @@ def file_verify():
     if not session.get("user_id"):
         return redirect(url_for("auth.login"))
 
-    f = request.files.get("recitation_file")
-    if not f or f.filename.strip() == "":
-        flash("رجاءً اختاري ملف أولاً ❌", "error")
-        return redirect(url_for("main.upload"))
+    # رفع خام (Content-Type: audio/* أو video/*) -> نقرأ body مباشرة بدون multipart
+    if request.mimetype.startswith(("audio/", "video/")):
+        stream = request.stream
+        original_name = secure_filename(request.headers.get("X-Filename", ""))
+        surahid, startayah = _known_surah(request.args)
+    else:
+        f = request.files.get("recitation_file")
+        if not f or f.filename.strip() == "":
+            flash("رجاءً اختاري ملف أولاً ❌", "error")
+            return redirect(url_for("main.upload"))
+        stream = f.stream
+        original_name = secure_filename(f.filename)
+        surahid, startayah = _known_surah(request.form)
 
     uploads_dir = os.path.join(current_app.root_path, "static", "uploads", "files")
     os.makedirs(uploads_dir, exist_ok=True)
 
     file_id = str(uuid.uuid4())
-    original_name = secure_filename(f.filename)
-    ext = os.path.splitext(original_name)[1].lower()
-
-    saved_path = os.path.join(uploads_dir, f"{file_id}{ext}")
-    f.save(saved_path)
-
-    mp3_path = os.path.join(uploads_dir, f"{file_id}.mp3")
+    wav_path = os.path.join(uploads_dir, f"{file_id}.wav")
 
     try:
-        if ext == ".mp3":
-            if saved_path != mp3_path:
-                with open(saved_path, "rb") as src, open(mp3_path, "wb") as dst:
-                    dst.write(src.read())
-        else:
-            cmd = [
-                "ffmpeg",
-                "-y",
-                "-i", saved_path,
-                "-vn",
-                "-q:a", "2",
-                mp3_path
-            ]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    except subprocess.CalledProcessError:
-        flash("فشل تحويل الملف باستخدام ffmpeg ❌ تأكدي أن ffmpeg مثبت ومساره مضبوط.", "error")
+        with stage("upload", source=request.mimetype) as span:
+            span.audio_seconds = decode_stream_to_wav(stream, wav_path)
+    except AudioDecodeError:
+        if os.path.exists(wav_path):
+            os.remove(wav_path)
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"error": "could not decode audio"}), 400
+        flash("تعذر قراءة الصوت من الملف ❌ تأكدي أن الصيغة مدعومة.", "error")
         return redirect(url_for("main.upload"))
 
-    flash("تم رفع الملف وتحويله إلى MP3 بنجاح ✅", "success")
-    return redirect(url_for("main.upload"))
+    rec = RecitationInput(
+        verifierid=session["user_id"],
+        inputtype="file",
+        filepathorlink=original_name or f"{file_id}.wav",
+        processingdate=datetime.now(),
+        surahid=surahid,
+        startayah=startayah,
+    )
+    db.session.add(rec)
+    db.session.commit()
+
+    job = submit_verification(rec, audiopath=wav_path)
+    return _job_accepted(rec, job, "تم رفع الملف وبدأ التحقق ✅")
+
+@main.route("/jobs/<job_id>")
+def job_status_view(job_id):
+    """
+    حالة الـ job. ?after=<seq>: + نتائج الآيات (job_ayah_results) اللي بعد seq —
+    صفحة النتائج تسأل كل شوي (polling قصير) بدل SSE يحجز worker طول التحقق.
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    job = (
+        VerificationJob.query
+        .join(RecitationInput, RecitationInput.inputid == VerificationJob.inputid)
+        .filter(VerificationJob.jobid == job_id, RecitationInput.verifierid == user_id)
+        .first_or_404()
+    )
+    data = job_status(job)
+
+    after = request.args.get("after", type=int)
+    if after is not None:
+        results = (
+            JobAyahResult.query
+            .filter(JobAyahResult.jobid == job_id, JobAyahResult.seq > after)
+            .order_by(JobAyahResult.seq.asc())
+            .all()
+        )
+        data["ayat"] = [
+            {"seq": r.seq, "ayahnumber": r.ayahnumber, "words": json.loads(r.payload)}
+            for r in results
+        ]
+    return jsonify(data)
 
 @main.route("/add-test")
 def add_test():
@@ -174,68 +246,75 @@ def add_test():
     db.session.add(user)
     db.session.commit()
     return "Inserted ✅"
+# =========================
+# ✅ /metrics (Prometheus): توقيت المراحل في كل processes الويب (METRICS_DIR) + asr_worker
+# =========================
+@main.route("/metrics")
+def metrics_view():
+    sources = {"web": shared_snapshot()}
+    try:
+        worker = AsrClient(current_app.config["ASR_SOCKET"], timeout=1.0).stats()
+        sources["asr_worker"] = worker.get("stages") or {}
+    except (OSError, ValueError):
+        pass  # الـ worker طافي: نرجع أرقام الويب بس
+    return Response(render_prometheus(sources), mimetype="text/plain; version=0.0.4")
+
+HISTORY_PAGE_SIZE = 20
+
 @main.route("/history")
 def history():
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("auth.login"))
 
-    # ✅ rows: تجيب السجل + اسم السورة + عدد الأخطاء من جدول الكلمات
-    rows = (
-        db.session.query(
-            RecitationInput,
-            QuranSurah.surahname.label("surahname"),
-            func.count(RecitationWordDetails.wordid)
-                .filter(RecitationWordDetails.status != "صحيح")
-                .label("errors_count"),
-        )
-        .outerjoin(QuranSurah, QuranSurah.surahid == RecitationInput.surahid)
-        .outerjoin(RecitationWordDetails, RecitationWordDetails.inputid == RecitationInput.inputid)
-        .filter(RecitationInput.verifierid == user_id)
-        .group_by(RecitationInput.inputid, QuranSurah.surahname)
-        .order_by(RecitationInput.processingdate.desc().nullslast())
-        .all()
-    )
+    # ✅ keyset pagination: (processingdate DESC NULLS LAST, inputid DESC)
+    cursor = _parse_history_cursor(request.args.get("before"))
+    rows = history_query(user_id, cursor).limit(HISTORY_PAGE_SIZE + 1).all()
 
-    input_ids = [r.RecitationInput.inputid for r in rows]
-
-    # ✅ errors_map: تفاصيل الأخطاء من جدول الكلمات (ناقص/زائد/تحريف)
-    errors_map = {}
-    if input_ids:
-        word_errs = (
-            db.session.query(
-                RecitationWordDetails.inputid,
-                RecitationWordDetails.ayahnumber,
-                RecitationWordDetails.status,
-                RecitationWordDetails.expected_word,
-                RecitationWordDetails.spoken_word,
-            )
-            .filter(RecitationWordDetails.inputid.in_(input_ids))
-            .filter(RecitationWordDetails.status.in_(["ناقص", "زائد", "تحريف"]))
-            .order_by(
-                RecitationWordDetails.inputid.asc(),
-                RecitationWordDetails.ayahnumber.asc().nullslast(),
-                RecitationWordDetails.word_index.asc().nullslast(),
-            )
-            .all()
-        )
+    next_cursor = None
+    if len(rows) > HISTORY_PAGE_SIZE:
+        rows = rows[:HISTORY_PAGE_SIZE]
+        last = rows[-1].RecitationInput
+        next_cursor = _history_cursor(last.processingdate, last.inputid)
+
+    return render_template("history.html", rows=rows, next_cursor=next_cursor,
+                           first_page=cursor is None)
+
+
+def _history_cursor(date, inputid):
+    return f"{date.isoformat() if date else ''}_{inputid}"
 
-        for inputid, ayahnumber, status, expected_word, spoken_word in word_errs:
-            # اسم نوع الخطأ اللي تبينه في الواجهة
-            if status == "ناقص":
-                msg = f"نقص كلمة: {expected_word or ''}".strip()
-            elif status == "زائد":
-                msg = f"زيادة كلمة: {spoken_word or ''}".strip()
-            else:  # تحريف
-                msg = f"تحريف: المتوقع '{expected_word or ''}' — المنطوق '{spoken_word or ''}'".strip()
 
-            errors_map.setdefault(inputid, []).append({
-                "ayahnumber": ayahnumber,
-                "errortype": status,          # (ناقص/زائد/تحريف)
-                "mismatchedtext": msg,
-            })
+def _parse_history_cursor(value):
+    # "<processingdate iso أو فاضي>_<inputid>" ؛ أي شي غلط = الصفحة الأولى
+    if not value:
+        return None
+    date_s, _, id_s = value.rpartition("_")
+    try:
+        return (datetime.fromisoformat(date_s) if date_s else None), int(id_s)
+    except ValueError:
+        return None
+
+
+@main.route("/history/<int:input_id>/errors")
+def history_errors(input_id):
+    """تفاصيل الأخطاء لتلاوة وحدة (تنطلب لما المستخدم يفتح التفاصيل)."""
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    rec = RecitationInput.query.filter_by(inputid=input_id, verifierid=user_id).first_or_404()
+
+    word_errs = word_errors_query(rec.inputid).all()
 
-    return render_template("history.html", rows=rows, errors_map=errors_map)
+    return jsonify([
+        {
+            "ayahnumber": ayahnumber,
+            "errortype": status,          # (ناقص/زائد/تحريف)
+            "mismatchedtext": error_message(status, expected_word, spoken_word),
+        }
+        for ayahnumber, status, expected_word, spoken_word in word_errs
+    ])
 
 @main.route("/results/<int:input_id>")
 def results(input_id):
@@ -254,16 +333,7 @@ def results(input_id):
     )
 
     # الجديد: جدول الكلمات
-    word_details = (
-        RecitationWordDetails.query
-        .filter_by(inputid=rec.inputid)
-        .order_by(
-            RecitationWordDetails.ayahnumber.asc().nullslast(),
-            RecitationWordDetails.word_index.asc().nullslast(),
-            RecitationWordDetails.starttime.asc().nullslast(),
-            RecitationWordDetails.wordid.asc())
-        .all()
-    )
+    word_details = word_details_query(rec.inputid).all()
 
     # Counts من جدول الكلمات (عشان الكروت + )
     correct_count = sum(1 for w in word_details if w.status == "صحيح")
@@ -278,6 +348,15 @@ def results(input_id):
     errors_count = missing_count + extra_count + wrong_count
     is_ok = errors_count == 0
 
+    # لو التحقق لسه شغال: الصفحة تتعبى مباشرة من /jobs/<id>?after=seq
+    live_job = (
+        VerificationJob.query
+        .filter_by(inputid=rec.inputid)
+        .filter(VerificationJob.stage.notin_(["done", "failed"]))
+        .order_by(VerificationJob.created_at.desc())
+        .first()
+    )
+
     return render_template(
         "results.html",
         rec=rec,
@@ -289,7 +368,8 @@ def results(input_id):
         extra_count=extra_count,
         wrong_count=wrong_count,
         errors_count=errors_count,
-        is_ok=is_ok
+        is_ok=is_ok,
+        live_job=live_job
     )
 
 
@@ -302,4 +382,87 @@ def results_stub(input_id):
 
 @main.route("/listen")
 def listen():
-    return render_template("listen.html")
\ No newline at end of file
+    surahs = QuranSurah.query.order_by(QuranSurah.surahid.asc()).all()
+    return render_template("listen.html", surahs=surahs)
+
+# =========================
+# ✅ تسميع مباشر: المايك -> frames (POST) -> VAD + Whisper -> markers
+# =========================
+def _live_session_or_404(session_id):
+    s = live_session.get_session(session_id)
+    if s is None or s.owner != session.get("user_id"):
+        return None
+    return s
+
+@main.route("/listen/sessions", methods=["POST"])
+def listen_open():
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    surahid, start_ayah = None, 1
+    # السورة اختيارية (بدونها نكتشفها من الكلام)، بس لو انرسلت لازم تكون صحيحة
+    if data.get("surahid"):
+        surahid, start_ayah = _known_surah({"surahid": data.get("surahid"), "startayah": data.get("start_ayah")})
+        if surahid is None:
+            return jsonify({"error": "invalid surahid or start_ayah"}), 400
+
+    asr = AsrClient(current_app.config["ASR_SOCKET"])
+    if not asr.ping():
+        return jsonify({"error": "ASR worker is not running"}), 503
+
+    try:
+        s = live_session.open_session(
+            asr, get_quran_index(),
+            surahid, start_ayah,
+            owner=user_id,
+        )
+    except live_session.TooManySessions:
+        return jsonify({"error": "too many live sessions"}), 429
+
+    return jsonify({
+        "session_id": s.id,
+        "sample_rate": SAMPLE_RATE,
+        "audio_url": url_for("main.listen_audio", session_id=s.id),
+    }), 201
+
+def _read_limited(stream, limit):
+    """يقرأ لين limit بايت أو نهاية الـ body (read ممكن يرجع أقل من المطلوب)."""
+    chunks, size = [], 0
+    while size < limit:
+        chunk = stream.read(limit - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+@main.route("/listen/sessions/<session_id>/audio", methods=["POST"])
+def listen_audio(session_id):
+    """body = PCM float32 16kHz mono خام. يرجع الـ markers بعد ?after=seq."""
+    s = _live_session_or_404(session_id)
+    if s is None:
+        return jsonify({"error": "not found"}), 404
+
+    max_bytes = int(live_session.LIVE_MAX_FRAME_SECONDS * SAMPLE_RATE) * 4
+    if (request.content_length or 0) > max_bytes:
+        return jsonify({"error": "frame too large"}), 413
+
+    # بدون Content-Length (chunked) الحد فوق ما يشتغل -> نقرأ max_bytes + 1 بالكثير
+    body = _read_limited(request.stream, max_bytes + 1)
+    if len(body) > max_bytes:
+        return jsonify({"error": "frame too large"}), 413
+    if len(body) % 4:
+        return jsonify({"error": "expected float32 PCM"}), 400
+    if body:
+        s.push(np.frombuffer(body, dtype=np.float32))
+    return jsonify(s.state(request.args.get("after", 0, type=int)))
+
+@main.route("/listen/sessions/<session_id>", methods=["DELETE"])
+def listen_close(session_id):
+    s = _live_session_or_404(session_id)
+    if s is None:
+        return jsonify({"error": "not found"}), 404
+    live_session.close_session(session_id)
+    return jsonify(s.state(request.args.get("after", 0, type=int)))
\ No newline at end of file
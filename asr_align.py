@@ -1,38 +1,23 @@
-import re
 import time
 from difflib import SequenceMatcher
-from faster_whisper import WhisperModel
+from flask import current_app
 
-# ✅ إضافة: استيراد db و QuranAyah
+# ✅ إضافة: استيراد create_app و QuranIndex (المرجع محمّل مرة وحدة)
 from app import create_app
-from app.models import QuranAyah
-
-# 1) Normalize (توحيد النص)
-AR_DIACRITICS = re.compile(r"[\u0617-\u061A\u064B-\u0652\u0670\u0640]")  # تشكيل + تطويل
-PUNCT = re.compile(r"[^\w\s\u0600-\u06FF]")  # يحذف علامات الترقيم (يبقي العربي/الأرقام/underscore)
+from app.arabic import LENIENT, text_tokens
+from app.quran_index import get_quran_index
+from app.asr_client import get_asr
 
+# 1) Normalize (توحيد النص): profile lenient (ى→ي، ة→ه، ؤ→و، ئ→ي) + حذف غير العربي
 def normalize_ar(text: str) -> str:
-    text = (text or "").strip()
-    text = AR_DIACRITICS.sub("", text)
-    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    text = text.replace("ى", "ي").replace("ة", "ه")  # اختياري: يساعد أحياناً
-    text = text.replace("ؤ", "و").replace("ئ", "ي")  # اختياري
-    text = PUNCT.sub(" ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return " ".join(text_tokens(text, LENIENT))
 
 def similarity(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
 # ✅ بدال SURAH_ALFATIHA: نجيب آيات السورة من DB
 def get_surah_verses_from_db(surah_id: int) -> list[str]:
-    rows = (
-        QuranAyah.query
-        .filter_by(surahid=surah_id)
-        .order_by(QuranAyah.ayahnumber.asc())
-        .all()
-    )
-    return [r.ayahtext for r in rows]
+    return [text for _, text in get_quran_index().surah_ayat(surah_id)]
 
 def best_match(segment_text: str, verses: list[str]):
     seg_n = normalize_ar(segment_text)
@@ -53,7 +38,7 @@ def main():
     surah_id = 1
 
     print("Loading model...")
-    model = WhisperModel(model_name, device=device, compute_type=compute_type)
+    model = get_asr(current_app.config["ASR_SOCKET"], model_name, device=device, compute_type=compute_type)
 
     t0 = time.time()
     segments, info = model.transcribe(
@@ -1,230 +1,50 @@
 import time
-import wave
-import contextlib
-import subprocess
-import tempfile
-import os
 import re
-
-from faster_whisper import WhisperModel
-from rapidfuzz import fuzz
+from types import SimpleNamespace
 
 # ✅ عدّلي الاستيراد حسب مشروعكم (لازم DB تكون جاهزة)
 from app import create_app
-from app.models import QuranAyah  # QuranAyah: surahid, ayahnumber, ayahtext
+from app.quran_index import get_quran_index
+from app.arabic import normalize_tokens, text_tokens
+from app.alignment import levenshtein_ops, edit_distance
+from app.asr_client import AsrClient, get_asr
+from app.audio import load_pcm, pcm_duration
+from app.recheck import Candidate, audio_recheck
+from app.gap_repair import find_gaps, repair_gaps
+from app.probe import probe_surah
+from app.chunked_asr import transcribe_parallel
 
 
 # ----------------------------
 # Settings
 # ----------------------------
 VAD_THRESHOLD = 90               # ثواني: أقل من كذا -> VAD OFF غالبًا أفضل
-SURAH_CANDIDATES = range(1, 115) # 1..114
-DETECT_SAMPLE_WORDS = 45         # من نص Whisper (أول كم كلمة) للاكتشاف
-DETECT_DB_PREFIX_WORDS = 80      # أول كم كلمة من كل سورة في DB للمقارنة
+PARALLEL_WORKERS = 1             # >1: chunks عند السكتات تتفرغ بالتوازي (للسور الطويلة)
 
 MAX_EDIT_DISTANCE = 2            # نصحح أخطاء بسيطة فقط
-AUDIO_MARGIN = 10                # لازم expected يفوز بفارق واضح عشان نصحح
-CLIP_LEFT = 1.0                  # ثواني قبل الكلمة
-CLIP_RIGHT = 1.5                 # ثواني بعد الكلمة
 
 MAX_WORDS_PER_LINE = 10          # عشان ما تطلع جملة طويلة جدًا
 
 
 # ----------------------------
-# Normalization (DB + Whisper)
-# ----------------------------
-AR_DIACRITICS = re.compile(r"[\u0617-\u061A\u064B-\u0652\u0670\u0640]")
-
-def normalize_ar(text: str) -> str:
-    text = (text or "").strip()
-    text = AR_DIACRITICS.sub("", text)  # إزالة التشكيل + التطويل
-    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-def tokenize(text: str):
-    text = re.sub(r"[^\u0600-\u06FF\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return [w for w in text.split(" ") if w]
-
-
-# ----------------------------
-# Audio duration
-# ----------------------------
-def get_audio_duration(path: str) -> float:
-    # WAV
-    try:
-        with contextlib.closing(wave.open(path, "rb")) as wf:
-            return wf.getnframes() / float(wf.getframerate())
-    except Exception:
-        pass
-
-    # ffprobe لأي صيغة ثانية
-    try:
-        out = subprocess.check_output(
-            [
-                "ffprobe", "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                path
-            ],
-            text=True
-        ).strip()
-        return float(out)
-    except Exception:
-        return 0.0
-
-
-# ----------------------------
-# ffmpeg cut (clip)
-# ----------------------------
-def cut_audio(in_path, start_s, end_s, out_wav):
-    cmd = [
-        "ffmpeg", "-y", "-i", in_path,
-        "-ss", str(max(0, start_s)), "-to", str(max(0, end_s)),
-        "-ar", "16000", "-ac", "1",
-        out_wav
-    ]
-    subprocess.check_output(cmd, stderr=subprocess.STDOUT, text=True)
-
-
-# ----------------------------
-# DB helpers
+# Reference helpers (من QuranIndex المشترك - بدون DB round trips)
 # ----------------------------
 def get_surah_ayat_from_db(surah_no: int):
-    ayat = (
-        QuranAyah.query
-        .filter(QuranAyah.surahid == surah_no)
-        .order_by(QuranAyah.ayahnumber.asc())
-        .all()
-    )
-    return [(a.ayahnumber, (a.ayahtext or "").strip()) for a in ayat if (a.ayahtext or "").strip()]
+    return get_quran_index().surah_ayat(surah_no)
 
-def get_surah_words_from_db(surah_no: int):
-    ayat = get_surah_ayat_from_db(surah_no)
-    if not ayat:
-        return []
-    full = " ".join([t for _, t in ayat])
-    return tokenize(normalize_ar(full))
+def get_surah_words_from_db(surah_no: int, start_ayah=None):
+    return get_quran_index().surah_words(surah_no, start_ayah)
 
 def detect_surah_from_text(app, hyp_text: str):
-    hyp_tokens = tokenize(normalize_ar(hyp_text))
-    sample = " ".join(hyp_tokens[:DETECT_SAMPLE_WORDS])
-    if not sample:
-        return None, 0.0
-
-    best_surah = None
-    best_score = -1.0
-
+    """
+    n-gram voting على المصحف كامل (QuranIndex.locate) بدل مقارنة أول 45 كلمة
+    مع أول 80 كلمة من كل سورة -> يشتغل حتى لو القارئ بدأ من نص السورة.
+    يرجع Detection(surahid, startayah, endayah, score) أو None.
+    """
+    hyp_tokens = text_tokens(hyp_text)
     with app.app_context():
-        for s in SURAH_CANDIDATES:
-            ref_words = get_surah_words_from_db(s)
-            if not ref_words:
-                continue
-            ref_prefix = " ".join(ref_words[:DETECT_DB_PREFIX_WORDS])
-            score = fuzz.token_set_ratio(sample, ref_prefix)
-            if score > best_score:
-                best_score = score
-                best_surah = s
-
-    return best_surah, float(best_score)
-
-
-# ----------------------------
-# Alignment (word-level Levenshtein ops)
-# ----------------------------
-def levenshtein_ops(ref_words, hyp_words):
-    n, m = len(ref_words), len(hyp_words)
-    dp = [[0]*(m+1) for _ in range(n+1)]
-    bt = [[None]*(m+1) for _ in range(n+1)]
-
-    for i in range(1, n+1):
-        dp[i][0] = i
-        bt[i][0] = ("delete", i-1, None)
-    for j in range(1, m+1):
-        dp[0][j] = j
-        bt[0][j] = ("insert", None, j-1)
-
-    for i in range(1, n+1):
-        for j in range(1, m+1):
-            if ref_words[i-1] == hyp_words[j-1]:
-                dp[i][j] = dp[i-1][j-1]
-                bt[i][j] = ("equal", i-1, j-1)
-            else:
-                choices = [
-                    (dp[i-1][j] + 1, ("delete", i-1, None)),
-                    (dp[i][j-1] + 1, ("insert", None, j-1)),
-                    (dp[i-1][j-1] + 1, ("replace", i-1, j-1)),
-                ]
-                dp[i][j], bt[i][j] = min(choices, key=lambda x: x[0])
-
-    ops = []
-    i, j = n, m
-    while i > 0 or j > 0:
-        kind, ri, hj = bt[i][j]
-        ops.append((kind, ri, hj))
-        if kind in ("equal", "replace"):
-            i -= 1; j -= 1
-        elif kind == "delete":
-            i -= 1
-        else:
-            j -= 1
-    ops.reverse()
-    return ops
-
-def edit_distance(a: str, b: str) -> int:
-    a, b = a or "", b or ""
-    n, m = len(a), len(b)
-    dp = list(range(m+1))
-    for i in range(1, n+1):
-        prev = dp[0]
-        dp[0] = i
-        for j in range(1, m+1):
-            cur = dp[j]
-            cost = 0 if a[i-1] == b[j-1] else 1
-            dp[j] = min(dp[j] + 1, dp[j-1] + 1, prev + cost)
-            prev = cur
-    return dp[m]
-
-
-# ----------------------------
-# Audio check (محافظ) لمنع تغطية خطأ القارئ
-# ----------------------------
-def clip_text(model: WhisperModel, clip_path: str, prompt: str | None):
-    segs, _ = model.transcribe(
-        clip_path,
-        language="ar",
-        beam_size=8,
-        temperature=0.0,
-        best_of=1,
-        vad_filter=False,
-        condition_on_previous_text=False,
-        initial_prompt=prompt
-    )
-    txt = " ".join([s.text.strip() for s in segs]).strip()
-    return normalize_ar(txt)
-
-def should_fix_by_audio(model, audio_path, t, actual, expected, context_prompt):
-    start_s = t - CLIP_LEFT
-    end_s   = t + CLIP_RIGHT
-
-    with tempfile.TemporaryDirectory() as td:
-        clip = os.path.join(td, "clip.wav")
-        cut_audio(audio_path, start_s, end_s, clip)
-
-        neutral = clip_text(model, clip, prompt=None)
-        guided  = clip_text(model, clip, prompt=context_prompt)
-
-        actual_n = normalize_ar(actual)
-        expected_n = normalize_ar(expected)
-
-        n_exp = fuzz.token_set_ratio(neutral, expected_n)
-        n_act = fuzz.token_set_ratio(neutral, actual_n)
-
-        g_exp = fuzz.token_set_ratio(guided, expected_n)
-        g_act = fuzz.token_set_ratio(guided, actual_n)
-
-        return (n_exp - n_act >= AUDIO_MARGIN) and (g_exp - g_act >= AUDIO_MARGIN)
+        index = get_quran_index()
+    return index.locate(hyp_tokens)
 
 
 # ----------------------------
@@ -268,32 +88,30 @@ def print_segment_words(s):
         print(f"[{cs:.2f} - {ce:.2f}] {' '.join(chunk)}")
 
 
-def transcribe_tail(model, audio_path, tail_seconds=80):
-    dur = get_audio_duration(audio_path)
-    start = max(0.0, dur - tail_seconds)
-
-    with tempfile.TemporaryDirectory() as td:
-        tail_wav = os.path.join(td, "tail.wav")
-        cut_audio(audio_path, start, dur, tail_wav)
-
-        tail_kwargs = dict(
-            language="ar",
-            beam_size=10,
-            temperature=0.0,
-            best_of=1,
-            condition_on_previous_text=False,
-            word_timestamps=False,      # ✅ كان True
-            vad_filter=False,           # مهم: لا VAD في النهاية
-            chunk_length=30,
-            no_speech_threshold=0.0,    # ✅ كان 0.05
-            log_prob_threshold=-1.0,    # ✅ جديد (لتقليل إسقاط النهاية)
-            compression_ratio_threshold=2.4,  # ✅ جديد
-            initial_prompt="تلاوة قرآن كريم باللغة العربية الفصحى، أكمل التلاوة حتى النهاية بدون اختصار.",
-        )
+def segment_words(segments):
+    words = []
+    for s in segments:
+        if getattr(s, "words", None):
+            for w in s.words:
+                ww = (w.word or "").strip()
+                if ww:
+                    words.append(w)
+    return words
+
+
+def splice_repaired(segments, words):
+    """الكلمات اللي رجعت من gap repair -> segments جديدة في مكانها بالوقت (مع أوقاتها)."""
+    new, run = [], []
+    for w in words + [None]:
+        if w is not None and w.get("repaired"):
+            run.append(SimpleNamespace(word=" " + w["word"], start=w["start"], end=w["end"], probability=None))
+            continue
+        if run:
+            text = " ".join(x.word.strip() for x in run)
+            new.append(SimpleNamespace(start=run[0].start, end=run[-1].end, text=text, words=run))
+            run = []
+    return sorted(segments + new, key=lambda seg: seg.start)
 
-        tail_segments, _ = model.transcribe(tail_wav, **tail_kwargs)
-        tail_segments = list(tail_segments)
-        return " ".join([s.text.strip() for s in tail_segments]).strip()
 
 # ----------------------------
 # Main: RAW / CLEAN (بدون طباعة DB)
@@ -302,9 +120,12 @@ def main():
     audio_path = "downloads/N.wav"  # ✅ غيري الملف هنا فقط
 
     app = create_app()
-    model = WhisperModel("medium", device="cpu", compute_type="int8")
+    # ✅ لو asr_worker شغال نستخدم موديله الدافي، وإلا نحمّل محلي
+    model = get_asr(app.config["ASR_SOCKET"], "medium", device="cpu", compute_type="int8")
 
-    duration = get_audio_duration(audio_path)
+    # ✅ نفك الصوت مرة وحدة (float32 16kHz) وكل الـ clips بعدين slices منه
+    pcm = load_pcm(audio_path)
+    duration = pcm_duration(pcm)
     use_vad = (duration > VAD_THRESHOLD)
 
     # ✅ أهم تعديل: نخلي condition_on_previous_text=False (أثبت للقرآن)
@@ -338,49 +159,81 @@ def main():
         kwargs.update(dict(vad_filter=False))
         print(f"[INFO] duration={duration:.2f}s -> VAD=OFF")
 
+    # (0) probe: أول ثواني (beam 1) -> السورة + آية البداية (احتياط لو التحديد من النص كامل فشل)
+    # مثل pipeline.py: بس للـ decode الواحد ولو ASR_PROBE شغال (مع parallel = decode زيادة على الفاضي)
+    probe = None
+    if app.config["ASR_PROBE"] and PARALLEL_WORKERS <= 1:
+        with app.app_context():
+            index = get_quran_index()
+        probe = probe_surah(model, pcm, index, duration)
+        if probe.confident:
+            print(f"[PROBE] surah_id={probe.detection.surahid}  ayah={probe.detection.startayah}  "
+                  f"score={probe.detection.score:.2f}  ({probe.audio_seconds:.0f}s)")
+        else:
+            print("[PROBE] ambiguous -> full-text detection")
+
     # (1) Whisper RAW
     t0 = time.time()
-    segments, _ = model.transcribe(audio_path, **kwargs)
+    if PARALLEL_WORKERS > 1:
+        segments, info = transcribe_parallel(
+            pcm, kwargs, PARALLEL_WORKERS,
+            asr=model if isinstance(model, AsrClient) else None,
+        )
+        print(f"[INFO] parallel: chunks={info.chunks} workers={info.workers}")
+    else:
+        segments, _ = model.transcribe(pcm, **kwargs)
     segments = list(segments)
     transcribe_time = round(time.time() - t0, 2)
 
     raw_text = " ".join([s.text.strip() for s in segments]).strip()
 
     # (2) Detect surah automatically
-    detected_surah, score = detect_surah_from_text(app, raw_text)
-    if not detected_surah:
+    detection = detect_surah_from_text(app, raw_text)
+    if not detection and probe and probe.confident:
+        detection = probe.detection
+    if not detection:
         print("\n[DETECT] Could not detect surah.")
         return
 
-    probe = " ".join(tokenize(normalize_ar(raw_text))[:80])
-    print(f"\n[DETECT] surah_id={detected_surah}  score={score:.2f}")
-    print(f"[DETECT] probe_text: {probe}\n")
+    probe_text = " ".join(text_tokens(raw_text)[:80])
+    detected_surah = detection.surahid
+    print(f"\n[DETECT] surah_id={detected_surah}  ayat={detection.startayah}-{detection.endayah}  score={detection.score:.2f}")
+    print(f"[DETECT] probe_text: {probe_text}\n")
 
     # (3) DB reference words (normalized) — نستخدمها للتصحيح فقط بدون طباعة
     with app.app_context():
-        ref_words = get_surah_words_from_db(detected_surah)
+        # من آية البداية لآخر السورة (gap repair يلقى النهاية الناقصة)
+        ref_words = get_surah_words_from_db(detected_surah, detection.startayah)
 
     if not ref_words:
         print("[WARN] DB reference not found for detected surah.")
         return
 
     # (4) Build hyp_words + hyp_times من Whisper words
-    whisper_word_objs = []
-    for s in segments:
-        if getattr(s, "words", None):
-            for w in s.words:
-                ww = (w.word or "").strip()
-                if ww:
-                    whisper_word_objs.append(w)
+    whisper_word_objs = segment_words(segments)
 
     if not whisper_word_objs:
         print("[WARN] word_timestamps ما طلعت كلمات.")
         return
 
+    # (4b) فجوات (كلمات مرجع ما انفكت، حتى آخر السورة): نعيد فك ثوانيها بس ونلصقها بأوقاتها
+    words = [
+        {"word": (w.word or "").strip(), "start": float(w.start or 0.0), "end": float(w.end or w.start or 0.0)}
+        for w in whisper_word_objs
+    ]
+    gaps = find_gaps(ref_words, words, pcm)
+    if gaps:
+        print(f"[GAPS] {len(gaps)} gap(s): " + ", ".join(f"{g.start:.1f}-{g.end:.1f}s" for g in gaps))
+        words, added = repair_gaps(model, pcm, gaps, words, ref_words)
+        print(f"[GAPS] re-decoded -> +{added} words")
+        if added:
+            segments = splice_repaired(segments, words)
+            whisper_word_objs = segment_words(segments)
+
     hyp_words = []
     hyp_times = []
-    for w in whisper_word_objs:
-        toks = tokenize(normalize_ar((w.word or "").strip()))
+    word_toks = normalize_tokens([w.word for w in whisper_word_objs])
+    for w, toks in zip(whisper_word_objs, word_toks):
         for tok in toks:
             hyp_words.append(tok)
             hyp_times.append(float(w.start) if w.start is not None else 0.0)
@@ -390,6 +243,7 @@ def main():
 
     token_fix_map = {}  # hyp_token_index -> corrected token
     fixes = []
+    candidates = []
 
     for kind, ri, hj in ops:
         if kind != "replace" or ri is None or hj is None:
@@ -408,17 +262,18 @@ def main():
         left = ref_words[max(0, ri-2):ri]
         right = ref_words[ri+1:ri+3]
         prompt_context = " ".join(["تلاوة قرآن:", *left, expected, *right])
+        candidates.append(Candidate(hj, ri, t, actual, expected, prompt_context))
 
-        if should_fix_by_audio(model, audio_path, t, actual, expected, prompt_context):
-            token_fix_map[hj] = expected
-            fixes.append((t, actual, expected))
+    # ✅ فحص صوتي batched: النوافذ المتداخلة تندمج، والـ guided فقط للي يحتاجه
+    approved, recheck_stats = audio_recheck(model, pcm, candidates)
+    for c in candidates:
+        if c.hyp_index in approved:
+            token_fix_map[c.hyp_index] = c.expected
+            fixes.append((c.time, c.actual, c.expected))
 
     # (6) Apply fixes داخل segments
     token_idx = 0
-    for w in whisper_word_objs:
-        raw = (w.word or "").strip()
-        toks = tokenize(normalize_ar(raw))
-
+    for w, toks in zip(whisper_word_objs, word_toks):
         if len(toks) != 1:
             token_idx += len(toks)
             continue
@@ -430,6 +285,7 @@ def main():
 
     # -------- Outputs --------
     print("TRANSCRIBE_TIME:", transcribe_time)
+    print("AUDIO_RECHECK:", recheck_stats)
     print("-" * 50)
     print("[WHISPER RAW]")
     print(raw_text)
@@ -445,18 +301,6 @@ def main():
     ])
     clean_text = re.sub(r"\s+", " ", clean_text).strip()
 
-    with app.app_context():
-        ayat = get_surah_ayat_from_db(detected_surah)
-    last_ayah_text = ayat[-1][1] if ayat else ""
-    last_probe = " ".join(tokenize(normalize_ar(last_ayah_text))[-6:])
-
-    clean_norm = normalize_ar(clean_text)
-    if last_probe and last_probe not in clean_norm:
-        print("[TAIL] Last ayah missing -> running rescue...")
-        tail_text = transcribe_tail(model, audio_path, tail_seconds=120)  # ✅ كان 80
-        tail_text = re.sub(r"\s+", " ", tail_text).strip()
-        clean_text = (clean_text + " " + tail_text).strip()
-
     print("\n" + "-" * 50)
     print("[WHISPER CLEAN - FULL]")
     print(clean_text)
@@ -1,9 +1,12 @@
-import time, json, re, wave, contextlib, subprocess
-from faster_whisper import WhisperModel
+import time, json, wave, contextlib, subprocess
 
 # ✅ غيّري الاستيراد حسب مشروعكم (أهم سطرين)
-from app import create_app, db
-from app.models import QuranAyah
+from app import create_app
+from app.quran_index import get_quran_index
+from app.arabic import text_tokens
+from app.alignment import build_report
+from app.asr_client import get_asr
+from app.forced_align import transcribe_forced
 
 
 # ----------------------------
@@ -28,207 +31,23 @@ def get_audio_duration(path: str) -> float:
 
 
 # ----------------------------
-# Normalization (خفيف - لا نخفي أخطاء مثل طغى/طغ)
-# ----------------------------
-AR_DIACRITICS = re.compile(r"[\u0617-\u061A\u064B-\u0652\u0670\u0640]")
-
-def normalize_ar(text: str) -> str:
-    text = (text or "").strip()
-    text = AR_DIACRITICS.sub("", text)  # إزالة التشكيل + التطويل
-    # توحيد الهمزات فقط
-    text = text.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-    # لا نحول ى→ي ولا ة→ه حتى لا نضيع أخطاء حقيقية
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-def tokenize(text: str):
-    # إبقاء العربية + مسافات فقط
-    text = re.sub(r"[^\u0600-\u06FF\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return [w for w in text.split(" ") if w]
-
-
-# ----------------------------
-# Levenshtein ops (word-level)
-# ----------------------------
-def levenshtein_ops(ref_words, hyp_words):
-    n, m = len(ref_words), len(hyp_words)
-    dp = [[0]*(m+1) for _ in range(n+1)]
-    bt = [[None]*(m+1) for _ in range(n+1)]
-
-    for i in range(1, n+1):
-        dp[i][0] = i
-        bt[i][0] = ("delete", i-1, None)
-    for j in range(1, m+1):
-        dp[0][j] = j
-        bt[0][j] = ("insert", None, j-1)
-
-    for i in range(1, n+1):
-        for j in range(1, m+1):
-            if ref_words[i-1] == hyp_words[j-1]:
-                dp[i][j] = dp[i-1][j-1]
-                bt[i][j] = ("equal", i-1, j-1)
-            else:
-                choices = [
-                    (dp[i-1][j] + 1, ("delete", i-1, None)),
-                    (dp[i][j-1] + 1, ("insert", None, j-1)),
-                    (dp[i-1][j-1] + 1, ("replace", i-1, j-1)),
-                ]
-                dp[i][j], bt[i][j] = min(choices, key=lambda x: x[0])
-
-    ops = []
-    i, j = n, m
-    while i > 0 or j > 0:
-        kind, ri, hj = bt[i][j]
-        ops.append((kind, ri, hj))
-        if kind in ("equal", "replace"):
-            i -= 1
-            j -= 1
-        elif kind == "delete":
-            i -= 1
-        else:  # insert
-            j -= 1
-    ops.reverse()
-    return ops
-
-
-# ----------------------------
-# ✅ DB: جلب الآيات من قاعدة البيانات (مضبوط على موديلكم)
-# QuranAyah: surahid, ayahnumber, ayahtext
+# ✅ المرجع: من QuranIndex المشترك (يتبنى مرة وحدة من quran_ayah)
 # ----------------------------
 def get_surah_ayat_from_db(surah_no: int):
-    ayat = (
-        QuranAyah.query
-        .filter(QuranAyah.surahid == surah_no)
-        .order_by(QuranAyah.ayahnumber.asc())
-        .all()
-    )
+    ayat = get_quran_index().surah_ayat(surah_no)
     if not ayat:
         raise ValueError(f"No ayat found in DB for surah={surah_no}")
     return ayat
 
 
-def build_ref_word_to_ayah_map(ayat):
+def build_ref_word_to_ayah_map(surah_no: int):
     """
     يرجّع:
       ref_tokens: كل كلمات السورة (مقسمة word-level)
       ref_to_ayah: نفس الطول، كل كلمة معها رقم الآية
     """
-    ref_tokens = []
-    ref_to_ayah = []
-
-    for a in ayat:
-        toks = tokenize(normalize_ar(a.ayahtext))
-        for t in toks:
-            ref_tokens.append(t)
-            ref_to_ayah.append(int(a.ayahnumber))
-
-    return ref_tokens, ref_to_ayah
-
-
-# ----------------------------
-# Build report (with ayah_number + indexes)
-# ----------------------------
-def build_report(ref_tokens, ref_to_ayah, whisper_words_with_time):
-    # hypothesis tokens + times (متوافقة مع normalize/tokenize)
-    hyp_tokens = []
-    hyp_times = []
-
-    for w in whisper_words_with_time:
-        nw = normalize_ar(w["word"])
-        toks = tokenize(nw)
-        if not toks:
-            continue
-        for t in toks:
-            hyp_tokens.append(t)
-            hyp_times.append(w["start"])
-
-    ops = levenshtein_ops(ref_tokens, hyp_tokens)
-
-    def hyp_time(idx):
-        if idx is None:
-            return None
-        if idx < 0 or idx >= len(hyp_times):
-            return None
-        return hyp_times[idx]
-
-    def ayah_of_ref(ri):
-        if ri is None:
-            return None
-        if ri < 0 or ri >= len(ref_to_ayah):
-            return None
-        return ref_to_ayah[ri]
-
-    rows = []
-    correct = add = delete = sub = 0
-
-    for kind, ri, hj in ops:
-        if kind == "equal":
-            correct += 1
-            rows.append({
-                "status": "correct",
-                "type": None,
-                "expected": ref_tokens[ri],
-                "actual": hyp_tokens[hj],
-                "time": hyp_time(hj),
-                "ayah_number": ayah_of_ref(ri),
-                "ref_index": ri,
-                "hyp_index": hj
-            })
-
-        elif kind == "insert":
-            add += 1
-            # insertion ما لها آية مؤكدة، نخليها None
-            rows.append({
-                "status": "error",
-                "type": "addition",
-                "expected": None,
-                "actual": hyp_tokens[hj],
-                "time": hyp_time(hj),
-                "ayah_number": None,
-                "ref_index": ri,
-                "hyp_index": hj
-            })
-
-        elif kind == "delete":
-            delete += 1
-            # وقت الحذف: أقرب كلمة قبلها في hyp (إن وجدت)
-            anchor_time = hyp_time(hj-1) if hj is not None else None
-            rows.append({
-                "status": "error",
-                "type": "deletion",
-                "expected": ref_tokens[ri],
-                "actual": None,
-                "time": anchor_time,
-                "ayah_number": ayah_of_ref(ri),
-                "ref_index": ri,
-                "hyp_index": hj
-            })
-
-        elif kind == "replace":
-            sub += 1
-            rows.append({
-                "status": "error",
-                "type": "substitution",
-                "expected": ref_tokens[ri],
-                "actual": hyp_tokens[hj],
-                "time": hyp_time(hj),
-                "ayah_number": ayah_of_ref(ri),
-                "ref_index": ri,
-                "hyp_index": hj
-            })
-
-    return {
-        "summary": {
-            "total_words": len(ref_tokens),
-            "correct": correct,
-            "addition": add,
-            "deletion": delete,
-            "substitution": sub,
-            "is_valid": (add + delete + sub) == 0
-        },
-        "rows": rows
-    }
+    index = get_quran_index()
+    return index.surah_words(surah_no), index.surah_word_ayahs(surah_no)
 
 
 def main():
@@ -239,10 +58,11 @@ def main():
     app = create_app()
     with app.app_context():
         ayat = get_surah_ayat_from_db(surah_no)
-        reference_text = " ".join([(a.ayahtext or "").strip() for a in ayat]).strip()
-        ref_tokens, ref_to_ayah = build_ref_word_to_ayah_map(ayat)
+        reference_text = " ".join([t for _, t in ayat]).strip()
+        ref_tokens, ref_to_ayah = build_ref_word_to_ayah_map(surah_no)
 
-    model = WhisperModel("medium", device="cpu", compute_type="int8")
+    # ✅ لو asr_worker شغال نستخدم موديله الدافي، وإلا نحمّل محلي
+    model = get_asr(app.config["ASR_SOCKET"], "medium", device="cpu", compute_type="int8")
 
     duration = get_audio_duration(audio_path)
     use_vad = duration >= 120  # اتفقنا: الطويل فقط
@@ -267,16 +87,26 @@ def main():
         kwargs.update(dict(vad_filter=False))
         print(f"[INFO] duration={duration:.2f}s -> VAD=OFF")
 
+    # ✅ السورة معروفة + الـ worker فيه --ctc-model -> forced alignment (Whisper بس للي ما يطابق)
+    forced = getattr(model, "can_align", None) is not None and model.can_align()
+
     t0 = time.time()
-    segments, info = model.transcribe(audio_path, **kwargs)
-    segments = list(segments)
+    if forced:
+        with app.app_context():
+            index = get_quran_index()
+        whisper_words, info = transcribe_forced(model, audio_path, kwargs, index, surah_no, 1, duration)
+        segments = []
+        print(f"[FORCED] aligned={info.aligned}  regions={info.regions}  "
+              f"escalated={info.escalated_audio:.1f}s ({info.escalated_fraction:.0%})  full={info.full_fallback}")
+    else:
+        segments, info = model.transcribe(audio_path, **kwargs)
+        segments = list(segments)
+        whisper_words = []
     elapsed = round(time.time() - t0, 2)
 
     print("TRANSCRIBE_TIME:", elapsed)
     print("-" * 50)
 
-    whisper_words = []
-
     for s in segments:
         print(f"[{s.start:.2f} - {s.end:.2f}] {s.text.strip()}")
         if getattr(s, "words", None):
@@ -290,7 +120,7 @@ def main():
     # fallback لو ما طلعت words (نادر)
     if not whisper_words:
         for s in segments:
-            toks = tokenize(normalize_ar(s.text))
+            toks = text_tokens(s.text)
             if not toks:
                 continue
             seg_len = max(0.001, (s.end - s.start))
@@ -309,6 +139,7 @@ def main():
         "audio_path": audio_path,
         "duration": duration,
         "transcribe_time": elapsed,
+        "forced_alignment": forced,
         "reference_text_from_db": reference_text,
         "report": report,
     }